@@ -0,0 +1,239 @@
+# app/answer_cache.py
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import faiss
+import numpy as np
+
+from ocr_cache import hamming_distance
+from utils import clean_text
+
+logger = logging.getLogger(__name__)
+
+# Numbers and operators must match exactly: "x^2 - 5x + 6" and "x^2 - 5x + 7" embed almost identically
+_MATH_TOKENS = re.compile(r"\d+(?:[.,]\d+)?|[=<>+\-*/^√≤≥]")
+
+
+def math_signature(text: str) -> str:
+    return " ".join(_MATH_TOKENS.findall(clean_text(text)))
+
+
+def make_fingerprint(*parts: Any) -> str:
+    """
+    Hash of everything an answer depends on besides the question (prompt template,
+    model, decoding settings). Entries stored under another fingerprint are invalid.
+    """
+    return hashlib.sha1(json.dumps(parts, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+def _normalize(vector: np.ndarray) -> np.ndarray:
+    vector = np.asarray(vector, dtype="float32").reshape(1, -1).copy()
+    faiss.normalize_L2(vector)
+    return vector
+
+
+class AnswerCache:
+    """
+    Semantic cache of final answers, keyed by question embedding.
+
+    A lookup searches a small exact inner-product FAISS index over the cached question
+    embeddings and returns the best entry whose cosine similarity is at least
+    `threshold`, whose numbers/operators match the question, and whose image (if any)
+    is within `phash_threshold` bits of the query image. Entries expire after
+    `ttl_seconds`, the least recently used ones are evicted beyond `max_entries`, and
+    entries written under a different fingerprint are dropped.
+    """
+
+    def __init__(
+        self,
+        fingerprint: str,
+        threshold: float = 0.95,
+        max_entries: int = 10000,
+        ttl_seconds: float = 7 * 24 * 3600,
+        phash_threshold: int = 4,
+        disk_path: Optional[str] = None,
+        search_k: int = 8,
+    ):
+        """
+        Args:
+            fingerprint (str): make_fingerprint(...) of the prompt template and model configuration.
+            threshold (float): Minimum cosine similarity between question embeddings for a hit.
+            max_entries (int): LRU capacity.
+            ttl_seconds (float): Entry lifetime (0 disables expiry).
+            phash_threshold (int): Max Hamming distance between image perceptual hashes.
+            disk_path (str): Optional SQLite file so the cache survives restarts.
+            search_k (int): Candidates checked per lookup before giving up.
+        """
+        self.fingerprint = fingerprint
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.phash_threshold = phash_threshold
+        self.search_k = search_k
+
+        self._lock = threading.Lock()
+        self._index = None
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 0  # ids of memory-only caches; the disk tier's ids come from SQLite
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+        self._db = None
+        if disk_path:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS answer_cache ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, fingerprint TEXT NOT NULL, created REAL NOT NULL, "
+                "vector BLOB NOT NULL, entry TEXT NOT NULL)"
+            )
+            self._db.commit()
+            self._load()
+
+    def lookup(self, query_vec: np.ndarray, question: str, image_hash: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Find a cached answer for a question.
+
+        Args:
+            query_vec (np.ndarray): Embedding of the question.
+            question (str): The question text (its numbers/operators must match).
+            image_hash (int): Perceptual hash of the uploaded image, if any.
+
+        Returns:
+            Dict: The stored payload plus "similarity", or None on a miss.
+        """
+        query = _normalize(query_vec)
+        signature = math_signature(question)
+        with self._lock:
+            if self._index is not None and self._index.ntotal and query.shape[1] == self._index.d:
+                scores, ids = self._index.search(query, min(self.search_k, self._index.ntotal))
+                now = time.time()
+                for score, entry_id in zip(scores[0], ids[0]):
+                    if entry_id < 0 or score < self.threshold:
+                        break
+                    entry = self._entries.get(int(entry_id))
+                    if entry is None:
+                        continue
+                    if self.ttl_seconds and now - entry["created"] > self.ttl_seconds:
+                        self._remove([int(entry_id)])
+                        self._counters["expirations"] += 1
+                        continue
+                    if entry["signature"] != signature or not self._same_image(entry["image_hash"], image_hash):
+                        continue
+                    self._entries.move_to_end(int(entry_id))
+                    self._counters["hits"] += 1
+                    return dict(entry["payload"], similarity=float(score))
+
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, query_vec: np.ndarray, question: str, payload: Dict[str, Any], image_hash: Optional[int] = None):
+        """
+        Store the final result of a solve (answer plus whatever the response should replay).
+        """
+        query = _normalize(query_vec)
+        entry = {
+            "signature": math_signature(question),
+            "image_hash": image_hash,
+            "created": time.time(),
+            "payload": payload,
+        }
+        with self._lock:
+            if self._index is None:
+                self._index = faiss.IndexIDMap(faiss.IndexFlatIP(query.shape[1]))
+            elif query.shape[1] != self._index.d:
+                logger.warning(f"Answer cache got a {query.shape[1]}-d vector, index is {self._index.d}-d; skipping")
+                return
+            if self._db is not None:
+                # SQLite assigns the id: workers sharing the file would collide on a per-process counter
+                cursor = self._db.execute(
+                    "INSERT INTO answer_cache (fingerprint, created, vector, entry) VALUES (?, ?, ?, ?)",
+                    (self.fingerprint, entry["created"], query.tobytes(),
+                     json.dumps({k: v for k, v in entry.items() if k != "created"}, ensure_ascii=False)),
+                )
+                self._db.commit()
+                entry_id = cursor.lastrowid
+            else:
+                entry_id = self._next_id
+                self._next_id += 1
+            self._add(entry_id, query, entry)
+            while len(self._entries) > self.max_entries:
+                self._remove([next(iter(self._entries))])
+                self._counters["evictions"] += 1
+
+    def set_fingerprint(self, fingerprint: str):
+        """
+        Switch to a new template/model fingerprint, dropping every entry made under the old one.
+        """
+        with self._lock:
+            if fingerprint == self.fingerprint:
+                return
+            self._counters["invalidations"] += len(self._entries)
+            self._remove(list(self._entries))
+            self.fingerprint = fingerprint
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _same_image(self, cached: Optional[int], query: Optional[int]) -> bool:
+        if cached is None or query is None:
+            return cached is None and query is None
+        return hamming_distance(cached, query) <= self.phash_threshold
+
+    def _add(self, entry_id: int, vector: np.ndarray, entry: Dict[str, Any]):
+        self._index.add_with_ids(vector, np.array([entry_id], dtype="int64"))
+        self._entries[entry_id] = entry
+
+    def _remove(self, entry_ids: List[int]):
+        if not entry_ids:
+            return
+        self._index.remove_ids(np.asarray(entry_ids, dtype="int64"))
+        for entry_id in entry_ids:
+            self._entries.pop(entry_id, None)
+        if self._db is not None:
+            self._db.executemany("DELETE FROM answer_cache WHERE id = ?", [(i,) for i in entry_ids])
+            self._db.commit()
+
+    def _load(self):
+        """
+        Load persisted entries, dropping stale fingerprints and expired rows.
+        """
+        stale = self._db.execute("DELETE FROM answer_cache WHERE fingerprint != ?", (self.fingerprint,)).rowcount
+        if self.ttl_seconds:
+            self._db.execute("DELETE FROM answer_cache WHERE created < ?", (time.time() - self.ttl_seconds,))
+        self._db.commit()
+        self._counters["invalidations"] += max(stale, 0)
+
+        rows = self._db.execute(
+            "SELECT id, created, vector, entry FROM answer_cache ORDER BY id DESC LIMIT ?", (self.max_entries,)
+        ).fetchall()
+        for entry_id, created, blob, data in reversed(rows):
+            vector = np.frombuffer(blob, dtype="float32").reshape(1, -1)
+            if self._index is None:
+                self._index = faiss.IndexIDMap(faiss.IndexFlatIP(vector.shape[1]))
+            entry = json.loads(data)
+            entry["created"] = created
+            self._add(entry_id, vector, entry)
+        if rows:
+            # Rows beyond the LRU capacity are not loaded, drop them from disk too
+            self._db.execute("DELETE FROM answer_cache WHERE id < ?", (rows[-1][0],))
+            self._db.commit()
+        logger.info(f"Answer cache loaded {len(rows)} entries ({stale} invalidated) from the disk tier")
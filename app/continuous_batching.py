@@ -0,0 +1,369 @@
+# app/continuous_batching.py
+
+import logging
+import queue
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+KV = List[Tuple[torch.Tensor, torch.Tensor]]  # per layer: (keys, values) of shape [B, heads, T, head_dim]
+
+
+class SchedulerBusyError(RuntimeError):
+    """Raised when the generation queue stays full past the submit timeout."""
+
+
+def cache_to_kv(cache: Any) -> KV:
+    """
+    Read a HF key/value cache (legacy tuples or a Cache object) as per-layer tensors.
+    """
+    if isinstance(cache, (tuple, list)):
+        return [(k, v) for k, v in cache]
+    if hasattr(cache, "layers"):
+        return [(layer.keys, layer.values) for layer in cache.layers]
+    if hasattr(cache, "key_cache"):
+        return list(zip(cache.key_cache, cache.value_cache))
+    return [(k, v) for k, v in cache.to_legacy_cache()]
+
+
+def kv_to_cache(kv: KV) -> Any:
+    """
+    Wrap per-layer tensors in a DynamicCache the model can extend in place.
+    """
+    from transformers import DynamicCache
+
+    cache = DynamicCache()
+    for layer_idx, (k, v) in enumerate(kv):
+        cache.update(k, v, layer_idx)
+    return cache
+
+
+def _left_pad(kv: KV, mask: torch.Tensor, pad: int) -> Tuple[KV, torch.Tensor]:
+    if pad == 0:
+        return kv, mask
+    padded = []
+    for k, v in kv:
+        k_pad = k.new_zeros(k.shape[0], k.shape[1], pad, k.shape[3])
+        v_pad = v.new_zeros(v.shape[0], v.shape[1], pad, v.shape[3])
+        padded.append((torch.cat([k_pad, k], dim=2), torch.cat([v_pad, v], dim=2)))
+    return padded, torch.cat([mask.new_zeros(mask.shape[0], pad), mask], dim=1)
+
+
+class GenerationRequest:
+    """
+    Handle for one submitted generation: iterate it for token IDs as they are
+    produced, or call result() for the full list.
+    """
+
+    def __init__(
+        self,
+        input_ids: torch.Tensor,
+        max_tokens: int,
+        temperature: float,
+        past_key_values: Any = None,
+    ):
+        self.input_ids = input_ids  # [1, T]
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.past_key_values = past_key_values
+        self.tokens: List[int] = []
+        self.submitted_at = time.monotonic()
+        self.cancelled = False
+
+        self._events: "queue.Queue" = queue.Queue()
+        self._done = threading.Event()
+        self._error: Optional[BaseException] = None
+
+    def __iter__(self) -> Iterator[int]:
+        while True:
+            item = self._events.get()
+            if item is None:
+                if self._error is not None:
+                    raise self._error
+                return
+            yield item
+
+    def result(self, timeout: float = None) -> List[int]:
+        if not self._done.wait(timeout):
+            raise TimeoutError("Generation did not finish in time.")
+        if self._error is not None:
+            raise self._error
+        return list(self.tokens)
+
+    def cancel(self):
+        """
+        Stop generating for this request (its consumer went away); it leaves the batch at the next step.
+        """
+        self.cancelled = True
+
+    def _emit(self, token: int):
+        self.tokens.append(token)
+        self._events.put(token)
+
+    def _finish(self, error: BaseException = None):
+        self._error = error
+        self._done.set()
+        self._events.put(None)
+
+
+class ContinuousBatcher:
+    """
+    Token-level continuous batching for a HF causal LM.
+
+    One scheduler thread owns a shared decoding batch. Each step decodes one token for
+    every active request; finished requests leave the batch right away and queued ones
+    are prefilled and join it between steps, so a new request never waits for the
+    others to finish. Rows of different lengths are left-padded in the KV cache and
+    masked out, with explicit position IDs per row.
+    """
+
+    def __init__(
+        self,
+        model: Any,
+        eos_token_id: Optional[int],
+        max_batch_size: int = 8,
+        max_queue_size: int = 64,
+        device: Any = "cpu",
+        inference_context: Callable = nullcontext,
+        top_k: int = 0,
+        top_p: float = 1.0,
+    ):
+        """
+        Args:
+            model: HF causal LM (already in eval mode).
+            eos_token_id (int): Token that ends a request early.
+            max_batch_size (int): Maximum number of requests decoded together.
+            max_queue_size (int): Requests allowed to wait for a batch slot; beyond that submit() blocks.
+            device: Device the model runs on.
+            inference_context (Callable): Context manager factory entered on the scheduler thread
+                (grad mode / autocast are thread-local).
+            top_k (int): Sample only among the k most likely tokens (0 disables), as model.generate does.
+            top_p (float): Sample only from the smallest token set with this cumulative probability.
+        """
+        self.model = model
+        self.eos_token_id = eos_token_id
+        self.max_batch_size = max_batch_size
+        self.device = torch.device(device)
+        self.inference_context = inference_context
+        self.top_k = top_k
+        self.top_p = top_p
+
+        self._pending: "queue.Queue[GenerationRequest]" = queue.Queue(maxsize=max_queue_size)
+        self._active: List[GenerationRequest] = []
+        self._kv: Optional[KV] = None
+        self._mask: Optional[torch.Tensor] = None       # [B, T] 1 = real token, 0 = left padding
+        self._next_tokens: Optional[torch.Tensor] = None  # [B, 1] token to feed at the next step
+        self._positions: Optional[torch.Tensor] = None    # [B, 1] position ID of that token
+
+        self._stats = {"steps": 0, "tokens": 0, "rows_decoded": 0, "completed": 0, "failed": 0}
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="continuous-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(
+        self,
+        input_ids: torch.Tensor,
+        max_tokens: int,
+        temperature: float,
+        past_key_values: Any = None,
+        timeout: Optional[float] = None,
+    ) -> GenerationRequest:
+        """
+        Queue a prompt for generation.
+
+        Args:
+            input_ids (Tensor): Prompt token IDs of shape [1, T].
+            max_tokens (int): Maximum number of new tokens for this request.
+            temperature (float): Sampling temperature for this request (<= 0 means greedy).
+            past_key_values: Optional precomputed cache covering a prefix of input_ids.
+            timeout (float): How long to wait for a queue slot before raising SchedulerBusyError.
+
+        Returns:
+            GenerationRequest: Handle to stream or await the generated token IDs.
+        """
+        if self._stop.is_set():
+            raise RuntimeError("Continuous batcher is stopped.")
+        request = GenerationRequest(input_ids.to(self.device), max_tokens, temperature, past_key_values)
+        try:
+            self._pending.put(request, timeout=timeout)
+        except queue.Full:
+            raise SchedulerBusyError("Generation queue is full, try again later.") from None
+        self._wakeup.set()
+        return request
+
+    def stats(self) -> Dict[str, float]:
+        stats = dict(self._stats)
+        stats["active"] = len(self._active)
+        stats["queued"] = self._pending.qsize()
+        stats["mean_batch_size"] = stats["rows_decoded"] / stats["steps"] if stats["steps"] else 0.0
+        return stats
+
+    def close(self, timeout: float = None):
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        with self.inference_context():
+            while not self._stop.is_set():
+                self._admit()
+                if not self._active:
+                    self._wakeup.wait(0.05)
+                    self._wakeup.clear()
+                    continue
+                try:
+                    self._step()
+                except Exception as e:
+                    logger.error(f"Decoding step failed for {len(self._active)} requests: {e}")
+                    for request in self._active:
+                        request._finish(e)
+                    self._stats["failed"] += len(self._active)
+                    self._reset_batch()
+
+        for request in self._active:
+            request._finish(RuntimeError("Continuous batcher stopped."))
+        while not self._pending.empty():
+            self._pending.get_nowait()._finish(RuntimeError("Continuous batcher stopped."))
+
+    def _reset_batch(self):
+        self._active = []
+        self._kv = self._mask = self._next_tokens = self._positions = None
+
+    def _sample(self, logits: torch.Tensor, temperatures: List[float]) -> torch.Tensor:
+        """
+        Sample one token per row with that row's own temperature, filtered like transformers'
+        TopK / TopP logits warpers. logits: [B, vocab]
+        """
+        logits = logits.float()
+        tokens = logits.argmax(dim=-1)
+        temps = torch.tensor(temperatures, device=logits.device)
+        sampled_rows = (temps > 0).nonzero(as_tuple=True)[0]
+        if len(sampled_rows):
+            scores = logits[sampled_rows] / temps[sampled_rows, None]
+            if self.top_k and self.top_k < scores.shape[-1]:
+                kth = torch.topk(scores, self.top_k, dim=-1).values[:, -1:]
+                scores = scores.masked_fill(scores < kth, float("-inf"))
+            if self.top_p < 1.0:
+                sorted_scores, order = torch.sort(scores, dim=-1)
+                remove = sorted_scores.softmax(dim=-1).cumsum(dim=-1) <= 1 - self.top_p
+                remove[:, -1] = False  # the most likely token always stays
+                scores = scores.masked_fill(remove.scatter(1, order, remove), float("-inf"))
+            tokens[sampled_rows] = torch.multinomial(torch.softmax(scores, dim=-1), 1).squeeze(-1)
+        return tokens
+
+    def _is_finished(self, request: GenerationRequest, token: int) -> bool:
+        return request.cancelled or len(request.tokens) >= request.max_tokens or token == self.eos_token_id
+
+    def _admit(self):
+        while len(self._active) < self.max_batch_size:
+            try:
+                request = self._pending.get_nowait()
+            except queue.Empty:
+                return
+            if request.cancelled:
+                request._finish()
+                continue
+            try:
+                self._prefill(request)
+            except Exception as e:
+                logger.error(f"Prefill failed: {e}")
+                self._stats["failed"] += 1
+                request._finish(e)
+
+    def _prefill(self, request: GenerationRequest):
+        """
+        Run the prompt of one new request and merge its cache into the shared batch.
+        """
+        input_ids = request.input_ids
+        past = request.past_key_values
+        past_len = cache_to_kv(past)[0][0].shape[2] if past is not None else 0
+        outputs = self.model(
+            input_ids=input_ids[:, past_len:],
+            attention_mask=torch.ones_like(input_ids),
+            past_key_values=past,
+            use_cache=True,
+        )
+        token = int(self._sample(outputs.logits[:, -1, :], [request.temperature])[0])
+        request._emit(token)
+        self._stats["tokens"] += 1
+        if self._is_finished(request, token):
+            request._finish()
+            self._stats["completed"] += 1
+            return
+
+        kv = cache_to_kv(outputs.past_key_values)
+        mask = torch.ones_like(input_ids)
+        next_token = torch.tensor([[token]], device=self.device)
+        position = torch.tensor([[input_ids.shape[1]]], device=self.device)
+
+        if not self._active:
+            self._kv, self._mask, self._next_tokens, self._positions = kv, mask, next_token, position
+        else:
+            batch_len, new_len = self._mask.shape[1], mask.shape[1]
+            length = max(batch_len, new_len)
+            batch_kv, batch_mask = _left_pad(self._kv, self._mask, length - batch_len)
+            kv, mask = _left_pad(kv, mask, length - new_len)
+            self._kv = [
+                (torch.cat([bk, k], dim=0), torch.cat([bv, v], dim=0))
+                for (bk, bv), (k, v) in zip(batch_kv, kv)
+            ]
+            self._mask = torch.cat([batch_mask, mask], dim=0)
+            self._next_tokens = torch.cat([self._next_tokens, next_token], dim=0)
+            self._positions = torch.cat([self._positions, position], dim=0)
+        self._active.append(request)
+
+    def _step(self):
+        """
+        Decode one token for every active request, then drop the finished ones.
+        """
+        attention_mask = torch.cat([self._mask, self._mask.new_ones(self._mask.shape[0], 1)], dim=1)
+        outputs = self.model(
+            input_ids=self._next_tokens,
+            attention_mask=attention_mask,
+            position_ids=self._positions,
+            past_key_values=kv_to_cache(self._kv),
+            use_cache=True,
+        )
+        self._kv = cache_to_kv(outputs.past_key_values)
+        self._mask = attention_mask
+        tokens = self._sample(outputs.logits[:, -1, :], [r.temperature for r in self._active])
+
+        self._stats["steps"] += 1
+        self._stats["rows_decoded"] += len(self._active)
+        self._stats["tokens"] += len(self._active)
+
+        keep = []
+        for row, (request, token) in enumerate(zip(self._active, tokens.tolist())):
+            request._emit(token)
+            if self._is_finished(request, token):
+                request._finish()
+                self._stats["completed"] += 1
+            else:
+                keep.append(row)
+
+        if not keep:
+            self._reset_batch()
+            return
+
+        self._next_tokens = tokens.view(-1, 1)
+        self._positions = self._positions + 1
+        if len(keep) < len(self._active):
+            index = torch.tensor(keep, device=self.device)
+            self._active = [self._active[i] for i in keep]
+            self._kv = [(k.index_select(0, index), v.index_select(0, index)) for k, v in self._kv]
+            self._mask = self._mask.index_select(0, index)
+            self._next_tokens = self._next_tokens.index_select(0, index)
+            self._positions = self._positions.index_select(0, index)
+
+            # Drop left-padding columns no remaining row needs
+            real = self._mask.any(dim=0).nonzero(as_tuple=True)[0]
+            start = int(real[0]) if len(real) else 0
+            if start > 0:
+                self._kv = [(k[:, :, start:], v[:, :, start:]) for k, v in self._kv]
+                self._mask = self._mask[:, start:]
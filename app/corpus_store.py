@@ -0,0 +1,173 @@
+# app/corpus_store.py
+
+import json
+import logging
+import mmap
+import os
+import pickle
+from typing import Any, Dict, Iterator, List, Sequence, Union
+
+import numpy as np
+
+from utils import load_jsonl
+
+logger = logging.getLogger(__name__)
+
+RECORDS_FILE = "records.bin"
+OFFSETS_FILE = "offsets.npy"
+
+Record = Dict[str, Any]
+
+
+def _normalize(record: Union[str, Record]) -> Record:
+    # corpus.pkl holds plain strings, the JSONL database holds dicts with a "content" field
+    return {"content": record} if isinstance(record, str) else record
+
+
+class CorpusStore:
+    """
+    Read-only, memory-mapped example corpus.
+
+    On disk it is a directory with one contiguous UTF-8 blob of JSON records
+    (records.bin) and an array of n + 1 uint64 byte offsets (offsets.npy). Opening
+    it maps both files without parsing anything; record i is decoded only when
+    it is read, so a query only pays for its top_k rows and all worker processes
+    share the same page-cache pages.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): Directory written by CorpusStoreWriter.
+        """
+        self.path = path
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode="r")
+        self._file = open(os.path.join(path, RECORDS_FILE), "rb")
+        size = int(self.offsets[-1]) if len(self.offsets) else 0
+        # mmap cannot map an empty file
+        self._blob = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self) -> int:
+        return max(len(self.offsets) - 1, 0)
+
+    def __getitem__(self, idx: int) -> Record:
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f"Corpus row {idx} out of range (size {len(self)})")
+        start, end = int(self.offsets[idx]), int(self.offsets[idx + 1])
+        return json.loads(bytes(self._blob[start:end]).decode("utf-8"))
+
+    def __iter__(self) -> Iterator[Record]:
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def get_many(self, ids: Sequence[int]) -> List[Record]:
+        return [self[int(i)] for i in ids]
+
+    def close(self):
+        if isinstance(self._blob, mmap.mmap):
+            self._blob.close()
+        self._file.close()
+
+
+class CorpusStoreWriter:
+    """
+    Writes (or appends to) a CorpusStore directory.
+
+    Records are appended to records.bin as they are added; offsets.npy is rewritten
+    atomically on flush(), so readers never see rows whose bytes are not on disk yet.
+    """
+
+    def __init__(self, path: str, append: bool = False):
+        """
+        Args:
+            path (str): Target directory.
+            append (bool): Continue an existing store instead of starting a new one.
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        offsets_path = os.path.join(path, OFFSETS_FILE)
+        records_path = os.path.join(path, RECORDS_FILE)
+
+        if append and os.path.exists(offsets_path) and os.path.exists(records_path):
+            self._offsets = [int(x) for x in np.load(offsets_path)]
+            self._file = open(records_path, "r+b")
+        else:
+            self._offsets = [0]
+            self._file = open(records_path, "wb")
+        # Drop bytes past the last flushed offset (left by an interrupted writer)
+        self._file.truncate(self._offsets[-1])
+        self._file.seek(self._offsets[-1])
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def add(self, record: Union[str, Record]) -> int:
+        """
+        Append one record and return its row number.
+        """
+        data = json.dumps(_normalize(record), ensure_ascii=False).encode("utf-8")
+        self._file.write(data)
+        self._offsets.append(self._offsets[-1] + len(data))
+        return len(self._offsets) - 2
+
+    def add_many(self, records: Sequence[Union[str, Record]]) -> List[int]:
+        return [self.add(r) for r in records]
+
+    def truncate(self, n_rows: int):
+        """
+        Drop every row from n_rows on (used to roll back to a checkpoint).
+        """
+        del self._offsets[n_rows + 1:]
+        self._file.truncate(self._offsets[-1])
+        self._file.seek(self._offsets[-1])
+
+    def flush(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        tmp_path = os.path.join(self.path, OFFSETS_FILE + ".tmp.npy")
+        np.save(tmp_path, np.asarray(self._offsets, dtype=np.uint64))
+        os.replace(tmp_path, os.path.join(self.path, OFFSETS_FILE))
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+    def __enter__(self) -> "CorpusStoreWriter":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def convert_to_store(source_path: str, store_path: str) -> int:
+    """
+    Convert a JSONL database or a pickled list (corpus.pkl) into a CorpusStore.
+
+    Returns:
+        int: Number of records written.
+    """
+    if source_path.endswith(".pkl"):
+        with open(source_path, "rb") as f:
+            records = pickle.load(f)
+    else:
+        records = load_jsonl(source_path)
+
+    with CorpusStoreWriter(store_path) as writer:
+        writer.add_many(records)
+    logger.info(f"Converted {len(records)} records from {source_path} to {store_path}")
+    return len(records)
+
+
+def load_corpus(path: str) -> Sequence[Record]:
+    """
+    Open an example corpus in any supported format: a CorpusStore directory
+    (memory-mapped), a .jsonl file or a pickled list.
+    """
+    if os.path.isdir(path):
+        return CorpusStore(path)
+    if path.endswith(".pkl"):
+        with open(path, "rb") as f:
+            return [_normalize(r) for r in pickle.load(f)]
+    return [_normalize(r) for r in load_jsonl(path)]
@@ -0,0 +1,189 @@
+# app/embeddings/batcher.py
+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Dict, List, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingItem:
+    __slots__ = ("item", "future", "enqueued_at")
+
+    def __init__(self, item: Any):
+        self.item = item
+        self.future: Future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class MicroBatcher:
+    """
+    Cross-request micro-batching front-end for TextEncoder / ImageEncoder.
+
+    Callers submit single queries from any thread. A background worker collects
+    pending queries for up to `max_wait_ms` (or until `max_batch_size` are queued),
+    runs one `encoder.encode` call on the whole batch and hands each caller its own row.
+
+    The worker thread starts with the first query, so a batcher built in a pre-fork
+    launcher (scripts/serve.py) gets its thread in each worker process.
+    """
+
+    def __init__(
+        self,
+        encoder: Any,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        name: str = "encoder",
+    ):
+        """
+        Args:
+            encoder: Any object with an `encode(list) -> np.ndarray` method of shape (n, dim).
+            max_batch_size (int): Upper bound on rows per forward pass.
+            max_wait_ms (float): How long the oldest pending query may wait for company.
+            name (str): Label used for the worker thread and in logs.
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        if max_wait_ms < 0:
+            raise ValueError("max_wait_ms must be >= 0")
+
+        self.encoder = encoder
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+
+        self._queue: deque = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+        # Batch fill statistics
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._errors = 0
+        self._fill_histogram = [0] * (max_batch_size + 1)
+
+        self._worker = None
+
+    def __getattr__(self, attr: str) -> Any:
+        # Expose the wrapped encoder's attributes (model_name_or_path, device, ...)
+        if attr == "encoder":
+            raise AttributeError(attr)
+        return getattr(self.encoder, attr)
+
+    def submit(self, item: Any) -> Future:
+        """
+        Queue a single query and return a Future resolving to its embedding row.
+        """
+        pending = _PendingItem(item)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"{self.name} batcher is closed.")
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=f"{self.name}-batcher", daemon=True)
+                self._worker.start()
+            self._queue.append(pending)
+            self._cond.notify()
+        return pending.future
+
+    def encode(self, items: Union[Any, List[Any]]) -> np.ndarray:
+        """
+        Drop-in replacement for `encoder.encode`: blocks until every row is ready.
+
+        Args:
+            items: A single query or a list of queries (str for text, PIL.Image for images).
+
+        Returns:
+            np.ndarray: Embedding array with shape (n, dim)
+        """
+        if not isinstance(items, list):
+            items = [items]
+        futures = [self.submit(item) for item in items]
+        return np.vstack([f.result() for f in futures])
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report how full the executed batches were.
+
+        Returns:
+            Dict: batch/item counters, mean batch size, mean fill ratio,
+                  histogram of batch sizes and the current queue depth.
+        """
+        with self._stats_lock:
+            batches = self._batches
+            items = self._items
+            histogram = {size: count for size, count in enumerate(self._fill_histogram) if count}
+            errors = self._errors
+        mean_size = items / batches if batches else 0.0
+        return {
+            "name": self.name,
+            "batches": batches,
+            "items": items,
+            "errors": errors,
+            "mean_batch_size": mean_size,
+            "mean_fill_ratio": mean_size / self.max_batch_size,
+            "batch_size_histogram": histogram,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "queue_depth": len(self._queue),
+        }
+
+    def close(self, timeout: float = None):
+        """
+        Stop accepting queries, flush what is pending and join the worker thread.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
+
+    def _next_batch(self) -> List[_PendingItem]:
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if not self._queue:
+                return []
+
+            # The oldest query decides how long this batch may keep filling up
+            deadline = self._queue[0].enqueued_at + self.max_wait
+            while len(self._queue) < self.max_batch_size and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            size = min(len(self._queue), self.max_batch_size)
+            return [self._queue.popleft() for _ in range(size)]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            self._process(batch)
+
+    def _process(self, batch: List[_PendingItem]):
+        try:
+            embeddings = self.encoder.encode([p.item for p in batch])
+        except Exception as e:
+            logger.error(f"{self.name} batch of {len(batch)} failed: {e}")
+            with self._stats_lock:
+                self._errors += 1
+            for p in batch:
+                p.future.set_exception(e)
+            return
+
+        with self._stats_lock:
+            self._batches += 1
+            self._items += len(batch)
+            self._fill_histogram[len(batch)] += 1
+
+        for row, p in zip(embeddings, batch):
+            p.future.set_result(row)
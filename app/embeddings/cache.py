@@ -0,0 +1,208 @@
+# app/embeddings/cache.py
+
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from utils import clean_text
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    Memoization layer for query embeddings, keyed on `clean_text`-normalized input
+    plus the model name (so switching models never serves stale vectors).
+
+    Two tiers:
+        - a size-bounded in-memory LRU
+        - an optional on-disk store: float32 rows in one memory-mapped file plus an
+          SQLite key -> row index. SQLite's write lock serializes row allocation, so
+          every uvicorn worker on the host can share the same directory.
+    """
+
+    def __init__(self, model_name: str, max_entries: int = 10000, disk_dir: Optional[str] = None):
+        """
+        Args:
+            model_name (str): Encoder model name or path; part of every key.
+            max_entries (int): Capacity of the in-memory LRU tier.
+            disk_dir (str): Root directory of the shared on-disk tier (disabled if None).
+        """
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+        self.disk_dir = None
+        self._db = None
+        self._vectors_path = None
+        self._mmap = None
+        self._dim = None
+        if disk_dir:
+            # One sub-directory per model: different models may have different dimensions
+            slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name).strip("_")
+            self.disk_dir = os.path.join(disk_dir, slug)
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._vectors_path = os.path.join(self.disk_dir, "vectors.f32")
+            self._db = self._connect()
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS rows (key TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+            self._db.commit()
+            row = self._db.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+            if row is not None:
+                self._dim = int(row[0])
+
+    def key(self, text: str) -> str:
+        normalized = clean_text(text)
+        return hashlib.sha1(f"{self.model_name}\0{normalized}".encode("utf-8")).hexdigest()
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Look up cached embeddings; missing entries are returned as None.
+        """
+        keys = [self.key(t) for t in texts]
+        results: List[Optional[np.ndarray]] = [None] * len(keys)
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    results[i] = vector
+                    continue
+
+                vector = self._read_disk(key)
+                if vector is not None:
+                    self._counters["disk_hits"] += 1
+                    self._remember(key, vector)
+                    results[i] = vector
+                else:
+                    self._counters["misses"] += 1
+        return results
+
+    def put_many(self, texts: List[str], vectors: np.ndarray):
+        """
+        Store freshly computed embeddings (one row per text).
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        keys = [self.key(t) for t in texts]
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self._remember(key, vector)
+            if self._db is not None:
+                self._write_disk(keys, vectors)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_entries"] = len(self._memory)
+            if self._db is not None:
+                stats["disk_entries"] = self._db.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+        self._mmap = None
+
+    def reopen(self):
+        """
+        Open a fresh SQLite connection and lock after fork (scripts/serve.py workers);
+        the inherited ones belong to the launcher process.
+        """
+        self._lock = threading.Lock()
+        if self.disk_dir:
+            self._db = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(os.path.join(self.disk_dir, "index.sqlite"), timeout=30, check_same_thread=False)
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _rows_view(self, row: int) -> Optional[np.ndarray]:
+        """
+        Memory-mapped (n_rows, dim) view of the vector file, remapped when other
+        workers have appended rows past the current mapping.
+        """
+        if self._mmap is None or row >= self._mmap.shape[0]:
+            row_bytes = self._dim * 4
+            n_rows = os.path.getsize(self._vectors_path) // row_bytes if os.path.exists(self._vectors_path) else 0
+            if row >= n_rows:
+                return None
+            self._mmap = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(n_rows, self._dim))
+        return self._mmap
+
+    def _read_disk(self, key: str) -> Optional[np.ndarray]:
+        if self._db is None:
+            return None
+        found = self._db.execute("SELECT row FROM rows WHERE key = ?", (key,)).fetchone()
+        if found is None:
+            return None
+        if self._dim is None:
+            self._dim = int(self._db.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()[0])
+        view = self._rows_view(found[0])
+        if view is None:
+            return None
+        return np.array(view[found[0]])
+
+    def _write_disk(self, keys: List[str], vectors: np.ndarray):
+        # BEGIN IMMEDIATE takes the database write lock, so concurrent workers
+        # allocate disjoint rows and never interleave writes to the vector file
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._db.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+            if row is None:
+                self._db.execute("INSERT INTO meta (name, value) VALUES ('dim', ?)", (str(vectors.shape[1]),))
+            elif int(row[0]) != vectors.shape[1]:
+                raise ValueError(f"Embedding dim {vectors.shape[1]} does not match cache dim {row[0]}")
+            self._dim = vectors.shape[1]
+
+            next_row = self._db.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM rows").fetchone()[0]
+            new_keys, new_vectors = [], []
+            for key, vector in zip(keys, vectors):
+                exists = self._db.execute("SELECT 1 FROM rows WHERE key = ?", (key,)).fetchone()
+                if exists is None and key not in new_keys:
+                    new_keys.append(key)
+                    new_vectors.append(vector)
+
+            if new_keys:
+                # Vectors are written (and flushed) before their keys become visible
+                self._append_rows(next_row, np.ascontiguousarray(new_vectors, dtype=np.float32))
+                self._db.executemany(
+                    "INSERT INTO rows (key, row) VALUES (?, ?)",
+                    [(key, next_row + i) for i, key in enumerate(new_keys)],
+                )
+            self._db.commit()
+        except Exception:
+            self._db.rollback()
+            raise
+
+    def _append_rows(self, first_row: int, vectors: np.ndarray):
+        data = memoryview(vectors.tobytes())
+        offset = first_row * self._dim * 4
+        fd = os.open(self._vectors_path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0))
+        try:
+            # Drop any partial row left behind by an interrupted writer
+            os.ftruncate(fd, offset)
+            os.lseek(fd, offset, os.SEEK_SET)
+            while data:
+                written = os.write(fd, data)
+                data = data[written:]
+            os.fsync(fd)
+        finally:
+            os.close(fd)
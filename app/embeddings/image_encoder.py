@@ -1,28 +1,47 @@
 # app/embeddings/image_encoder.py
 
-import torch
 from PIL import Image
 from typing import Union, List
 import numpy as np
-from torchvision import transforms
 # from transformers import CLIPProcessor, CLIPModel
-from sentence_transformers import SentenceTransformer
+
+from embeddings.onnx_backend import ENCODER_BACKENDS, OnnxImageModel
 
 class ImageEncoder:
     """
     Wrapper for encoding images using a pretrained CLIP model.
     """
 
-    def __init__(self, model_name_or_path: str = "clip-ViT-B-32", device: str = 'cpu'):
+    def __init__(
+        self,
+        model_name_or_path: str = "clip-ViT-B-32",
+        device: str = 'cpu',
+        backend: str = "torch",
+        num_threads: int = None,
+    ):
         """
         Initialize the image encoder.
 
         Args:
-            model_name (str): HuggingFace model ID or local path to CLIP model.
+            model_name (str): HuggingFace model ID or local path to CLIP model; for the
+                ONNX backends, a directory written by scripts/export_onnx.py.
             device (str): "cuda" or "cpu". Automatically chosen if None.
+            backend (str): "torch", "onnx" or "onnx-int8" (ONNX Runtime on CPU).
+            num_threads (int): ONNX Runtime intra-op threads (default: all cores).
         """
-        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
-        self.model = SentenceTransformer(model_name_or_path, device=self.device)
+        if backend not in ENCODER_BACKENDS:
+            raise ValueError(f"Unsupported encoder backend: {backend} (expected one of {ENCODER_BACKENDS})")
+        self.backend = backend
+
+        if backend == "torch":
+            import torch
+            from sentence_transformers import SentenceTransformer
+
+            self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+            self.model = SentenceTransformer(model_name_or_path, device=self.device)
+        else:
+            self.device = "cpu"
+            self.model = OnnxImageModel(model_name_or_path, backend=backend, num_threads=num_threads)
 
     def encode(
         self,
@@ -42,7 +61,12 @@ class ImageEncoder:
         if isinstance(images, Image.Image):
             images = [images]
 
+        if self.backend != "torch":
+            return self.model.encode(images, convert_to_numpy=True, normalize_embeddings=normalize)
+
+        import torch
+
         with torch.no_grad():
-            image_features = self.encode(images, convert_to_numpy=True, normalize_embeddings=True)
+            image_features = self.model.encode(images, convert_to_numpy=True, normalize_embeddings=normalize)
 
         return image_features
\ No newline at end of file
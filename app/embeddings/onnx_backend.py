@@ -0,0 +1,321 @@
+# app/embeddings/onnx_backend.py
+
+import json
+import logging
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+ENCODER_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+ONNX_CONFIG_FILE = "onnx_config.json"
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model_int8.onnx"
+
+
+def mean_pooling(token_embeddings: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    """
+    Average of the token embeddings that are not padding (sentence-transformers "mean" pooling).
+    """
+    mask = attention_mask[..., None].astype(np.float32)
+    summed = (token_embeddings * mask).sum(axis=1)
+    return summed / np.clip(mask.sum(axis=1), 1e-9, None)
+
+
+def pool(token_embeddings: np.ndarray, attention_mask: np.ndarray, mode: str) -> np.ndarray:
+    if mode == "mean":
+        return mean_pooling(token_embeddings, attention_mask)
+    if mode == "cls":
+        return token_embeddings[:, 0]
+    if mode == "max":
+        masked = np.where(attention_mask[..., None] > 0, token_embeddings, -1e9)
+        return masked.max(axis=1)
+    raise ValueError(f"Unsupported pooling mode: {mode}")
+
+
+def l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.clip(norms, 1e-12, None)
+
+
+def clip_preprocess(images: List[Image.Image], config: Dict) -> np.ndarray:
+    """
+    CLIP image preprocessing without torch: resize the short side, center crop,
+    scale to [0, 1] and normalize per channel. Mirrors CLIPImageProcessor.
+
+    Returns:
+        np.ndarray: float32 pixel values of shape (n, 3, crop, crop)
+    """
+    size, crop = config["image_size"], config["crop_size"]
+    mean = np.asarray(config["image_mean"], dtype=np.float32).reshape(1, 1, 3)
+    std = np.asarray(config["image_std"], dtype=np.float32).reshape(1, 1, 3)
+
+    batch = []
+    for image in images:
+        image = image.convert("RGB")
+        width, height = image.size
+        short, long = (width, height) if width <= height else (height, width)
+        new_short, new_long = size, int(size * long / short)
+        new_size = (new_short, new_long) if width <= height else (new_long, new_short)
+        image = image.resize(new_size, Image.BICUBIC)
+
+        width, height = image.size
+        top, left = (height - crop) // 2, (width - crop) // 2
+        image = image.crop((left, top, left + crop, top + crop))
+
+        pixels = np.asarray(image, dtype=np.float32) / 255.0
+        batch.append(((pixels - mean) / std).transpose(2, 0, 1))
+    return np.stack(batch).astype(np.float32)
+
+
+def parity_report(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    """
+    Compare ONNX embeddings against the torch ones row by row.
+    """
+    reference = np.asarray(reference, dtype=np.float32)
+    candidate = np.asarray(candidate, dtype=np.float32)
+    if reference.shape != candidate.shape:
+        raise ValueError(f"Shape mismatch: {reference.shape} vs {candidate.shape}")
+    cosine = (l2_normalize(reference) * l2_normalize(candidate)).sum(axis=1)
+    return {
+        "max_abs_diff": float(np.abs(reference - candidate).max()),
+        "min_cosine": float(cosine.min()),
+        "mean_cosine": float(cosine.mean()),
+    }
+
+
+def _session(path: str, num_threads: Optional[int] = None):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if num_threads:
+        options.intra_op_num_threads = num_threads
+    return ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def _load_config(path: str) -> Dict:
+    with open(os.path.join(path, ONNX_CONFIG_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _model_file(path: str, backend: str) -> str:
+    if backend not in ("onnx", "onnx-int8"):
+        raise ValueError(f"Unsupported ONNX backend: {backend}")
+    model_file = os.path.join(path, QUANTIZED_MODEL_FILE if backend == "onnx-int8" else MODEL_FILE)
+    if not os.path.isfile(model_file):
+        raise FileNotFoundError(f"{model_file} not found; run scripts/export_onnx.py first")
+    return model_file
+
+
+class OnnxTextModel:
+    """
+    ONNX Runtime replacement for a sentence-transformers text model exported by
+    export_text_model. Exposes the same `encode` signature TextEncoder calls.
+    """
+
+    def __init__(self, path: str, backend: str = "onnx", num_threads: Optional[int] = None):
+        from transformers import AutoTokenizer
+
+        self.config = _load_config(path)
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        self.session = _session(_model_file(path, backend), num_threads)
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(
+        self,
+        texts: List[str],
+        batch_size: int = 32,
+        convert_to_numpy: bool = True,
+        normalize_embeddings: bool = False,
+    ) -> np.ndarray:
+        outputs = []
+        for start in range(0, len(texts), batch_size):
+            tokens = self.tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.config["max_seq_length"],
+                return_tensors="np",
+            )
+            feeds = {name: tokens[name].astype(np.int64) for name in self.input_names}
+            token_embeddings = self.session.run(None, feeds)[0]
+            outputs.append(pool(token_embeddings, tokens["attention_mask"], self.config["pooling"]))
+        embeddings = np.vstack(outputs).astype(np.float32)
+        return l2_normalize(embeddings) if normalize_embeddings else embeddings
+
+
+class OnnxImageModel:
+    """
+    ONNX Runtime replacement for the sentence-transformers CLIP image tower exported
+    by export_image_model. Preprocessing runs in NumPy, so torch is not needed.
+    """
+
+    def __init__(self, path: str, backend: str = "onnx", num_threads: Optional[int] = None):
+        self.config = _load_config(path)
+        self.session = _session(_model_file(path, backend), num_threads)
+
+    def encode(
+        self,
+        images: List[Image.Image],
+        batch_size: int = 32,
+        convert_to_numpy: bool = True,
+        normalize_embeddings: bool = False,
+    ) -> np.ndarray:
+        outputs = []
+        for start in range(0, len(images), batch_size):
+            pixel_values = clip_preprocess(images[start:start + batch_size], self.config)
+            outputs.append(self.session.run(None, {"pixel_values": pixel_values})[0])
+        embeddings = np.vstack(outputs).astype(np.float32)
+        return l2_normalize(embeddings) if normalize_embeddings else embeddings
+
+
+def _quantize(path: str):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    # int8 weights, activations quantized per batch at runtime (same idea as int8-dynamic in quantization.py)
+    quantize_dynamic(
+        os.path.join(path, MODEL_FILE),
+        os.path.join(path, QUANTIZED_MODEL_FILE),
+        weight_type=QuantType.QInt8,
+    )
+
+
+def export_text_model(
+    model_name_or_path: str,
+    output_dir: str,
+    quantize: bool = False,
+    opset: int = 14,
+) -> str:
+    """
+    Export the transformer of a sentence-transformers text model to ONNX.
+
+    The graph outputs token embeddings; pooling and normalization are applied in
+    NumPy with the pooling mode read from the model, so results match TextEncoder.
+
+    Args:
+        model_name_or_path (str): HuggingFace ID or local path (as passed to TextEncoder).
+        output_dir (str): Directory for model.onnx, the tokenizer and onnx_config.json.
+        quantize (bool): Also write model_int8.onnx with dynamic int8 quantization.
+        opset (int): ONNX opset version.
+
+    Returns:
+        str: output_dir
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name_or_path, device="cpu")
+    transformer = model[0]
+    pooling_mode = model[1].get_pooling_mode_str()
+    if pooling_mode not in ("mean", "cls", "max"):
+        raise ValueError(f"Unsupported pooling mode for ONNX export: {pooling_mode}")
+
+    os.makedirs(output_dir, exist_ok=True)
+    transformer.tokenizer.save_pretrained(output_dir)
+
+    hf_model = transformer.auto_model.eval()
+    dummy = transformer.tokenizer(["xin chào"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in dummy]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["token_embeddings"] = {0: "batch", 1: "sequence"}
+
+    class _TokenEmbeddings(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, *inputs):
+            return self.inner(**dict(zip(input_names, inputs))).last_hidden_state
+
+    with torch.no_grad():
+        torch.onnx.export(
+            _TokenEmbeddings(hf_model),
+            tuple(dummy[name] for name in input_names),
+            os.path.join(output_dir, MODEL_FILE),
+            input_names=input_names,
+            output_names=["token_embeddings"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+
+    with open(os.path.join(output_dir, ONNX_CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump({
+            "kind": "text",
+            "source_model": model_name_or_path,
+            "pooling": pooling_mode,
+            "max_seq_length": transformer.max_seq_length,
+            "dim": model.get_sentence_embedding_dimension(),
+        }, f, indent=2)
+
+    if quantize:
+        _quantize(output_dir)
+    logger.info(f"Exported text model {model_name_or_path} to {output_dir}")
+    return output_dir
+
+
+def export_image_model(
+    model_name_or_path: str,
+    output_dir: str,
+    quantize: bool = False,
+    opset: int = 14,
+) -> str:
+    """
+    Export the image tower (vision model + projection) of a sentence-transformers CLIP model.
+
+    Args:
+        model_name_or_path (str): e.g. "clip-ViT-B-32" (as passed to ImageEncoder).
+        output_dir (str): Directory for model.onnx and onnx_config.json.
+        quantize (bool): Also write model_int8.onnx with dynamic int8 quantization.
+        opset (int): ONNX opset version.
+
+    Returns:
+        str: output_dir
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name_or_path, device="cpu")
+    clip = model[0].model.eval()
+    image_processor = model[0].processor.image_processor
+
+    class _ImageFeatures(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, pixel_values):
+            return self.inner.get_image_features(pixel_values=pixel_values)
+
+    crop = image_processor.crop_size["height"]
+    os.makedirs(output_dir, exist_ok=True)
+    with torch.no_grad():
+        torch.onnx.export(
+            _ImageFeatures(clip),
+            (torch.zeros(1, 3, crop, crop),),
+            os.path.join(output_dir, MODEL_FILE),
+            input_names=["pixel_values"],
+            output_names=["image_embeds"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+            opset_version=opset,
+        )
+
+    with open(os.path.join(output_dir, ONNX_CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump({
+            "kind": "image",
+            "source_model": model_name_or_path,
+            "image_size": image_processor.size["shortest_edge"],
+            "crop_size": crop,
+            "image_mean": list(image_processor.image_mean),
+            "image_std": list(image_processor.image_std),
+            "dim": clip.config.projection_dim,
+        }, f, indent=2)
+
+    if quantize:
+        _quantize(output_dir)
+    logger.info(f"Exported image model {model_name_or_path} to {output_dir}")
+    return output_dir
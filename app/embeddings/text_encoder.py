@@ -1,23 +1,48 @@
 # app/embeddings/text_encoder.py
 import os
-from typing import List, Union
-from sentence_transformers import SentenceTransformer
+from typing import List, Optional, Union
 import numpy as np
 
+from embeddings.cache import EmbeddingCache
+from embeddings.onnx_backend import ENCODER_BACKENDS, OnnxTextModel
+from utils import clean_text
+
 class TextEncoder:
     """
     Wrapper for Vietnamese Sentence-BERT embedding model.
     """
-    def __init__(self, model_name_or_path: str = "VoVanPhuc/sup-SimCSE-VietNamese-phobert-base", device: str ='cpu'):
+    def __init__(
+        self,
+        model_name_or_path: str = "VoVanPhuc/sup-SimCSE-VietNamese-phobert-base",
+        device: str ='cpu',
+        cache: Optional[EmbeddingCache] = None,
+        backend: str = "torch",
+        num_threads: Optional[int] = None,
+    ):
         """
         Load a pretrained Vietnamese SBERT model.
 
         Args:
-            model_name_or_path (str): HuggingFace or local path to model.
+            model_name_or_path (str): HuggingFace or local path to model; for the ONNX
+                backends, a directory written by scripts/export_onnx.py.
+            cache (EmbeddingCache): Optional query-embedding cache; repeated texts skip the forward pass.
+            backend (str): "torch", "onnx" or "onnx-int8" (ONNX Runtime on CPU).
+            num_threads (int): ONNX Runtime intra-op threads (default: all cores).
         """
+        if backend not in ENCODER_BACKENDS:
+            raise ValueError(f"Unsupported encoder backend: {backend} (expected one of {ENCODER_BACKENDS})")
         self.model_name_or_path = model_name_or_path
         self.device = device
-        self.model = SentenceTransformer(self.model_name_or_path, device=self.device)
+        self.cache = cache
+        self.backend = backend
+
+        if backend == "torch":
+            from sentence_transformers import SentenceTransformer
+
+            self.model = SentenceTransformer(self.model_name_or_path, device=self.device)
+        else:
+            # Same pooling and normalization as the torch path, without loading torch
+            self.model = OnnxTextModel(self.model_name_or_path, backend=backend, num_threads=num_threads)
 
     def encode(self, texts: Union[str, List[str]]) -> np.ndarray:
         """
@@ -32,6 +57,19 @@ class TextEncoder:
         if isinstance(texts, str):
             texts = [texts]
 
-        embeddings = self.model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+        if self.cache is None:
+            return self.model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+
+        # Cached path: encode the normalized text so a cache entry means the same thing for every caller
+        texts = [clean_text(t) for t in texts]
+        cached = self.cache.get_many(texts)
+        missing = [i for i, vec in enumerate(cached) if vec is None]
+        if missing:
+            computed = self.model.encode(
+                [texts[i] for i in missing], convert_to_numpy=True, normalize_embeddings=True
+            )
+            self.cache.put_many([texts[i] for i in missing], computed)
+            for i, vec in zip(missing, computed):
+                cached[i] = vec
 
-        return embeddings
\ No newline at end of file
+        return np.vstack(cached).astype(np.float32)
\ No newline at end of file
@@ -0,0 +1,83 @@
+# app/fusion.py
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+FUSION_METHODS = ("rrf", "weighted")
+
+# (scores, ids) of one query row from one index; ids < 0 are FAISS padding
+Hits = Tuple[np.ndarray, np.ndarray]
+
+
+def _valid(hits: Hits) -> List[Tuple[int, float]]:
+    scores, ids = hits
+    return [(int(i), float(s)) for s, i in zip(scores, ids) if i >= 0]
+
+
+def reciprocal_rank_fusion(ranked: Sequence[Tuple[Hits, float]], rrf_k: int = 60) -> Dict[int, float]:
+    """
+    score(id) = sum over branches of weight / (rrf_k + rank), rank starting at 1.
+    Only ranks matter, so branches with differently scaled scores combine safely.
+    """
+    fused: Dict[int, float] = {}
+    for hits, weight in ranked:
+        for rank, (idx, _) in enumerate(_valid(hits), start=1):
+            fused[idx] = fused.get(idx, 0.0) + weight / (rrf_k + rank)
+    return fused
+
+
+def weighted_score_fusion(ranked: Sequence[Tuple[Hits, float]]) -> Dict[int, float]:
+    """
+    score(id) = sum over branches of weight * similarity. A candidate missing from a
+    branch's top list gets that branch's lowest returned similarity (an upper bound
+    on its true score there), so a single strong branch cannot be outvoted by nothing.
+    """
+    fused: Dict[int, float] = {}
+    branches = [(dict(_valid(hits)), weight) for hits, weight in ranked]
+    candidates = set().union(*(scores.keys() for scores, _ in branches))
+    for idx in candidates:
+        total = 0.0
+        for scores, weight in branches:
+            if scores:
+                total += weight * scores.get(idx, min(scores.values()))
+        fused[idx] = total
+    return fused
+
+
+def fuse(
+    text_hits: Hits,
+    image_hits: Optional[Hits],
+    top_k: int,
+    method: str = "rrf",
+    text_weight: float = 1.0,
+    image_weight: float = 1.0,
+    rrf_k: int = 60,
+) -> List[int]:
+    """
+    Merge the text and image results of one query into a single top_k list of ids.
+
+    Args:
+        text_hits (Hits): (scores, ids) from the text index.
+        image_hits (Hits): (scores, ids) from the image index, or None when the image branch was skipped.
+        top_k (int): Number of ids to return.
+        method (str): "rrf" (reciprocal rank fusion) or "weighted" (weighted similarity sum).
+        text_weight (float): Weight of the text branch.
+        image_weight (float): Weight of the image branch.
+        rrf_k (int): RRF rank offset; larger values flatten the rank curve.
+
+    Returns:
+        List[int]: Corpus row ids, best first.
+    """
+    if image_hits is None or image_weight <= 0:
+        return [idx for idx, _ in _valid(text_hits)][:top_k]
+
+    ranked = [(text_hits, text_weight), (image_hits, image_weight)]
+    if method == "rrf":
+        fused = reciprocal_rank_fusion(ranked, rrf_k)
+    elif method == "weighted":
+        fused = weighted_score_fusion(ranked)
+    else:
+        raise ValueError(f"Unsupported fusion method: {method} (expected one of {FUSION_METHODS})")
+    # Ties keep the smaller id first so results are deterministic
+    return sorted(fused, key=lambda idx: (-fused[idx], idx))[:top_k]
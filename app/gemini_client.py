@@ -0,0 +1,383 @@
+# app/gemini_client.py
+
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+# Rate limiting and transient server-side failures; anything else is the request's fault
+RETRYABLE_STATUS = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class GeminiError(RuntimeError):
+    """A Gemini call failed (non-retryable status, bad response, or retries exhausted)."""
+
+    def __init__(self, message: str, status: Optional[int] = None, retry_after: Optional[str] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def backoff_delay(attempt: int, base: float, cap: float, retry_after: Optional[str] = None) -> float:
+    """
+    Full-jitter exponential backoff (uniform in [0, min(cap, base * 2^attempt)]), or the
+    server's Retry-After when it sends one.
+    """
+    if retry_after:
+        try:
+            return min(cap, float(retry_after))
+        except ValueError:
+            pass
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def parse_response(data: Dict[str, Any]) -> str:
+    """
+    Text of the first candidate of a generateContent response (or stream chunk).
+    """
+    try:
+        candidate = data["candidates"][0]
+    except (KeyError, IndexError, TypeError):
+        if data.get("promptFeedback", {}).get("blockReason"):
+            raise GeminiError(f"Prompt blocked: {data['promptFeedback']['blockReason']}")
+        raise GeminiError("Unexpected Gemini response format.")
+    parts = candidate.get("content", {}).get("parts", [])
+    return "".join(part.get("text", "") for part in parts)
+
+
+class GeminiClient:
+    """
+    Gemini REST client (generateContent / streamGenerateContent) for the async serving path.
+
+    One pooled httpx client per event loop keeps connections alive between calls, a
+    semaphore caps concurrent upstream calls, and transient failures (connection errors,
+    timeouts, 429 and 5xx) are retried with jittered exponential backoff. Identical
+    prompts in flight at the same time share one upstream call (single-flight), so a
+    burst of students submitting the same problem costs one request.
+
+    A blocking variant (generate_sync / stream_sync) with the same retry policy serves
+    callers outside the event loop.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        base_url: str = GEMINI_BASE_URL,
+        temperature: Optional[float] = None,
+        max_output_tokens: Optional[int] = None,
+        max_concurrency: int = 16,
+        timeout: float = 60.0,
+        connect_timeout: float = 5.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 8.0,
+        single_flight: bool = True,
+    ):
+        """
+        Args:
+            api_key (str): Gemini API key (sent as the x-goog-api-key header).
+            model (str): Model name, e.g. "gemini-2.0-flash".
+            base_url (str): API root; point it at a stand-in server in tests.
+            temperature (float): generationConfig.temperature (None: server default).
+            max_output_tokens (int): generationConfig.maxOutputTokens (None: server default).
+            max_concurrency (int): Upstream calls in flight at once, streams included.
+            timeout (float): Seconds to wait for a response (or between stream chunks).
+            connect_timeout (float): Seconds to establish a connection.
+            max_retries (int): Retries after the first attempt on transient errors.
+            backoff_base (float): First retry waits up to this many seconds, doubling per retry.
+            backoff_cap (float): Upper bound of a single backoff.
+            single_flight (bool): Coalesce identical in-flight generate calls.
+        """
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.single_flight = single_flight
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
+
+        generation_config = {}
+        if temperature is not None:
+            generation_config["temperature"] = temperature
+        if max_output_tokens is not None:
+            generation_config["maxOutputTokens"] = max_output_tokens
+        self.generation_config = generation_config
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._sync_client: Optional[httpx.Client] = None
+        self._sync_semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._counters = {
+            "requests": 0,
+            "upstream_calls": 0,
+            "coalesced": 0,
+            "retries": 0,
+            "errors": 0,
+            "active": 0,
+        }
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self._counters[key] += amount
+
+    def _url(self, method: str) -> str:
+        return f"{self.base_url}/models/{self.model}:{method}"
+
+    def _headers(self) -> Dict[str, str]:
+        return {"x-goog-api-key": self.api_key, "content-type": "application/json"}
+
+    def _body(self, prompt: str) -> Dict[str, Any]:
+        body: Dict[str, Any] = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+        if self.generation_config:
+            body["generationConfig"] = self.generation_config
+        return body
+
+    def _key(self, prompt: str) -> str:
+        payload = json.dumps([self.model, self.generation_config, prompt], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def _async_state(self):
+        """
+        The pooled client and the concurrency cap belong to the loop that created them;
+        a different loop (e.g. a new test client) gets fresh ones.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits, headers=self._headers())
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._in_flight = {}
+        return self._client, self._semaphore
+
+    @classmethod
+    def _parse(cls, response: httpx.Response) -> str:
+        cls._raise_for_status(response)
+        try:
+            data = response.json()
+        except ValueError:
+            raise GeminiError(f"Gemini returned invalid JSON: {response.text[:200]}")
+        return parse_response(data)
+
+    @staticmethod
+    def _raise_for_status(response: httpx.Response):
+        if response.status_code >= 400:
+            raise GeminiError(
+                f"Gemini returned {response.status_code}: {response.text[:500]}",
+                response.status_code,
+                response.headers.get("retry-after"),
+            )
+
+    def _should_retry(self, error: Exception, attempt: int) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        if isinstance(error, GeminiError):
+            return error.status in RETRYABLE_STATUS
+        return isinstance(error, (httpx.TransportError, httpx.TimeoutException))
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        self._count("retries")
+        delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap, getattr(error, "retry_after", None))
+        logger.warning(f"Gemini call failed ({error}), retry {attempt + 1}/{self.max_retries} in {delay:.2f}s")
+        return delay
+
+    async def generate(self, prompt: str) -> str:
+        """
+        Generate a full answer. Concurrent calls with the same prompt share one upstream call.
+        """
+        self._count("requests")
+        self._async_state()
+        if not self.single_flight:
+            return await self._generate(prompt)
+
+        key = self._key(prompt)
+        future = self._in_flight.get(key)
+        if future is not None:
+            self._count("coalesced")
+            # Shielded: one caller giving up must not cancel the call the others wait on
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(self._generate(prompt))
+        self._in_flight[key] = future
+        future.add_done_callback(lambda f: self._forget(key, f))
+        return await asyncio.shield(future)
+
+    def _forget(self, key: str, future: asyncio.Future):
+        if self._in_flight.get(key) is future:
+            del self._in_flight[key]
+        # Mark the error as retrieved even if every waiter was cancelled
+        if not future.cancelled():
+            future.exception()
+
+    async def _generate(self, prompt: str) -> str:
+        client, semaphore = self._async_state()
+        attempt = 0
+        while True:
+            try:
+                async with semaphore:
+                    self._count("upstream_calls")
+                    self._count("active")
+                    try:
+                        response = await client.post(self._url("generateContent"), json=self._body(prompt))
+                    finally:
+                        self._count("active", -1)
+                return self._parse(response)
+            except (GeminiError, httpx.TransportError, httpx.TimeoutException) as e:
+                if not self._should_retry(e, attempt):
+                    self._count("errors")
+                    raise self._wrap(e)
+                await asyncio.sleep(self._retry_delay(e, attempt))
+                attempt += 1
+
+    @staticmethod
+    def _wrap(error: Exception) -> GeminiError:
+        if isinstance(error, GeminiError):
+            return error
+        return GeminiError(f"Gemini request failed: {type(error).__name__}: {error}")
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """
+        Stream answer chunks (server-sent events). Retries only happen before the first
+        chunk; once text has been yielded an error is raised to the caller.
+        """
+        self._count("requests")
+        client, semaphore = self._async_state()
+        attempt = 0
+        started = False
+        while True:
+            try:
+                async with semaphore:
+                    self._count("upstream_calls")
+                    self._count("active")
+                    try:
+                        async with client.stream(
+                            "POST", self._url("streamGenerateContent"), params={"alt": "sse"}, json=self._body(prompt)
+                        ) as response:
+                            if response.status_code >= 400:
+                                await response.aread()
+                                self._raise_for_status(response)
+                            async for line in response.aiter_lines():
+                                text = self._sse_text(line)
+                                if text:
+                                    started = True
+                                    yield text
+                    finally:
+                        self._count("active", -1)
+                return
+            except (GeminiError, httpx.TransportError, httpx.TimeoutException) as e:
+                if started or not self._should_retry(e, attempt):
+                    self._count("errors")
+                    raise self._wrap(e)
+                await asyncio.sleep(self._retry_delay(e, attempt))
+                attempt += 1
+
+    @staticmethod
+    def _sse_text(line: str) -> str:
+        if not line.startswith("data:"):
+            return ""
+        payload = line[len("data:"):].strip()
+        if not payload or payload == "[DONE]":
+            return ""
+        data = json.loads(payload)
+        # The last chunk may only carry usage metadata
+        if "candidates" not in data and "promptFeedback" not in data:
+            return ""
+        return parse_response(data)
+
+    def _sync(self) -> httpx.Client:
+        with self._lock:
+            if self._sync_client is None:
+                self._sync_client = httpx.Client(timeout=self.timeout, limits=self.limits, headers=self._headers())
+            return self._sync_client
+
+    def generate_sync(self, prompt: str) -> str:
+        """
+        Blocking generate with the same retry policy (no coalescing).
+        """
+        self._count("requests")
+        attempt = 0
+        while True:
+            try:
+                with self._sync_semaphore:
+                    self._count("upstream_calls")
+                    response = self._sync().post(self._url("generateContent"), json=self._body(prompt))
+                return self._parse(response)
+            except (GeminiError, httpx.TransportError, httpx.TimeoutException) as e:
+                if not self._should_retry(e, attempt):
+                    self._count("errors")
+                    raise self._wrap(e)
+                time.sleep(self._retry_delay(e, attempt))
+                attempt += 1
+
+    def stream_sync(self, prompt: str) -> Iterator[str]:
+        """
+        Blocking stream, retried only before the first chunk like stream().
+        """
+        self._count("requests")
+        attempt = 0
+        started = False
+        while True:
+            try:
+                with self._sync_semaphore:
+                    self._count("upstream_calls")
+                    with self._sync().stream(
+                        "POST", self._url("streamGenerateContent"), params={"alt": "sse"}, json=self._body(prompt)
+                    ) as response:
+                        if response.status_code >= 400:
+                            response.read()
+                            self._raise_for_status(response)
+                        for line in response.iter_lines():
+                            text = self._sse_text(line)
+                            if text:
+                                started = True
+                                yield text
+                return
+            except (GeminiError, httpx.TransportError, httpx.TimeoutException) as e:
+                if started or not self._should_retry(e, attempt):
+                    self._count("errors")
+                    raise self._wrap(e)
+                time.sleep(self._retry_delay(e, attempt))
+                attempt += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+        stats["in_flight_prompts"] = len(self._in_flight)
+        stats["max_concurrency"] = self.max_concurrency
+        return stats
+
+    def close(self):
+        """
+        Close the pooled connections. The async client is closed on its own loop when
+        that loop is still running.
+        """
+        with self._lock:
+            sync_client, self._sync_client = self._sync_client, None
+        if sync_client is not None:
+            sync_client.close()
+        client, loop, self._client, self._loop = self._client, self._loop, None, None
+        if client is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop and loop is not None:
+            loop.create_task(client.aclose())
+        elif loop is not None and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
@@ -0,0 +1,169 @@
+# app/index_factory.py
+
+import logging
+import time
+from typing import Optional
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+
+def default_nlist(n_vectors: int) -> int:
+    """
+    Rule-of-thumb number of IVF lists: ~4 * sqrt(n), capped so every list gets enough training points.
+    """
+    return int(max(1, min(4 * np.sqrt(n_vectors), n_vectors // 39)))
+
+
+def build_index(
+    embeddings: np.ndarray,
+    index_type: str = "flat",
+    nlist: Optional[int] = None,
+    pq_m: int = 16,
+    pq_bits: int = 8,
+    hnsw_m: int = 32,
+    ef_construction: int = 200,
+    train_size: int = 100_000,
+    seed: int = 0,
+) -> faiss.Index:
+    """
+    Build an inner-product FAISS index of the requested type over normalized embeddings.
+
+    Args:
+        embeddings (np.ndarray): float32 array of shape (n, dim).
+        index_type (str): "flat" (exact), "ivf_flat", "ivf_pq" or "hnsw".
+        nlist (int): IVF lists; defaults to default_nlist(n).
+        pq_m (int): IVF-PQ sub-quantizers (must divide dim).
+        pq_bits (int): Bits per PQ code.
+        hnsw_m (int): HNSW neighbours per node.
+        ef_construction (int): HNSW build-time beam width.
+        train_size (int): IVF training sample size (drawn at random from embeddings).
+        seed (int): Seed for the training sample.
+
+    Returns:
+        faiss.Index: Trained index containing all embeddings (ids = row numbers).
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+    n, dim = embeddings.shape
+    index = create_index(dim, index_type, n_vectors=n, nlist=nlist, pq_m=pq_m, pq_bits=pq_bits,
+                         hnsw_m=hnsw_m, ef_construction=ef_construction)
+    train_index(index, embeddings, train_size=train_size, seed=seed)
+
+    start = time.perf_counter()
+    index.add(embeddings)
+    logger.info(f"Added {n} vectors to {index_type} index in {time.perf_counter() - start:.1f}s")
+    return index
+
+
+def create_index(
+    dim: int,
+    index_type: str = "flat",
+    n_vectors: int = 0,
+    nlist: Optional[int] = None,
+    pq_m: int = 16,
+    pq_bits: int = 8,
+    hnsw_m: int = 32,
+    ef_construction: int = 200,
+) -> faiss.Index:
+    """
+    Create an empty (untrained) inner-product index of the requested type.
+    """
+    if index_type == "flat":
+        return faiss.IndexFlatIP(dim)
+
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = ef_construction
+        return index
+
+    nlist = nlist or default_nlist(n_vectors)
+    quantizer = faiss.IndexFlatIP(dim)
+    if index_type == "ivf_flat":
+        return faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+    if index_type == "ivf_pq":
+        if dim % pq_m != 0:
+            raise ValueError(f"pq_m={pq_m} must divide the embedding dim {dim}")
+        return faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, pq_bits, faiss.METRIC_INNER_PRODUCT)
+
+    raise ValueError(f"Unsupported index type: {index_type} (expected one of {INDEX_TYPES})")
+
+
+def train_index(index: faiss.Index, embeddings: np.ndarray, train_size: int = 100_000, seed: int = 0):
+    """
+    Train an index (IVF centroids / PQ codebooks) on a random sample of the embeddings.
+    No-op for indexes that need no training.
+    """
+    if index.is_trained:
+        return
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+    if len(embeddings) > train_size:
+        rng = np.random.default_rng(seed)
+        embeddings = embeddings[rng.choice(len(embeddings), train_size, replace=False)]
+
+    start = time.perf_counter()
+    index.train(embeddings)
+    logger.info(f"Trained index on {len(embeddings)} vectors in {time.perf_counter() - start:.1f}s")
+
+
+def read_index(path: str, mmap: bool = False) -> faiss.Index:
+    """
+    Load an index written by faiss.write_index.
+
+    With mmap=True the vectors / codes (flat and HNSW indexes) or the inverted lists
+    (IVF indexes) stay in the file and are paged in from the OS page cache on demand,
+    so every process that opens the same file shares one copy. The index is read-only.
+    """
+    if not mmap:
+        return faiss.read_index(path)
+    flags = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    try:
+        index = faiss.read_index(path, flags)
+    except RuntimeError:
+        # IVF indexes only support mapping their inverted lists
+        index = faiss.read_index(path, faiss.IO_FLAG_MMAP)
+    logger.info(f"Memory-mapped index {path} ({index.ntotal} vectors)")
+    return index
+
+
+def set_search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """
+    Set the default query-time accuracy/speed knobs of an index, where they apply.
+    """
+    if nprobe is not None:
+        ivf = _ivf(index)
+        if ivf is not None:
+            ivf.nprobe = nprobe
+    if ef_search is not None:
+        hnsw = _hnsw(index)
+        if hnsw is not None:
+            hnsw.hnsw.efSearch = ef_search
+
+
+def search_parameters(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """
+    Per-call search parameters (thread-safe alternative to set_search_params), or None.
+    """
+    if nprobe is not None and _ivf(index) is not None:
+        return faiss.SearchParametersIVF(nprobe=nprobe)
+    if ef_search is not None and _hnsw(index) is not None:
+        return faiss.SearchParametersHNSW(efSearch=ef_search)
+    return None
+
+
+def _ivf(index: faiss.Index):
+    try:
+        return faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return None
+
+
+def _hnsw(index: faiss.Index):
+    index = faiss.downcast_index(index)
+    if hasattr(index, "index") and not hasattr(index, "hnsw"):
+        # e.g. IndexIDMap wrapping an HNSW index
+        index = faiss.downcast_index(index.index)
+    return index if hasattr(index, "hnsw") else None
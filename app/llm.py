@@ -1,16 +1,26 @@
 # app/llm.py
 
-from huggingface_hub import login
 from dotenv import load_dotenv
+import asyncio
+import copy
+import logging
 import os
-import requests
-from typing import List, Literal, Optional
-from prompts.cot_templates import generate_prompt_cot
+import threading
+import time
+from typing import AsyncIterator, Callable, Iterator, List, Literal, Optional
+from prompts.composer import ComposedPrompt, PromptComposer
+from prompts.cot_templates import COT_TEMPLATES, get_prompt_prefix, prompt_fingerprint
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 
 LLM_BACKENDS = Literal["phi-2", "gemini"]
+GEMINI_MODEL = "gemini-2.0-flash"
+GEMINI_TEMPERATURE = 0.5
+# Rough average for mixed Vietnamese text and math notation; only used for token metrics
+GEMINI_CHARS_PER_TOKEN = 4.0
 
 class LLMEngine:
     def __init__(
@@ -19,13 +29,63 @@ class LLMEngine:
         backend: LLM_BACKENDS = "phi-2",
         max_tokens: int = 512,
         temperature: float = 0.3,
-        gemini_api_key: Optional[str] = None
+        gemini_api_key: Optional[str] = None,
+        use_prefix_cache: bool = True,
+        precision: str = "fp16",
+        continuous_batching: bool = False,
+        max_batch_size: int = 8,
+        max_queue_size: int = 64,
+        prompt_token_budget: Optional[int] = None,
+        max_example_tokens: Optional[int] = 384,
+        gemini_base_url: Optional[str] = None,
+        gemini_max_concurrency: int = 16,
+        gemini_timeout: float = 60.0,
+        gemini_max_retries: int = 3,
+        speculative: Optional[str] = None,
+        draft_model_name_or_path: Optional[str] = None,
+        num_draft_tokens: int = 8,
     ):
+        """
+        Args:
+            model_name_or_path (str): HuggingFace ID or local path of the local model.
+            backend (str): "phi-2" (local transformers model) or "gemini".
+            max_tokens (int): Maximum number of new tokens per answer.
+            temperature (float): Sampling temperature for the local model.
+            gemini_api_key (str): API key, defaults to GEMINI_API_KEY.
+            use_prefix_cache (bool): Local backend only. Precompute the key/value cache of each
+                category's static prompt prefix once and only prefill the request-specific suffix.
+            precision (str): Local backend only. "fp32", "fp16", "bf16", "int8-dynamic",
+                "int8-weight" or "int4-weight" (quantized modes run on CPU). Ignored when
+                model_name_or_path is a checkpoint written by save_quantized.
+            continuous_batching (bool): Local backend only. Serve all requests from one shared
+                decoding batch that requests join and leave at token granularity.
+            max_batch_size (int): Rows in the shared decoding batch.
+            max_queue_size (int): Requests waiting for a batch slot before callers block.
+            prompt_token_budget (int): Maximum prompt tokens; retrieved examples that do not fit
+                are truncated or dropped. Defaults to the local model's context minus max_tokens,
+                and to no limit for Gemini.
+            max_example_tokens (int): Retrieved solutions longer than this are truncated.
+            gemini_base_url (str): Gemini API root (defaults to the public endpoint).
+            gemini_max_concurrency (int): Gemini calls in flight at once.
+            gemini_timeout (float): Seconds to wait for a Gemini response.
+            gemini_max_retries (int): Retries on connection errors, timeouts, 429 and 5xx.
+            speculative (str): Local backend only. "prompt-lookup" drafts tokens by matching the
+                last generated n-gram against the prompt (retrieved solutions included);
+                "draft-model" drafts with draft_model_name_or_path. Drafts are verified in one
+                forward pass of the main model. Not combined with continuous_batching.
+            draft_model_name_or_path (str): Small model sharing the main model's tokenizer.
+            num_draft_tokens (int): Tokens drafted per verification step.
+        """
         self.backend = backend
         self.max_tokens = max_tokens
         self.temperature = temperature
         self.model_name_or_path = model_name_or_path
         self.gemini_api_key = gemini_api_key or os.getenv("GEMINI_API_KEY")
+        self.precision = precision
+        self.use_prefix_cache = use_prefix_cache and backend == "phi-2"
+        self.prefix_caches = {}
+        self.scheduler = None
+        self.speculative_decoder = None
 
         if self.backend == "phi-2":
             from transformers import AutoModelForCausalLM, AutoTokenizer
@@ -35,21 +95,98 @@ class LLMEngine:
             hf_token = os.getenv('HUGGINGFACE_TOKEN')
             login(token=hf_token)
 
-            self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-            self.tokenizer = AutoTokenizer.from_pretrained(model_name_or_path)
-            self.model = AutoModelForCausalLM.from_pretrained(
-                model_name_or_path, device_map="auto", torch_dtype=torch.float16
+            from quantization import (
+                QUANTIZED_MODES, is_quantized_checkpoint, load_dtype, load_quantized, quantize_model
             )
+
+            self.tokenizer = AutoTokenizer.from_pretrained(model_name_or_path)
+            if os.path.isdir(model_name_or_path) and is_quantized_checkpoint(model_name_or_path):
+                # Previously quantized weights: no float checkpoint and no re-quantization needed
+                self.model, self.precision = load_quantized(model_name_or_path)
+                self.device = torch.device("cpu")
+            elif precision in QUANTIZED_MODES:
+                self.device = torch.device("cpu")
+                model = AutoModelForCausalLM.from_pretrained(
+                    model_name_or_path, dtype=load_dtype(precision), low_cpu_mem_usage=True
+                )
+                self.model = quantize_model(model, precision)
+            else:
+                self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+                self.model = AutoModelForCausalLM.from_pretrained(
+                    model_name_or_path, device_map="auto", dtype=load_dtype(precision)
+                )
             self.model.eval()
+            logger.info(f"Loaded {model_name_or_path} with precision={self.precision} on {self.device}")
+
+            if self.use_prefix_cache:
+                self.build_prefix_caches()
+
+            if speculative and continuous_batching:
+                raise ValueError("speculative decoding and continuous_batching cannot be combined")
+
+            # Sample like the model.generate(do_sample=True) calls these replace (50 / 1.0 when unset)
+            generation_config = self.model.generation_config
+            top_k = generation_config.top_k if generation_config.top_k is not None else 50
+            top_p = generation_config.top_p if generation_config.top_p is not None else 1.0
+
+            if speculative:
+                from speculative import SpeculativeDecoder
+
+                draft_model = None
+                if speculative == "draft-model":
+                    if not draft_model_name_or_path:
+                        raise ValueError("speculative='draft-model' needs draft_model_name_or_path")
+                    draft_model = AutoModelForCausalLM.from_pretrained(
+                        draft_model_name_or_path, dtype=self.model.dtype
+                    ).to(self.device).eval()
+                self.speculative_decoder = SpeculativeDecoder(
+                    self.model,
+                    eos_token_id=self.tokenizer.eos_token_id,
+                    method=speculative,
+                    draft_model=draft_model,
+                    num_draft_tokens=num_draft_tokens,
+                    device=self.device,
+                    inference_context=self._inference_context,
+                    top_k=top_k,
+                    top_p=top_p,
+                )
+
+            if continuous_batching:
+                from continuous_batching import ContinuousBatcher
+
+                self.scheduler = ContinuousBatcher(
+                    self.model,
+                    eos_token_id=self.tokenizer.eos_token_id,
+                    max_batch_size=max_batch_size,
+                    max_queue_size=max_queue_size,
+                    device=self.device,
+                    inference_context=self._inference_context,
+                    top_k=top_k,
+                    top_p=top_p,
+                )
 
         elif self.backend == "gemini":
-            from langchain_google_genai import ChatGoogleGenerativeAI
-            from langchain_core.prompts import PromptTemplate
+            from gemini_client import GEMINI_BASE_URL, GeminiClient
 
             if not self.gemini_api_key:
                 raise ValueError("GEMINI_API_KEY must be set for Gemini backend.")
             else:
-                self.model = ChatGoogleGenerativeAI(model="gemini-2.0-flash", google_api_key=self.gemini_api_key, temperature = 0.5)
+                self.model = GeminiClient(
+                    api_key=self.gemini_api_key,
+                    model=GEMINI_MODEL,
+                    base_url=gemini_base_url or GEMINI_BASE_URL,
+                    temperature=GEMINI_TEMPERATURE,
+                    max_concurrency=gemini_max_concurrency,
+                    timeout=gemini_timeout,
+                    max_retries=gemini_max_retries,
+                )
+
+        if prompt_token_budget is None and self.backend == "phi-2":
+            context = getattr(self.model.config, "max_position_embeddings", None)
+            prompt_token_budget = context - self.max_tokens if context else None
+        self.composer = PromptComposer(
+            self.count_tokens, token_budget=prompt_token_budget, max_example_tokens=max_example_tokens
+        )
 
     def build_prompt(self, user_question: str, retrieved_examples: List[str] = None, category: str = "") -> str:
         """
@@ -63,37 +200,357 @@ class LLMEngine:
         Returns:
             str: Final composed prompt
         """
-        return generate_prompt_cot(user_question, retrieved_examples, category)
+        return self.compose_prompt(user_question, retrieved_examples, category).prompt
 
-    def generate_answer(self, prompt: str) -> str:
+    def compose_prompt(
+        self,
+        user_question: str,
+        retrieved_examples: List[str] = None,
+        category: str = "",
+        scores: Optional[List[float]] = None,
+    ) -> ComposedPrompt:
+        """
+        build_prompt under the prompt token budget, with composition metadata
+        (tokens per section, examples dropped or truncated).
+        """
+        return self.composer.compose(user_question, retrieved_examples or [], category, scores)
+
+    def build_prefix_caches(self, categories: Optional[List[str]] = None):
+        """
+        Run prefill once over the static prompt prefix of each CoT category and keep the
+        resulting key/value cache. Requests whose prompt starts with one of these prefixes
+        only prefill their own suffix on top of a copy of it.
+
+        Args:
+            categories (List[str]): Categories to precompute, defaults to all of COT_TEMPLATES.
+        """
+        for category in categories or list(COT_TEMPLATES):
+            prefix = get_prompt_prefix(category)
+            input_ids = self.tokenizer(prefix, return_tensors="pt").input_ids.to(self.device)
+            start = time.perf_counter()
+            with self._inference_context():
+                outputs = self.model(input_ids=input_ids, use_cache=True)
+            self.prefix_caches[category] = {
+                "prefix": prefix,
+                "input_ids": input_ids,
+                "past_key_values": outputs.past_key_values,
+            }
+            logger.info(
+                f"Prefix cache for '{category}': {input_ids.shape[1]} tokens "
+                f"in {(time.perf_counter() - start) * 1000:.0f} ms"
+            )
+
+    def save_quantized(self, path: str):
+        """
+        Save the local model in its current precision mode; pass `path` as
+        model_name_or_path to reload it without re-quantizing.
+        """
+        from quantization import save_quantized
+
+        save_quantized(self.model, self.tokenizer, path, self.precision)
+
+    def _inference_context(self):
+        from quantization import inference_context
+
+        return inference_context(self.precision, self.device)
+
+    def _match_prefix_cache(self, prompt: str) -> Optional[dict]:
+        best = None
+        for entry in self.prefix_caches.values():
+            if prompt.startswith(entry["prefix"]) and len(prompt) > len(entry["prefix"]):
+                if best is None or len(entry["prefix"]) > len(best["prefix"]):
+                    best = entry
+        return best
+
+    def _phi_inputs(self, prompt: str) -> dict:
+        """
+        Tokenize a prompt for model.generate, reusing a precomputed prefix cache when the
+        prompt starts with a known category prefix.
+        """
+        import torch
+
+        cached = self._match_prefix_cache(prompt) if self.use_prefix_cache else None
+        if cached is None:
+            input_ids = self.tokenizer(prompt, return_tensors="pt").input_ids.to(self.device)
+            return {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+
+        suffix_ids = self.tokenizer(
+            prompt[len(cached["prefix"]):], return_tensors="pt", add_special_tokens=False
+        ).input_ids.to(self.device)
+        input_ids = torch.cat([cached["input_ids"], suffix_ids], dim=-1)
+        return {
+            "input_ids": input_ids,
+            "attention_mask": torch.ones_like(input_ids),
+            # generate() extends the cache in place, so every request gets its own copy
+            "past_key_values": copy.deepcopy(cached["past_key_values"]),
+        }
+
+    def generate_answer(self, prompt: str, max_tokens: Optional[int] = None, temperature: Optional[float] = None) -> str:
+        """
+        Generate the answer for a prompt.
+
+        Args:
+            prompt (str): Prompt from build_prompt.
+            max_tokens (int): Per-request override of max_tokens (local backend).
+            temperature (float): Per-request override of temperature (local backend).
+        """
         if self.backend == "phi-2":
-            return self._generate_phi(prompt)
+            return self._generate_phi(prompt, max_tokens, temperature)
         elif self.backend == "gemini":
             return self._generate_gemini(prompt)
         else:
             raise ValueError(f"Unsupported backend: {self.backend}")
 
-    def _generate_phi(self, prompt: str) -> str:
-        import torch
+    async def agenerate_answer(self, prompt: str) -> str:
+        """
+        Async variant of generate_answer: remote backends use non-blocking I/O,
+        local models are pushed off the event loop onto a worker thread.
+        """
+        if self.backend == "gemini":
+            return await self._agenerate_gemini(prompt)
+        elif self.backend == "phi-2":
+            return await asyncio.to_thread(self._generate_phi, prompt)
+        else:
+            raise ValueError(f"Unsupported backend: {self.backend}")
 
-        input_ids = self.tokenizer(prompt, return_tensors="pt").input_ids.to(self.device)
-        output = self.model.generate(
-            input_ids=input_ids,
-            max_new_tokens=self.max_tokens,
-            temperature=self.temperature,
-            do_sample=True,
+    def stream_answer(self, prompt: str) -> Iterator[str]:
+        """
+        Yield the answer incrementally, as text chunks, while it is being generated.
+        """
+        if self.backend == "phi-2":
+            return self._stream_phi(prompt)
+        elif self.backend == "gemini":
+            return self._stream_gemini(prompt)
+        else:
+            raise ValueError(f"Unsupported backend: {self.backend}")
+
+    def astream_answer(self, prompt: str) -> AsyncIterator[str]:
+        """
+        Async variant of stream_answer. Local generation runs on a worker thread and its
+        chunks are handed back to the event loop as they are decoded.
+        """
+        if self.backend == "gemini":
+            return self._astream_gemini(prompt)
+        elif self.backend == "phi-2":
+            return _aiter_in_thread(self._stream_phi, prompt)
+        else:
+            raise ValueError(f"Unsupported backend: {self.backend}")
+
+    @property
+    def is_remote(self) -> bool:
+        return self.backend == "gemini"
+
+    def fingerprint(self) -> List[str]:
+        """
+        Everything besides the question that determines an answer: prompt template,
+        backend, model and decoding settings (used to invalidate cached answers).
+        """
+        model = GEMINI_MODEL if self.backend == "gemini" else self.model_name_or_path
+        return [
+            prompt_fingerprint(), self.backend, model, self.precision, str(self.max_tokens), str(self.temperature),
+            str(self.composer.token_budget), str(self.composer.max_example_tokens),
+        ]
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Token count of a prompt or answer, for metrics. Exact for the local model; for
+        Gemini it is estimated from the length (a countTokens call would add a round trip).
+        """
+        if not text:
+            return 0
+        if self.backend == "phi-2":
+            return len(self.tokenizer(text).input_ids)
+        return max(1, round(len(text) / GEMINI_CHARS_PER_TOKEN))
+
+    def _generate_phi(self, prompt: str, max_tokens: Optional[int] = None, temperature: Optional[float] = None) -> str:
+        max_tokens = max_tokens or self.max_tokens
+        temperature = self.temperature if temperature is None else temperature
+        inputs = self._phi_inputs(prompt)
+
+        if self.scheduler is not None:
+            request = self.scheduler.submit(
+                inputs["input_ids"], max_tokens, temperature, inputs.get("past_key_values")
+            )
+            return self.tokenizer.decode(request.result(), skip_special_tokens=True).strip()
+
+        if self.speculative_decoder is not None:
+            tokens = self.speculative_decoder.generate(
+                inputs["input_ids"], max_tokens, temperature, inputs.get("past_key_values")
+            )
+            return self.tokenizer.decode(tokens, skip_special_tokens=True).strip()
+
+        with self._inference_context():
+            output = self.model.generate(
+                **inputs,
+                max_new_tokens=max_tokens,
+                temperature=temperature,
+                do_sample=True,
+            )
+        new_tokens = output[0, inputs["input_ids"].shape[1]:]
+        return self.tokenizer.decode(new_tokens, skip_special_tokens=True).strip()
+
+    def _stream_phi(self, prompt: str, stop: Optional[threading.Event] = None) -> Iterator[str]:
+        """
+        Stream the local model's answer. Generation ends early once `stop` is set or the
+        iterator is closed; an exception on the generation thread is re-raised here.
+        """
+        from transformers import TextIteratorStreamer
+
+        stop = stop or threading.Event()
+        inputs = self._phi_inputs(prompt)
+        if self.scheduler is not None:
+            yield from self._stream_scheduled(inputs)
+            return
+        if self.speculative_decoder is not None:
+            yield from self._decode_incrementally(self.speculative_decoder.iter_generate(
+                inputs["input_ids"], self.max_tokens, self.temperature, inputs.get("past_key_values")
+            ))
+            return
+
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        errors = []
+
+        def generate(**kwargs):
+            try:
+                # Grad/autocast modes are thread-local, so enter them on the generation thread
+                with self._inference_context():
+                    self.model.generate(**kwargs)
+            except BaseException as e:
+                errors.append(e)
+                # generate() did not end the stream, the consumer would wait for text forever
+                streamer.end()
+
+        generation = threading.Thread(
+            target=generate,
+            kwargs=dict(
+                **inputs,
+                max_new_tokens=self.max_tokens,
+                temperature=self.temperature,
+                do_sample=True,
+                streamer=streamer,
+                stopping_criteria=_stop_on_event(stop),
+            ),
+            daemon=True,
         )
-        decoded = self.tokenizer.decode(output[0], skip_special_tokens=True)
-        return decoded[len(prompt):].strip()
+        generation.start()
+        try:
+            for text in streamer:
+                if text:
+                    yield text
+        finally:
+            # Also reached when the consumer closes the stream: the model stops at the next token
+            stop.set()
+            generation.join()
+        if errors:
+            raise errors[0]
+
+    def _stream_scheduled(self, inputs: dict) -> Iterator[str]:
+        request = self.scheduler.submit(
+            inputs["input_ids"], self.max_tokens, self.temperature, inputs.get("past_key_values")
+        )
+        try:
+            yield from self._decode_incrementally([token] for token in request)
+        finally:
+            # A consumer that went away frees its row in the decoding batch
+            request.cancel()
+
+    def _decode_incrementally(self, chunks: Iterator[List[int]]) -> Iterator[str]:
+        """
+        Turn chunks of generated token IDs into text deltas.
+        """
+        tokens, emitted = [], ""
+        for chunk in chunks:
+            tokens.extend(chunk)
+            text = self.tokenizer.decode(tokens, skip_special_tokens=True)
+            # Hold back partially decoded multi-byte characters until the next token completes them
+            if len(text) > len(emitted) and not text.endswith("\ufffd"):
+                yield text[len(emitted):]
+                emitted = text
 
     def _generate_gemini(self, prompt: str) -> str:
-        response = self.model.invoke(prompt)
+        return self.model.generate_sync(prompt)
+
+    async def _agenerate_gemini(self, prompt: str) -> str:
+        # Identical prompts in flight together share one upstream call
+        return await self.model.generate(prompt)
+
+    def _stream_gemini(self, prompt: str) -> Iterator[str]:
+        return self.model.stream_sync(prompt)
+
+    def _astream_gemini(self, prompt: str) -> AsyncIterator[str]:
+        return self.model.stream(prompt)
+
+    def stats(self) -> dict:
+        """
+        Gemini client counters (upstream calls, coalesced requests, retries), or for the
+        local model those of the continuous-batching scheduler or the speculative decoder.
+        """
+        if self.backend == "gemini":
+            return self.model.stats()
+        if self.scheduler is not None:
+            return self.scheduler.stats()
+        if self.speculative_decoder is not None:
+            return self.speculative_decoder.stats()
+        return {}
+
+    def close(self):
+        if self.scheduler is not None:
+            self.scheduler.close()
+        if self.backend == "gemini":
+            self.model.close()
+
+
+def _stop_on_event(stop: threading.Event):
+    """
+    StoppingCriteria for model.generate that ends generation once `stop` is set.
+    """
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class StopOnEvent(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return torch.full((input_ids.shape[0],), stop.is_set(), dtype=torch.bool, device=input_ids.device)
+
+    return StoppingCriteriaList([StopOnEvent()])
+
+
+async def _aiter_in_thread(iterator_fn: Callable[..., Iterator[str]], *args) -> AsyncIterator[str]:
+    """
+    Drive a blocking iterator on a worker thread and re-yield its items on the event loop.
+
+    `iterator_fn(*args, stop=event)` gets an event that is set when the consumer goes
+    away (client disconnect, cancelled task, closed generator); the producer then stops
+    pulling items and closes the iterator instead of generating for nobody.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+    stop = threading.Event()
 
-        # data = response.json()
-        # try:
-        #     return data["candidates"][0]["content"]["parts"][0]["text"].strip()
-        # except (KeyError, IndexError):
-        #     raise RuntimeError("Unexpected Gemini response format.")
+    def produce():
+        iterator = iterator_fn(*args, stop=stop)
+        try:
+            for item in iterator:
+                if stop.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(queue.put_nowait, done)
 
-        return response.content
-        
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
@@ -1,36 +1,271 @@
 # main.py
 
+import time
+
+_IMPORT_START = time.perf_counter()
+
 from fastapi import FastAPI, UploadFile, File, Form
+from typing import List, Optional
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from PIL import Image
-import io
+import asyncio
+import contextlib
+import json
+import logging
 import os
 
+import numpy as np
+
 # from ocr import OCRProcessor
-from ocr import run_ocr
-from embeddings.text_encoder import TextEncoder
-from embeddings.image_encoder import ImageEncoder
-from retriever import Retriever
-from llm import LLMEngine
+from ocr import get_ocr_model, run_ocr, run_ocr_batch, init_ocr_worker
+from ocr_cache import OCRCache, OCRCacheKey
+from answer_cache import AnswerCache, make_fingerprint
+from embeddings.batcher import MicroBatcher
+from embeddings.cache import EmbeddingCache
+from near_duplicate import CorpusMatch
+from metrics import (
+    CONTENT_TYPE, REGISTRY as METRICS, Gauge, RequestMetricsMiddleware, annotate, current_trace, record_tokens,
+    track_stage,
+)
+from pipeline import SolvePipeline
+from prefork import process_memory
+from preprocess import ImagePreprocessor, ImageTooLargeError, InvalidImageError, PreparedImage
+from registry import ComponentRegistry
 from utils import clean_text, create_temp_image, safe_remove
 
+logger = logging.getLogger(__name__)
+
 # Initialize core components
 # ocr_processor = OCRProcessor()
-text_encoder = TextEncoder()
-image_encoder = ImageEncoder()
-# retriever = Retriever(text_encoder=text_encoder, image_encoder=image_encoder)
-index_path = r"C:\Users\huyho\OneDrive\Desktop\MathRAG\data\faiss_index\math.index"
-corpus_path = r"C:\Users\huyho\OneDrive\Desktop\MathRAG\data\processed\corpus.pkl"
-retriever = Retriever(index_path=index_path, corpus_path=corpus_path, text_encoder=text_encoder)
-# llm_engine = LLMEngine(model_name_or_path="phi-2", max_tokens=512)
-# Use Gemini instead of Phi-2
-llm_engine = LLMEngine(
-    backend="gemini",  # or "phi-2"
-    model_name_or_path="phi-2",  # ignored for gemini
-    gemini_api_key=os.getenv("GEMINI_API_KEY")
+# Models, the index and the LLM client are built on first use (or by the startup warm-up),
+# so importing this module and binding the port take well under a second.
+registry = ComponentRegistry()
+
+# Repeated questions are served from the embedding cache without a forward pass.
+# Point VIMATH_EMBED_CACHE_DIR at a shared directory to persist it across restarts and workers.
+TEXT_MODEL = "VoVanPhuc/sup-SimCSE-VietNamese-phobert-base"
+# "onnx" / "onnx-int8" run both encoders on ONNX Runtime from the directories written by
+# scripts/export_onnx.py (see scripts/benchmark_encoders.py for the latency/memory trade-off)
+ENCODER_BACKEND = os.getenv("VIMATH_ENCODER_BACKEND", "torch")
+ENCODER_THREADS = int(os.environ["VIMATH_ENCODER_THREADS"]) if "VIMATH_ENCODER_THREADS" in os.environ else None
+TEXT_ONNX_DIR = os.getenv("VIMATH_TEXT_ONNX_DIR", os.path.join("models", "onnx", "text"))
+IMAGE_ONNX_DIR = os.getenv("VIMATH_IMAGE_ONNX_DIR", os.path.join("models", "onnx", "image"))
+embedding_cache = EmbeddingCache(
+    # int8 vectors differ slightly from the torch ones, so each backend gets its own keys
+    model_name=TEXT_MODEL if ENCODER_BACKEND == "torch" else f"{TEXT_MODEL}:{ENCODER_BACKEND}",
+    max_entries=int(os.getenv("VIMATH_EMBED_CACHE_SIZE", "10000")),
+    disk_dir=os.getenv("VIMATH_EMBED_CACHE_DIR"),
+)
+
+# Coalesce concurrent single-query encodes into one forward pass per batch
+ENCODE_MAX_BATCH = int(os.getenv("VIMATH_ENCODE_MAX_BATCH", "32"))
+ENCODE_MAX_WAIT_MS = float(os.getenv("VIMATH_ENCODE_MAX_WAIT_MS", "5"))
+
+def create_text_encoder():
+    TextEncoder = registry.import_module("embeddings.text_encoder").TextEncoder
+    if ENCODER_BACKEND == "torch":
+        encoder = TextEncoder(TEXT_MODEL, cache=embedding_cache)
+    else:
+        encoder = TextEncoder(TEXT_ONNX_DIR, cache=embedding_cache, backend=ENCODER_BACKEND, num_threads=ENCODER_THREADS)
+    return MicroBatcher(encoder, max_batch_size=ENCODE_MAX_BATCH, max_wait_ms=ENCODE_MAX_WAIT_MS, name="text_encoder")
+
+def create_image_encoder():
+    ImageEncoder = registry.import_module("embeddings.image_encoder").ImageEncoder
+    if ENCODER_BACKEND == "torch":
+        encoder = ImageEncoder()
+    else:
+        encoder = ImageEncoder(IMAGE_ONNX_DIR, backend=ENCODER_BACKEND, num_threads=ENCODER_THREADS)
+    return MicroBatcher(encoder, max_batch_size=ENCODE_MAX_BATCH, max_wait_ms=ENCODE_MAX_WAIT_MS, name="image_encoder")
+
+# Optional separate image index (setup_vectorstore.py --image-index): text and image results are
+# fused, and queries without an image never run CLIP
+IMAGE_INDEX_PATH = os.getenv("VIMATH_IMAGE_INDEX_PATH")
+
+def create_retriever():
+    Retriever = registry.import_module("retriever").Retriever
+    # retriever = Retriever(text_encoder=text_encoder, image_encoder=image_encoder)
+    index_path = os.getenv("VIMATH_INDEX_PATH", r"C:\Users\huyho\OneDrive\Desktop\MathRAG\data\faiss_index\math.index")
+    # A CorpusStore directory (see scripts/convert_corpus.py) is memory-mapped instead of parsed at startup
+    corpus_path = os.getenv("VIMATH_CORPUS_PATH", r"C:\Users\huyho\OneDrive\Desktop\MathRAG\data\processed\corpus.pkl")
+    return Retriever(
+        index_path=index_path,
+        db_path=corpus_path,
+        text_encoder=registry.get("text_encoder"),
+        # Query-time recall/latency knobs for IVF / HNSW indexes (see scripts/benchmark_index.py)
+        nprobe=int(os.environ["VIMATH_INDEX_NPROBE"]) if "VIMATH_INDEX_NPROBE" in os.environ else None,
+        ef_search=int(os.environ["VIMATH_INDEX_EF_SEARCH"]) if "VIMATH_INDEX_EF_SEARCH" in os.environ else None,
+        image_encoder=registry.get("image_encoder") if IMAGE_INDEX_PATH else None,
+        image_index_path=IMAGE_INDEX_PATH,
+        fusion=os.getenv("VIMATH_FUSION", "rrf"),  # or "weighted"
+        text_weight=float(os.getenv("VIMATH_FUSION_TEXT_WEIGHT", "1.0")),
+        image_weight=float(os.getenv("VIMATH_FUSION_IMAGE_WEIGHT", "1.0")),
+        # Share the index pages between workers instead of one heap copy each (scripts/serve.py turns it on)
+        mmap_index=os.getenv("VIMATH_INDEX_MMAP", "0") == "1",
+    )
+
+# Problems that are already in the corpus are answered with their stored solution, before any
+# embedding or generation. The MinHash index is written by setup_vectorstore.py (--dedup-index);
+# the threshold is the Jaccard similarity of character 4-gram sets (numbers must match exactly).
+DEDUP_INDEX_PATH = os.getenv("VIMATH_DEDUP_INDEX_PATH")  # e.g. data/faiss_index/math.minhash
+
+def create_near_duplicate_index():
+    NearDuplicateIndex = registry.import_module("near_duplicate").NearDuplicateIndex
+    # The retriever's corpus: rows line up with the index and the records are not loaded twice
+    return NearDuplicateIndex.load(
+        DEDUP_INDEX_PATH,
+        registry.get("retriever").examples,
+        threshold=float(os.getenv("VIMATH_DEDUP_THRESHOLD", "0.8")),
+    )
+
+# Label of every stage metric, so dashboards can compare deployments of different backends
+LLM_BACKEND = "gemini"  # or "phi-2"
+
+def create_llm_engine():
+    LLMEngine = registry.import_module("llm").LLMEngine
+    # llm_engine = LLMEngine(model_name_or_path="phi-2", max_tokens=512)
+    # Use Gemini instead of Phi-2
+    return LLMEngine(
+        backend=LLM_BACKEND,
+        model_name_or_path="phi-2",  # ignored for gemini
+        gemini_api_key=os.getenv("GEMINI_API_KEY"),
+        use_prefix_cache=os.getenv("VIMATH_LLM_PREFIX_CACHE", "1") == "1",  # local backend only
+        precision=os.getenv("VIMATH_LLM_PRECISION", "fp16"),  # local backend only, e.g. bf16 / int8-dynamic on CPU
+        # Local backend only: concurrent requests share one decoding batch
+        continuous_batching=os.getenv("VIMATH_LLM_CONTINUOUS_BATCHING", "0") == "1",
+        max_batch_size=int(os.getenv("VIMATH_LLM_MAX_BATCH", "8")),
+        # Local backend only: "prompt-lookup" or "draft-model" (with VIMATH_LLM_DRAFT_MODEL, e.g. microsoft/phi-1_5)
+        speculative=os.getenv("VIMATH_LLM_SPECULATIVE") or None,
+        draft_model_name_or_path=os.getenv("VIMATH_LLM_DRAFT_MODEL"),
+        num_draft_tokens=int(os.getenv("VIMATH_LLM_DRAFT_TOKENS", "8")),
+        # Unset: the local model's context minus max_tokens, no limit for Gemini
+        prompt_token_budget=int(os.environ["VIMATH_PROMPT_TOKEN_BUDGET"]) if os.getenv("VIMATH_PROMPT_TOKEN_BUDGET") else None,
+        max_example_tokens=int(os.getenv("VIMATH_MAX_EXAMPLE_TOKENS", "384")),
+        # Gemini only: pooled connections, concurrency cap and retries of the REST client
+        gemini_base_url=os.getenv("VIMATH_GEMINI_BASE_URL"),
+        gemini_max_concurrency=int(os.getenv("VIMATH_GEMINI_MAX_CONCURRENCY", "16")),
+        gemini_timeout=float(os.getenv("VIMATH_GEMINI_TIMEOUT", "60")),
+        gemini_max_retries=int(os.getenv("VIMATH_GEMINI_MAX_RETRIES", "3")),
+    )
+
+def warm_up_llm(llm_engine):
+    # A remote backend is warm once its client exists; a dummy call would only cost quota
+    if not llm_engine.is_remote:
+        llm_engine.generate_answer("1 + 1 = ?", max_tokens=1)
+
+def close_llm_engine(llm_engine):
+    llm_engine.close()
+
+# Repeated uploads (exact bytes or near-duplicate photos of the same page) skip PaddleOCR
+ocr_cache = OCRCache(
+    max_entries=int(os.getenv("VIMATH_OCR_CACHE_SIZE", "2048")),
+    disk_path=os.getenv("VIMATH_OCR_CACHE_PATH"),  # e.g. data/cache/ocr.sqlite
+    phash_threshold=int(os.getenv("VIMATH_OCR_CACHE_PHASH_BITS", "4")),
+    max_disk_entries=int(os.getenv("VIMATH_OCR_CACHE_DISK_SIZE", "100000")),
+)
+
+# Paraphrases of already solved questions (same numbers, same image) reuse the stored answer.
+# The fingerprint covers the prompt template and model settings, so changing either invalidates it.
+ANSWER_CACHE_ENABLED = os.getenv("VIMATH_ANSWER_CACHE", "1") == "1"
+
+def create_answer_cache():
+    return AnswerCache(
+        fingerprint=make_fingerprint(*registry.get("llm").fingerprint()),
+        threshold=float(os.getenv("VIMATH_ANSWER_CACHE_THRESHOLD", "0.95")),
+        max_entries=int(os.getenv("VIMATH_ANSWER_CACHE_SIZE", "10000")),
+        ttl_seconds=float(os.getenv("VIMATH_ANSWER_CACHE_TTL", str(7 * 24 * 3600))),
+        disk_path=os.getenv("VIMATH_ANSWER_CACHE_PATH"),  # e.g. data/cache/answers.sqlite
+    )
+
+# Uploads are decoded once (EXIF-oriented, downscaled) and shared by OCR, CLIP and the OCR cache.
+# With VIMATH_OCR_ANGLE_CLS=0 the OCR workers also skip the text-angle classifier.
+preprocessor = ImagePreprocessor(
+    max_side=int(os.getenv("VIMATH_IMAGE_MAX_SIDE", "1600")),
+    max_bytes=int(float(os.getenv("VIMATH_MAX_UPLOAD_MB", "20")) * 1024 * 1024),
+    max_pixels=int(float(os.getenv("VIMATH_MAX_IMAGE_MP", "50")) * 1_000_000),
+    crop_to_text=os.getenv("VIMATH_CROP_TO_TEXT", "0") == "1",
+)
+
+# Each stage runs on its own bounded executor; the event loop only orchestrates
+def create_pipeline():
+    return SolvePipeline(
+        ocr_workers=int(os.getenv("VIMATH_OCR_WORKERS", "1")),
+        # Encode threads mostly wait on the micro-batcher, so allow a full batch in flight
+        encode_workers=int(os.getenv("VIMATH_ENCODE_WORKERS", str(ENCODE_MAX_BATCH))),
+        search_workers=int(os.getenv("VIMATH_SEARCH_WORKERS", "2")),
+        llm_concurrency=int(os.getenv("VIMATH_LLM_CONCURRENCY", "8")),
+        ocr_initializer=init_ocr_worker,
+    )
+
+pipeline = create_pipeline()
+
+async def warm_up_ocr(ocr_stage):
+    # Starts the OCR worker process(es) and loads PaddleOCR there
+    await ocr_stage.run(run_ocr, np.full((64, 256, 3), 255, dtype=np.uint8))
+
+# Registration order is warm-up order: the components the first request needs come first
+registry.register(
+    "text_encoder", create_text_encoder,
+    warmup=lambda encoder: encoder.encode(["x + 1 = 2"]),
+    close=lambda encoder: encoder.close(),
+)
+registry.register(
+    "retriever", create_retriever,
+    warmup=lambda retriever: retriever.retrieve("x + 1 = 2", top_k=1),
+    close=lambda retriever: retriever.close(),
+)
+if DEDUP_INDEX_PATH:
+    # Optional: a missing or broken index disables corpus matching instead of being reloaded per request
+    registry.register("near_duplicates", create_near_duplicate_index, required=False, retry_interval=None)
+registry.register("ocr", lambda: pipeline.ocr, warmup=warm_up_ocr)
+registry.register("llm", create_llm_engine, warmup=warm_up_llm, close=close_llm_engine)
+registry.register(
+    "image_encoder", create_image_encoder,
+    warmup=lambda encoder: encoder.encode(Image.new("RGB", (32, 32))),
+    close=lambda encoder: encoder.close(),
+    required=bool(IMAGE_INDEX_PATH),  # only queried with a separate image index
+)
+if ANSWER_CACHE_ENABLED:
+    registry.register("answer_cache", create_answer_cache, close=lambda cache: cache.close())
+
+# Pre-fork deployment (scripts/serve.py): what the launcher loads once for all workers.
+# "ocr" is the PaddleOCR model itself, inherited by the OCR processes the workers fork.
+PREFORK_COMPONENTS = (
+    ["text_encoder", "retriever"]
+    + (["near_duplicates"] if DEDUP_INDEX_PATH else [])
+    + ["ocr"]
+    + (["image_encoder"] if IMAGE_INDEX_PATH else [])
 )
 
+def preload_shared(names: List[str] = None):
+    """
+    Load read-only components in the launcher, before it forks the workers. Nothing is
+    warmed up here: warm-ups start thread pools, which do not survive fork.
+    """
+    for name in names or PREFORK_COMPONENTS:
+        if name == "ocr":
+            get_ocr_model()
+        else:
+            registry.get(name)
+
+def after_fork():
+    """
+    Give a freshly forked worker its own SQLite connections and stage pools
+    (the OCR process pool's pipes must not be shared with the other workers).
+    """
+    global pipeline
+    ocr_cache.reopen()
+    embedding_cache.reopen()
+    pipeline = create_pipeline()
+
+# Warm every component in the background at startup so /readyz turns green without a first request
+WARMUP_ON_STARTUP = os.getenv("VIMATH_WARMUP", "1") == "1"
+_STARTED_AT = time.time()
+
+# /solve_batch: worksheet-sized uploads and how many of their answers generate at once
+BATCH_MAX_ITEMS = int(os.getenv("VIMATH_BATCH_MAX_ITEMS", "64"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("VIMATH_BATCH_LLM_CONCURRENCY", "4"))
+
 # Initialize API
 app = FastAPI(
     title="Vietnamese High School Math Solver",
@@ -38,6 +273,9 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Stage timings in a Server-Timing header and one JSON log line per request
+app.add_middleware(RequestMetricsMiddleware)
+
 # Allow frontend access
 app.add_middleware(
     CORSMiddleware,
@@ -47,6 +285,312 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("shutdown")
+def shutdown_pipeline():
+    pipeline.shutdown(wait=False)
+    registry.close()
+    ocr_cache.close()
+    embedding_cache.close()
+
+IMPORT_SECONDS = round(time.perf_counter() - _IMPORT_START, 3)
+
+@app.on_event("startup")
+async def start_warm_up():
+    if WARMUP_ON_STARTUP:
+        app.state.warm_up_task = asyncio.create_task(registry.warm_up())
+
+@app.get("/healthz")
+def healthz():
+    """
+    Liveness: the process is up and serving. Also reports where startup time went.
+    """
+    return {
+        "status": "ok",
+        "uptime_s": round(time.time() - _STARTED_AT, 1),
+        "import_s": IMPORT_SECONDS,
+        "module_import_s": registry.import_times,
+        "components": registry.status(),
+    }
+
+@app.get("/readyz")
+def readyz():
+    """
+    Readiness: 200 once every required component is loaded and warmed up, 503 before.
+    """
+    ready = registry.ready(require_warm=WARMUP_ON_STARTUP)
+    content = {"ready": ready, "components": registry.status()}
+    if not ready:
+        return JSONResponse(status_code=503, content=content)
+    return content
+
+def timed(stage: str):
+    return track_stage(stage, backend=LLM_BACKEND)
+
+async def compose_prompt(llm_engine, question: str, retrieved: List[str], log: bool = True) -> str:
+    async with timed("prompt"):
+        composed = llm_engine.compose_prompt(
+            user_question=question,
+            retrieved_examples=retrieved,
+            category="algebra"  # Optional: can infer from question type
+        )
+    if log:
+        meta = composed.metadata
+        annotate(
+            prompt_sections=meta["tokens"],
+            examples_kept=meta["examples_kept"],
+            examples_dropped=len(meta["dropped_duplicates"]) + len(meta["dropped_over_budget"]),
+            examples_truncated=len(meta["truncated"]),
+        )
+    return composed.prompt
+
+async def generate_with_metrics(llm_engine, prompt: str, semaphore: asyncio.Semaphore = None) -> str:
+    generate = llm_engine.agenerate_answer if llm_engine.is_remote else llm_engine.generate_answer
+    # Time only the generation, not the wait for a batch slot
+    async with semaphore or contextlib.nullcontext():
+        async with timed("llm"):
+            answer = await pipeline.llm.run(generate, prompt)
+    record_tokens(llm_engine.count_tokens(prompt), llm_engine.count_tokens(answer), backend=LLM_BACKEND)
+    return answer
+
+async def read_upload(upload: UploadFile) -> bytes:
+    # Starlette knows the spooled size, so oversized uploads are refused before being read
+    if upload.size is not None:
+        preprocessor.check_size(upload.size)
+    return await upload.read()
+
+async def prepare_upload(image_bytes: bytes) -> PreparedImage:
+    async with timed("preprocess"):
+        return await asyncio.to_thread(preprocessor.process, image_bytes)
+
+def rejected_image(e: InvalidImageError) -> JSONResponse:
+    return JSONResponse(
+        status_code=413 if isinstance(e, ImageTooLargeError) else 400,
+        content={"error": str(e)}
+    )
+
+async def run_cached_ocr(image_bytes: bytes, prepared: PreparedImage, key: OCRCacheKey = None):
+    # Hashing a photo is not free, keep it off the event loop
+    if key is None:
+        key = await asyncio.to_thread(ocr_cache.make_key, image_bytes, prepared.image)
+    result = await asyncio.to_thread(ocr_cache.get, key)
+    if result is None:
+        # BGR array in PaddleOCR's layout: the worker uses it as is
+        ocr_array = await asyncio.to_thread(lambda: prepared.ocr_array)
+        result = await pipeline.ocr.run(run_ocr, ocr_array)
+        await asyncio.to_thread(ocr_cache.put, key, result)
+    return result
+
+async def run_cached_ocr_batch(images_bytes: List[bytes], prepared: List[PreparedImage]) -> list:
+    """
+    OCR many uploads: cache hits are served directly and all misses go to the OCR
+    pool as one run_ocr_batch call. Returns one OCR result or exception per image.
+    """
+    keys = await asyncio.to_thread(
+        lambda: [ocr_cache.make_key(b, p.image) for b, p in zip(images_bytes, prepared)]
+    )
+    results = await asyncio.to_thread(lambda: [ocr_cache.get(key) for key in keys])
+    misses = [i for i, result in enumerate(results) if result is None]
+    if not misses:
+        return results
+
+    arrays = await asyncio.to_thread(lambda: [prepared[i].ocr_array for i in misses])
+    try:
+        computed = await pipeline.ocr.run(run_ocr_batch, arrays)
+    except Exception:
+        # One unreadable image fails the whole batch call; retry image by image to isolate it
+        computed = await asyncio.gather(
+            *(pipeline.ocr.run(run_ocr, array) for array in arrays), return_exceptions=True
+        )
+
+    for i, result in zip(misses, computed):
+        results[i] = result
+        if not isinstance(result, BaseException):
+            await asyncio.to_thread(ocr_cache.put, keys[i], result)
+    return results
+
+def collect_runtime_metrics():
+    """
+    Cache and stage-pool state, read at scrape time.
+    """
+    # Each cache reports its own counters (hits by tier, evictions, entries, hit_rate, ...)
+    cache_stats = Gauge("vimath_cache_stat", "Counters and sizes reported by a cache's stats().", ["cache", "stat"])
+    caches = {"ocr": ocr_cache, "embedding": embedding_cache}
+    if ANSWER_CACHE_ENABLED and registry.is_loaded("answer_cache"):
+        caches["answer"] = registry.get("answer_cache")
+    if DEDUP_INDEX_PATH and registry.is_loaded("near_duplicates"):
+        caches["corpus"] = registry.get("near_duplicates")
+    for name, cache in caches.items():
+        for stat, value in cache.stats().items():
+            cache_stats.set(value, cache=name, stat=stat)
+
+    preprocess = Gauge("vimath_preprocess_stat", "Counters reported by the image preprocessor.", ["stat"])
+    for stat, value in preprocessor.stats().items():
+        preprocess.set(value, stat=stat)
+
+    pool_limit = Gauge("vimath_stage_pool_capacity", "Maximum in-flight calls of a stage pool.", ["stage"])
+    for name, stage_stats in pipeline.stats().items():
+        pool_limit.set(stage_stats["max_concurrency"], stage=name)
+
+    memory = Gauge("vimath_process_memory_bytes", "Memory of this worker process (rss, pss, unique, shared).", ["kind"])
+    for kind, value in process_memory().items():
+        memory.set(value, kind=kind)
+    return [cache_stats, preprocess, pool_limit, memory]
+
+METRICS.add_collector(collect_runtime_metrics)
+
+@app.get("/metrics")
+def metrics():
+    return Response(METRICS.render(), media_type=CONTENT_TYPE)
+
+@app.get("/stats/ocr_cache")
+def ocr_cache_stats():
+    return ocr_cache.stats()
+
+@app.get("/stats/embedding_cache")
+def embedding_cache_stats():
+    return embedding_cache.stats()
+
+@app.get("/stats/answer_cache")
+def answer_cache_stats():
+    if not ANSWER_CACHE_ENABLED:
+        return {"enabled": False}
+    return registry.get("answer_cache").stats() if registry.is_loaded("answer_cache") else {"loaded": False}
+
+@app.get("/stats/near_duplicates")
+def near_duplicate_stats():
+    if not DEDUP_INDEX_PATH:
+        return {"enabled": False}
+    return registry.get("near_duplicates").stats() if registry.is_loaded("near_duplicates") else {"loaded": False}
+
+@app.get("/stats/preprocess")
+def preprocess_stats():
+    return preprocessor.stats()
+
+@app.get("/stats/llm")
+def llm_stats():
+    return registry.get("llm").stats() if registry.is_loaded("llm") else {"loaded": False}
+
+@app.get("/stats/memory")
+def memory_stats():
+    """
+    This worker's memory: `unique` is what it costs on its own, `shared` is what it
+    shares with the launcher and the other workers (see prefork.process_memory).
+    """
+    return {"pid": os.getpid(), **process_memory()}
+
+@app.get("/stats/pipeline")
+def pipeline_stats():
+    return pipeline.stats()
+
+@app.get("/stats/batching")
+def batching_stats():
+    return {
+        name: registry.get(name).stats() if registry.is_loaded(name) else {"loaded": False}
+        for name in ("text_encoder", "image_encoder")
+    }
+
+async def ocr_and_retrieve(image_bytes: bytes, prepared: PreparedImage, question: str, key: OCRCacheKey = None):
+    """
+    OCR the upload and retrieve related examples. OCR (optional – can be used later to
+    improve embedding context) runs in the OCR process pool while the query embedding
+    is computed on the encode pool.
+
+    Returns:
+        Tuple: (cleaned OCR text, retrieved examples, CorpusMatch of the OCR text or None);
+            on a corpus match the search is skipped and the examples are empty.
+    """
+    retriever = await registry.aget("retriever")
+
+    async def ocr():
+        async with timed("ocr"):
+            return await run_cached_ocr(image_bytes, prepared, key)
+
+    async def encode():
+        async with timed("encode"):
+            return await pipeline.encode.run(retriever.encode_query, question, prepared.image)
+
+    encode_task = asyncio.create_task(encode())
+    try:
+        ocr_text, _ = await ocr()
+        cleaned_ocr = clean_text(ocr_text)
+        # A photo of a corpus problem: its solution is served and the embedding is not needed
+        match = await lookup_corpus(cleaned_ocr) if cleaned_ocr != clean_text(question) else None
+        if match is not None:
+            encode_task.cancel()
+            return cleaned_ocr, [], match
+        query_vec = await encode_task
+    except BaseException:
+        encode_task.cancel()
+        raise
+
+    # Retrieve related examples
+    async with timed("search"):
+        retrieved = await pipeline.search.run(retriever.search, query_vec, 3)
+    return cleaned_ocr, retrieved, None
+
+async def lookup_corpus(text: str, log: bool = True) -> Optional[CorpusMatch]:
+    """
+    Find the corpus problem `text` is a (near-)duplicate of; None when there is none or
+    the near-duplicate index is disabled or failed to load.
+    """
+    if not DEDUP_INDEX_PATH or not text.strip():
+        return None
+    try:
+        index = await registry.aget("near_duplicates")
+    except Exception:
+        return None
+    async with timed("corpus_match"):
+        match = await asyncio.to_thread(index.lookup, text)
+    if log:
+        annotate(corpus_match=match is not None)
+    return match
+
+def corpus_answer(match: CorpusMatch) -> dict:
+    """
+    Response fields for a problem answered from the corpus.
+    """
+    return {
+        "retrieved_examples": [match.record.get("content", "")],
+        "answer": match.record.get("solution") or match.record.get("content", ""),
+        "source": "corpus",
+        "corpus_match": {"row": match.row, "id": match.record.get("id"), "similarity": round(match.similarity, 3)},
+    }
+
+async def lookup_answer(question: str, key: OCRCacheKey):
+    """
+    Embed the question and look it up in the answer cache.
+
+    Returns:
+        Tuple: (question embedding, cached payload or None); (None, None) when the cache is off.
+    """
+    if not ANSWER_CACHE_ENABLED:
+        return None, None
+    text_encoder = await registry.aget("text_encoder")
+    answer_cache = await registry.aget("answer_cache")
+    async with timed("answer_cache"):
+        # The retriever encodes the same text right after, so this is an embedding-cache hit there
+        question_vec = (await pipeline.encode.run(text_encoder.encode, question))[0]
+        cached = await asyncio.to_thread(answer_cache.lookup, question_vec, question, key.phash)
+    annotate(cached=cached is not None)
+    return question_vec, cached
+
+def store_answer(question_vec, question: str, key: OCRCacheKey, cleaned_ocr: str, retrieved, answer: str):
+    if not (ANSWER_CACHE_ENABLED and answer):
+        return
+    # Best effort: the answer is already generated, a cache write must not turn it into an error
+    try:
+        registry.get("answer_cache").put(
+            question_vec,
+            question,
+            {"ocr_text": cleaned_ocr, "retrieved_examples": retrieved, "answer": answer},
+            image_hash=key.phash,
+        )
+    except Exception as e:
+        logger.warning(f"Could not store the answer in the answer cache: {e}")
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 @app.post("/solve")
 async def solve_math_problem(
     image: UploadFile = File(...),
@@ -54,39 +598,230 @@ async def solve_math_problem(
 ):
     try:
         # Load image
-        image_bytes = await image.read()
-        pil_image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+        image_bytes = await read_upload(image)
+        prepared = await prepare_upload(image_bytes)
+        key = await asyncio.to_thread(ocr_cache.make_key, image_bytes, prepared.image)
 
-        # OCR (optional – can be used later to improve embedding context)
-        # ocr_text = ocr_processor.run_ocr(pil_image)
-        ocr_text = run_ocr(pil_image)
-        cleaned_ocr = clean_text(ocr_text)
+        # Corpus problems are answered before anything is embedded (OCR is skipped too)
+        match = await lookup_corpus(question)
+        if match is not None:
+            return {"question": question, "ocr_text": "", **corpus_answer(match), "cached": False}
 
-        # Encode + retrieve related examples
-        retrieved = retriever.retrieve(
-            question=question,
-            image=pil_image,
-            top_k=3
-        )
+        question_vec, cached = await lookup_answer(question, key)
+        if cached is not None:
+            return {
+                "question": question,
+                "ocr_text": cached["ocr_text"],
+                "retrieved_examples": cached["retrieved_examples"],
+                "answer": cached["answer"],
+                "source": "answer_cache",
+                "cached": True,
+            }
+
+        cleaned_ocr, retrieved, match = await ocr_and_retrieve(image_bytes, prepared, question, key)
+        if match is not None:
+            return {"question": question, "ocr_text": cleaned_ocr, **corpus_answer(match), "cached": False}
 
         # Build prompt + generate answer
-        prompt = llm_engine.build_prompt(
-            user_question=question,
-            retrieved_examples=retrieved,
-            category="algebra"  # Optional: can infer from question type
-        )
+        llm_engine = await registry.aget("llm")
+        prompt = await compose_prompt(llm_engine, question, retrieved)
 
-        answer = llm_engine.generate_answer(prompt)
+        answer = await generate_with_metrics(llm_engine, prompt)
+        await asyncio.to_thread(store_answer, question_vec, question, key, cleaned_ocr, retrieved, answer)
 
         return {
             "question": question,
             "ocr_text": cleaned_ocr,
             "retrieved_examples": retrieved,
-            "answer": answer
+            "answer": answer,
+            "source": "llm",
+            "cached": False,
         }
 
+    except InvalidImageError as e:
+        return rejected_image(e)
     except Exception as e:
         return JSONResponse(
             status_code=500,
             content={"error": str(e)}
-        )
\ No newline at end of file
+        )
+
+@app.post("/solve/stream")
+async def solve_math_problem_stream(
+    image: UploadFile = File(...),
+    question: str = Form(...)
+):
+    """
+    Server-sent events version of /solve: emits `ocr` and `retrieved` as soon as they are
+    known, then one `token` event per generated chunk, then `done` (or `error`).
+    """
+    # Bad uploads get a plain 4xx before the event stream starts
+    try:
+        image_bytes = await read_upload(image)
+        prepared = await prepare_upload(image_bytes)
+    except InvalidImageError as e:
+        return rejected_image(e)
+
+    def corpus_events(ocr_text: str, match: CorpusMatch):
+        fields = corpus_answer(match)
+        yield sse_event("ocr", {"question": question, "ocr_text": ocr_text})
+        yield sse_event("retrieved", {"retrieved_examples": fields["retrieved_examples"]})
+        yield sse_event("token", {"text": fields["answer"]})
+        yield sse_event("done", {
+            "answer": fields["answer"], "cached": False, "source": "corpus", "corpus_match": fields["corpus_match"],
+        })
+
+    async def events():
+        try:
+            key = await asyncio.to_thread(ocr_cache.make_key, image_bytes, prepared.image)
+
+            match = await lookup_corpus(question)
+            if match is not None:
+                for event in corpus_events("", match):
+                    yield event
+                return
+
+            question_vec, cached = await lookup_answer(question, key)
+            if cached is not None:
+                yield sse_event("ocr", {"question": question, "ocr_text": cached["ocr_text"]})
+                yield sse_event("retrieved", {"retrieved_examples": cached["retrieved_examples"]})
+                yield sse_event("token", {"text": cached["answer"]})
+                yield sse_event("done", {"answer": cached["answer"], "cached": True, "source": "answer_cache"})
+                return
+
+            cleaned_ocr, retrieved, match = await ocr_and_retrieve(image_bytes, prepared, question, key)
+            if match is not None:
+                for event in corpus_events(cleaned_ocr, match):
+                    yield event
+                return
+            yield sse_event("ocr", {"question": question, "ocr_text": cleaned_ocr})
+            yield sse_event("retrieved", {"retrieved_examples": retrieved})
+
+            llm_engine = await registry.aget("llm")
+            prompt = await compose_prompt(llm_engine, question, retrieved)
+
+            answer = []
+            async with timed("llm"):
+                async for token in pipeline.llm.stream(llm_engine.astream_answer, prompt):
+                    answer.append(token)
+                    yield sse_event("token", {"text": token})
+
+            answer = "".join(answer)
+            record_tokens(llm_engine.count_tokens(prompt), llm_engine.count_tokens(answer), backend=LLM_BACKEND)
+            await asyncio.to_thread(store_answer, question_vec, question, key, cleaned_ocr, retrieved, answer)
+            # Headers went out before generation, so the stage timings travel with the final event
+            trace = current_trace()
+            yield sse_event("done", {
+                "answer": answer,
+                "cached": False,
+                "source": "llm",
+                "stages_ms": {k: round(v * 1000, 1) for k, v in trace.stages.items()} if trace else {},
+            })
+
+        except Exception as e:
+            yield sse_event("error", {"error": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/solve_batch")
+async def solve_math_problem_batch(
+    images: List[UploadFile] = File(...),
+    questions: List[str] = Form(...)
+):
+    """
+    Solve a whole worksheet in one request: images[i] goes with questions[i].
+
+    OCR, query encoding and the FAISS search run once for the batch; answers are then
+    generated concurrently (at most VIMATH_BATCH_LLM_CONCURRENCY at a time). Items whose
+    question is found in the corpus get the stored solution and skip all of that. Every
+    item gets its own result or error, so one bad problem does not fail the others.
+    """
+    if len(images) != len(questions):
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"Got {len(images)} images but {len(questions)} questions"}
+        )
+    if len(images) > BATCH_MAX_ITEMS:
+        return JSONResponse(
+            status_code=413,
+            content={"error": f"At most {BATCH_MAX_ITEMS} problems per batch"}
+        )
+
+    results = [{"index": i, "question": q} for i, q in enumerate(questions)]
+    images_bytes = [b""] * len(images)
+
+    # Decode every upload; unreadable or oversized ones are reported and dropped from the batch
+    valid, prepared = [], []
+    for i, image in enumerate(images):
+        try:
+            images_bytes[i] = await read_upload(image)
+            prepared.append(await prepare_upload(images_bytes[i]))
+            valid.append(i)
+        except InvalidImageError as e:
+            results[i]["error"] = f"Invalid image: {e}"
+
+    matches = await asyncio.gather(*(lookup_corpus(questions[i], log=False) for i in valid))
+    for i, match in zip(valid, matches):
+        if match is not None:
+            results[i].update(ocr_text="", **corpus_answer(match))
+    annotate(corpus_matches=sum(m is not None for m in matches))
+    prepared = [p for p, match in zip(prepared, matches) if match is None]
+    valid = [i for i, match in zip(valid, matches) if match is None]
+
+    def summary() -> dict:
+        return {
+            "results": results,
+            "succeeded": sum("answer" in r for r in results),
+            "failed": sum("error" in r for r in results),
+        }
+
+    if not valid:
+        # Every readable problem came from the corpus: no model is loaded or called
+        return summary()
+
+    try:
+        retriever, llm_engine = await asyncio.gather(registry.aget("retriever"), registry.aget("llm"))
+        async def ocr():
+            async with timed("ocr"):
+                return await run_cached_ocr_batch([images_bytes[i] for i in valid], prepared)
+
+        async def retrieve():
+            # Encoding and the FAISS search are one call here
+            async with timed("retrieve"):
+                pil_images = [p.image for p in prepared]
+                return await pipeline.encode.run(retriever.retrieve_batch, [questions[i] for i in valid], pil_images, 3)
+
+        ocr_results, retrieved = await asyncio.gather(ocr(), retrieve())
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"error": str(e)}
+        )
+
+    semaphore = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+    async def solve_item(i: int, ocr_result, examples: List[str]):
+        item = results[i]
+        if isinstance(ocr_result, BaseException):
+            item["error"] = f"OCR failed: {ocr_result}"
+            return
+        item["ocr_text"] = clean_text(ocr_result[0])
+        item["retrieved_examples"] = examples
+        try:
+            # One log line per batch: per-item composition details are not annotated
+            prompt = await compose_prompt(llm_engine, item["question"], examples, log=False)
+            item["answer"] = await generate_with_metrics(llm_engine, prompt, semaphore)
+            item["source"] = "llm"
+        except Exception as e:
+            item["error"] = str(e)
+
+    await asyncio.gather(*(
+        solve_item(i, ocr_result, examples)
+        for i, ocr_result, examples in zip(valid, ocr_results, retrieved)
+    ))
+
+    return summary()
@@ -0,0 +1,334 @@
+# app/metrics.py
+
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# One JSON line per request; route this logger separately to ship it to a log pipeline
+request_logger = logging.getLogger("vimath.requests")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; OCR and LLM calls take seconds, FAISS searches well under a millisecond
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # label values -> [per-bucket counts..., sum]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.setdefault(key, [0] * len(self.buckets) + [0.0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-1] += value
+
+    def count(self, **labels: str) -> int:
+        series = self._values.get(self._key(labels))
+        return int(sum(series[:-1])) if series else 0
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        for key, series in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, series[:-1]):
+                cumulative += n
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Minimal Prometheus client: counters, gauges and histograms rendered in the text
+    exposition format, plus collectors that report values computed at scrape time.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[_Metric]]] = []
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[_Metric]]):
+        """
+        Register a callable returning freshly filled metrics on every scrape (e.g. cache stats).
+        """
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        metrics = list(self._metrics.values())
+        for collector in self._collectors:
+            try:
+                metrics.extend(collector())
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {e}")
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_LATENCY = REGISTRY.histogram(
+    "vimath_stage_duration_seconds", "Latency of one pipeline stage.", ["stage", "backend"]
+)
+STAGE_IN_FLIGHT = REGISTRY.gauge(
+    "vimath_stage_in_flight", "Calls of a pipeline stage currently running.", ["stage", "backend"]
+)
+STAGE_ERRORS = REGISTRY.counter(
+    "vimath_stage_errors_total", "Pipeline stage calls that raised.", ["stage", "backend"]
+)
+REQUEST_LATENCY = REGISTRY.histogram(
+    "vimath_request_duration_seconds", "End-to-end request latency.", ["path", "status"]
+)
+PROMPT_TOKENS = REGISTRY.counter(
+    "vimath_llm_prompt_tokens_total", "Prompt tokens sent to the LLM.", ["backend"]
+)
+COMPLETION_TOKENS = REGISTRY.counter(
+    "vimath_llm_completion_tokens_total", "Tokens generated by the LLM.", ["backend"]
+)
+
+
+class RequestTrace:
+    """
+    Per-request record of stage durations, token counts and extra fields, rendered
+    as a Server-Timing header and as the structured request log line.
+    """
+
+    def __init__(self, method: str, path: str, request_id: Optional[str] = None):
+        self.request_id = request_id or uuid.uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.fields: Dict[str, object] = {}
+
+    def add_stage(self, stage: str, seconds: float):
+        # A stage that runs more than once (e.g. per batch item) accumulates
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items()]
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(parts)
+
+    def log_record(self, status: int) -> Dict[str, object]:
+        return {
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "status": status,
+            "duration_ms": round(self.elapsed() * 1000, 1),
+            "stages_ms": {stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()},
+            **self.fields,
+        }
+
+
+_current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar("vimath_trace", default=None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def annotate(**fields):
+    """
+    Add fields (e.g. cached=True) to the current request's log line.
+    """
+    trace = current_trace()
+    if trace is not None:
+        trace.fields.update(fields)
+
+
+@asynccontextmanager
+async def track_stage(stage: str, backend: str = ""):
+    """
+    Time a pipeline stage: latency histogram, in-flight gauge, error counter and the
+    current request's Server-Timing entry.
+    """
+    STAGE_IN_FLIGHT.inc(stage=stage, backend=backend)
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=stage, backend=backend)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_IN_FLIGHT.dec(stage=stage, backend=backend)
+        STAGE_LATENCY.observe(elapsed, stage=stage, backend=backend)
+        trace = current_trace()
+        if trace is not None:
+            trace.add_stage(stage, elapsed)
+
+
+def record_tokens(prompt_tokens: int, completion_tokens: int, backend: str = ""):
+    PROMPT_TOKENS.inc(prompt_tokens, backend=backend)
+    COMPLETION_TOKENS.inc(completion_tokens, backend=backend)
+    trace = current_trace()
+    if trace is not None:
+        trace.fields["prompt_tokens"] = trace.fields.get("prompt_tokens", 0) + prompt_tokens
+        trace.fields["completion_tokens"] = trace.fields.get("completion_tokens", 0) + completion_tokens
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware that opens a RequestTrace per request, adds Server-Timing and
+    X-Request-ID headers, and on completion records the request latency and writes
+    one JSON log line.
+
+    Streaming responses send their headers before generation starts, so their
+    Server-Timing only covers the stages finished by then; the log line is written
+    after the last body chunk and covers everything.
+    """
+
+    def __init__(self, app, exclude_paths: Iterable[str] = ("/metrics", "/healthz", "/readyz")):
+        self.app = app
+        self.exclude_paths = set(exclude_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1") or None
+        trace = RequestTrace(scope["method"], scope["path"], request_id)
+        token = _current_trace.set(trace)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (b"server-timing", trace.server_timing().encode("latin-1")),
+                    (b"x-request-id", trace.request_id.encode("latin-1")),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_trace.reset(token)
+            REQUEST_LATENCY.observe(trace.elapsed(), path=trace.path, status=str(status))
+            request_logger.info(json.dumps(trace.log_record(status), ensure_ascii=False))
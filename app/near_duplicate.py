@@ -0,0 +1,287 @@
+# app/near_duplicate.py
+
+import json
+import logging
+import os
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from answer_cache import math_signature
+from utils import clean_text
+
+logger = logging.getLogger(__name__)
+
+META_FILE = "meta.json"
+_ARRAYS = ("signatures", "rows", "band_keys", "band_order")
+
+# Constants of the 64-bit multiply-shift hashes (odd multipliers, fixed so built indexes stay valid)
+_SHINGLE_BASE = np.uint64(0x100000001B3)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def normalize(text: str) -> str:
+    """
+    Text as fingerprinted: clean_text, lower case, composed Unicode (OCR and keyboards
+    disagree on how Vietnamese diacritics are encoded).
+    """
+    return unicodedata.normalize("NFC", clean_text(text)).lower()
+
+
+def shingle_hashes(text: str, size: int = 4) -> np.ndarray:
+    """
+    Distinct 64-bit hashes of the character `size`-grams of the normalized text.
+    Character shingles tolerate the single-character errors OCR makes.
+    """
+    codes = np.frombuffer(normalize(text).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    size = min(size, len(codes))  # shorter text is one shingle
+    if not size:
+        return np.empty(0, dtype=np.uint64)
+    powers = _SHINGLE_BASE ** np.arange(size - 1, -1, -1, dtype=np.uint64)
+    windows = np.lib.stride_tricks.sliding_window_view(codes, size)
+    with np.errstate(over="ignore"):
+        hashes = (windows * powers).sum(axis=1, dtype=np.uint64) * _MIX
+    return np.unique(hashes)
+
+
+def jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    if not len(a) or not len(b):
+        return 0.0
+    shared = len(np.intersect1d(a, b, assume_unique=True))
+    return shared / (len(a) + len(b) - shared)
+
+
+def lsh_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """
+    Split a signature into `bands` bands of `rows` values. Two texts become candidates when
+    a whole band agrees, which happens with probability 1 - (1 - s^rows)^bands at
+    similarity s; this picks the S-curve whose midpoint (1/bands)^(1/rows) is the highest
+    one still below `threshold`, so true matches are rarely missed and the exact check
+    removes the extra candidates.
+    """
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        midpoint = (1 / bands) ** (1 / rows)
+        if midpoint < threshold:
+            best = (bands, rows)
+    return best
+
+
+class MinHasher:
+    """
+    MinHash signatures over character shingles: the fraction of equal signature values of
+    two texts estimates the Jaccard similarity of their shingle sets.
+    """
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 4, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 2**63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        """(num_perm,) uint32 signature; all ones for text without shingles."""
+        return self.signature_of(shingle_hashes(text, self.shingle_size))
+
+    def signature_of(self, hashes: np.ndarray) -> np.ndarray:
+        if not len(hashes):
+            return np.full(self.num_perm, np.iinfo(np.uint32).max, dtype=np.uint32)
+        with np.errstate(over="ignore"):
+            permuted = (hashes[:, None] * self._a + self._b) >> np.uint64(32)
+        return permuted.min(axis=0).astype(np.uint32)
+
+
+class CorpusMatch(NamedTuple):
+    row: int
+    similarity: float        # Jaccard similarity of the shingle sets
+    record: Dict[str, Any]
+
+
+def record_text(record: Dict[str, Any]) -> str:
+    # Records from setup_vectorstore.py keep the problem apart from its solution
+    return record.get("question") or record.get("content", "")
+
+
+class NearDuplicateIndex:
+    """
+    MinHash/LSH index of the corpus problems, for serving the stored solution of an
+    uploaded problem that is already in the corpus without embedding or generating.
+
+    A lookup hashes the normalized text, gathers the rows that share an LSH band with
+    it, ranks them by estimated similarity and checks the best `verify_k` exactly: a
+    match needs a shingle Jaccard similarity of at least `threshold` and the same
+    numbers and operators (answer_cache.math_signature), since problems that differ
+    only in a coefficient have different solutions.
+
+    On disk it is a directory of .npy arrays (opened memory-mapped) plus meta.json,
+    written next to the FAISS index by scripts/setup_vectorstore.py.
+    """
+
+    def __init__(
+        self,
+        signatures: np.ndarray,
+        rows: np.ndarray,
+        corpus: Sequence[Dict[str, Any]],
+        hasher: MinHasher,
+        bands: int,
+        band_keys: Optional[np.ndarray] = None,
+        band_order: Optional[np.ndarray] = None,
+        threshold: float = 0.8,
+        verify_k: int = 4,
+    ):
+        """
+        Args:
+            signatures (np.ndarray): (n, num_perm) uint32 MinHash signatures.
+            rows (np.ndarray): (n,) corpus row of each signature.
+            corpus (Sequence[Dict]): The corpus records (see corpus_store.load_corpus).
+            hasher (MinHasher): The hasher the signatures were made with.
+            bands (int): LSH bands (see lsh_bands).
+            band_keys / band_order: Sorted band hashes and the signature each belongs to,
+                (bands, n) each; computed when not given.
+            threshold (float): Minimum Jaccard similarity of a match.
+            verify_k (int): Candidates compared exactly per lookup.
+        """
+        self.signatures = signatures
+        self.rows = rows
+        self.corpus = corpus
+        self.hasher = hasher
+        self.bands = bands
+        self.band_rows = hasher.num_perm // bands
+        self.threshold = threshold
+        self.verify_k = verify_k
+
+        rng = np.random.default_rng(hasher.seed + 1)
+        self._band_mix = rng.integers(1, 2**63, size=self.band_rows, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        if band_keys is None:
+            band_keys, band_order = self._band_tables(signatures)
+        self.band_keys = band_keys
+        self.band_order = band_order
+
+        self._lock = threading.Lock()
+        self._counters = {"lookups": 0, "hits": 0, "candidates": 0, "verified": 0, "lookup_s": 0.0}
+
+    @classmethod
+    def build(
+        cls,
+        corpus: Sequence[Dict[str, Any]],
+        rows: Optional[Iterable[int]] = None,
+        num_perm: int = 128,
+        shingle_size: int = 4,
+        build_threshold: float = 0.65,
+        **kwargs,
+    ) -> "NearDuplicateIndex":
+        """
+        Hash the corpus problems.
+
+        Args:
+            corpus (Sequence[Dict]): Corpus records.
+            rows (Iterable[int]): Rows to index (default: all); e.g. only the live rows of an
+                incrementally updated corpus store.
+            num_perm (int): Signature length.
+            shingle_size (int): Characters per shingle.
+            build_threshold (float): Similarity around which LSH starts returning candidates; lookups
+                with a threshold of 0.75 or more find nearly all matches at the default 0.65.
+            **kwargs: threshold / verify_k for lookups.
+        """
+        start = time.perf_counter()
+        rows = np.arange(len(corpus), dtype=np.int64) if rows is None else np.asarray(list(rows), dtype=np.int64)
+        hasher = MinHasher(num_perm, shingle_size)
+        signatures = np.empty((len(rows), num_perm), dtype=np.uint32)
+        for i, row in enumerate(rows):
+            signatures[i] = hasher.signature(record_text(corpus[int(row)]))
+        bands, _ = lsh_bands(num_perm, build_threshold)
+        index = cls(signatures, rows, corpus, hasher, bands, **kwargs)
+        logger.info(f"MinHash index over {len(rows)} problems built in {time.perf_counter() - start:.1f}s")
+        return index
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        for name in _ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        meta = {"num_perm": self.hasher.num_perm, "shingle_size": self.hasher.shingle_size,
+                "seed": self.hasher.seed, "bands": self.bands, "size": len(self.rows)}
+        tmp_path = os.path.join(path, META_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(path, META_FILE))
+
+    @classmethod
+    def load(cls, path: str, corpus: Sequence[Dict[str, Any]], **kwargs) -> "NearDuplicateIndex":
+        """
+        Open an index written by save() (arrays memory-mapped) over its corpus.
+        """
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in _ARRAYS}
+        hasher = MinHasher(meta["num_perm"], meta["shingle_size"], meta["seed"])
+        logger.info(f"Loaded MinHash index of {meta['size']} problems from {path}")
+        return cls(hasher=hasher, bands=meta["bands"], corpus=corpus, **arrays, **kwargs)
+
+    def lookup(self, text: str) -> Optional[CorpusMatch]:
+        """
+        The corpus problem that `text` is a (near-)duplicate of, or None.
+        """
+        start = time.perf_counter()
+        hashes = shingle_hashes(text, self.hasher.shingle_size)
+        match, candidates, verified = None, 0, 0
+        if len(hashes) and len(self.rows):
+            signature = self.hasher.signature_of(hashes)
+            positions = self._candidates(signature)
+            candidates = len(positions)
+            if candidates:
+                estimates = (self.signatures[positions] == signature).mean(axis=1)
+                order = np.argsort(-estimates, kind="stable")[:self.verify_k]
+                query_math = math_signature(text)
+                for position in positions[order]:
+                    row = int(self.rows[position])
+                    record = self.corpus[row]
+                    problem = record_text(record)
+                    verified += 1
+                    similarity = jaccard(hashes, shingle_hashes(problem, self.hasher.shingle_size))
+                    if (similarity >= self.threshold and math_signature(problem) == query_math
+                            and (match is None or similarity > match.similarity)):
+                        match = CorpusMatch(row, similarity, record)
+
+        with self._lock:
+            self._counters["lookups"] += 1
+            self._counters["hits"] += match is not None
+            self._counters["candidates"] += candidates
+            self._counters["verified"] += verified
+            self._counters["lookup_s"] += time.perf_counter() - start
+        return match
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._counters)
+        stats["size"] = len(self.rows)
+        stats["threshold"] = self.threshold
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        return stats
+
+    def _band_hashes(self, signatures: np.ndarray) -> np.ndarray:
+        """(n, bands) uint64 hash of each band of each signature."""
+        used = signatures[:, :self.bands * self.band_rows].astype(np.uint64)
+        banded = used.reshape(len(signatures), self.bands, self.band_rows)
+        with np.errstate(over="ignore"):
+            return (banded * self._band_mix).sum(axis=2, dtype=np.uint64)
+
+    def _band_tables(self, signatures: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        keys = self._band_hashes(signatures).T                # (bands, n)
+        order = np.argsort(keys, axis=1, kind="stable").astype(np.int64)
+        return np.take_along_axis(keys, order, axis=1), order
+
+    def _candidates(self, signature: np.ndarray) -> np.ndarray:
+        keys = self._band_hashes(signature[None, :])[0]
+        found: List[np.ndarray] = []
+        for band, key in enumerate(keys):
+            column = self.band_keys[band]
+            lo, hi = np.searchsorted(column, key, side="left"), np.searchsorted(column, key, side="right")
+            if hi > lo:
+                found.append(np.asarray(self.band_order[band, lo:hi]))
+        return np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
@@ -2,52 +2,162 @@
 
 import os
 import logging
-from typing import List, Tuple
+from typing import List, Sequence, Tuple, Union
 
-from paddleocr import PaddleOCR
+import numpy as np
 from PIL import Image
 
 # Initialize logger
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-# Initialize OCR engine once (reuse across calls)
-ocr_model = PaddleOCR(use_angle_cls=True, lang='vi', use_gpu=False)
+# Accepted inputs: a file path, a decoded PIL image, or a NumPy array in
+# OpenCV/PaddleOCR layout (HxWx3 BGR uint8, or HxW grayscale).
+ImageInput = Union[str, Image.Image, np.ndarray]
+OCRResult = Tuple[str, List[Tuple[str, float]]]
 
-def run_ocr(image_path: str) -> Tuple[str, List[Tuple[str, float]]]:
+# Same recognition score cut-off PaddleOCR applies in its end-to-end pipeline
+DROP_SCORE = 0.5
+
+# The text-angle classifier fixes upside-down lines. Uploads that went through
+# preprocess.ImagePreprocessor are already upright from their EXIF orientation,
+# so it can be switched off to save one model pass per text line.
+USE_ANGLE_CLS = os.getenv("VIMATH_OCR_ANGLE_CLS", "1") == "1"
+
+# OCR engine is created once per process on first use (reused across calls).
+# Worker processes load it up front via init_ocr_worker.
+ocr_model = None
+
+def get_ocr_model() -> "PaddleOCR":
+    global ocr_model
+    if ocr_model is None:
+        # Imported here: PaddleOCR pulls in paddle, which takes seconds to import
+        from paddleocr import PaddleOCR
+        ocr_model = PaddleOCR(use_angle_cls=USE_ANGLE_CLS, lang='vi', use_gpu=False)
+    return ocr_model
+
+def init_ocr_worker():
+    """
+    Process-pool initializer: load PaddleOCR once per OCR worker process.
+    """
+    get_ocr_model()
+
+def _to_bgr_array(image: ImageInput) -> np.ndarray:
+    """
+    Convert any accepted input into a contiguous HxWx3 BGR uint8 array, without touching disk
+    for in-memory inputs.
+    """
+    if isinstance(image, str):
+        if not os.path.exists(image):
+            raise FileNotFoundError(f"Image not found: {image}")
+        with Image.open(image) as img:
+            image = img.convert("RGB")
+
+    if isinstance(image, Image.Image):
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        return np.ascontiguousarray(np.asarray(image)[:, :, ::-1])
+
+    if isinstance(image, np.ndarray):
+        if image.ndim == 2:
+            image = np.repeat(image[:, :, None], 3, axis=2)
+        elif image.ndim == 3 and image.shape[2] == 4:
+            image = image[:, :, :3]
+        if image.ndim != 3 or image.shape[2] != 3:
+            raise ValueError(f"Unsupported image array shape: {image.shape}")
+        return np.ascontiguousarray(image, dtype=np.uint8)
+
+    raise TypeError(f"Unsupported image type: {type(image).__name__}")
+
+def _describe(image: ImageInput) -> str:
+    if isinstance(image, str):
+        return image
+    if isinstance(image, np.ndarray):
+        return f"array{image.shape}"
+    return f"{type(image).__name__} image"
+
+def _parse_lines(lines) -> OCRResult:
     """
-    Run OCR on a given image file.
+    Turn PaddleOCR's per-image output (list of [box, (text, confidence)]) into our result tuple.
+    """
+    full_text = []
+    text_with_conf = []
+
+    # PaddleOCR returns None for a page without any detected text
+    for line in lines or []:
+        text, confidence = line[1][0], line[1][1]
+        full_text.append(text)
+        text_with_conf.append((text, confidence))
+
+    combined_text = " ".join(full_text)
+    return combined_text, text_with_conf
+
+def _sorted_boxes(boxes: List) -> List:
+    """
+    Sort detected boxes top-to-bottom, then left-to-right within a line
+    (mirrors PaddleOCR's own reading order).
+    """
+    boxes = sorted(boxes, key=lambda b: (b[0][1], b[0][0]))
+    for i in range(len(boxes) - 1):
+        for j in range(i, -1, -1):
+            same_line = abs(boxes[j + 1][0][1] - boxes[j][0][1]) < 10
+            if same_line and boxes[j + 1][0][0] < boxes[j][0][0]:
+                boxes[j], boxes[j + 1] = boxes[j + 1], boxes[j]
+            else:
+                break
+    return boxes
+
+def _crop_box(image: np.ndarray, box: List) -> np.ndarray:
+    """
+    Perspective-crop one detected text quadrilateral, rotating tall crops upright.
+    """
+    import cv2
+
+    points = np.array(box, dtype=np.float32)
+    width = int(max(np.linalg.norm(points[0] - points[1]), np.linalg.norm(points[2] - points[3])))
+    height = int(max(np.linalg.norm(points[0] - points[3]), np.linalg.norm(points[1] - points[2])))
+    width, height = max(width, 1), max(height, 1)
+
+    target = np.array([[0, 0], [width, 0], [width, height], [0, height]], dtype=np.float32)
+    matrix = cv2.getPerspectiveTransform(points, target)
+    crop = cv2.warpPerspective(
+        image, matrix, (width, height),
+        borderMode=cv2.BORDER_REPLICATE, flags=cv2.INTER_CUBIC,
+    )
+    if crop.shape[0] / crop.shape[1] >= 1.5:
+        crop = np.ascontiguousarray(np.rot90(crop))
+    return crop
+
+def run_ocr(image: ImageInput) -> OCRResult:
+    """
+    Run OCR on an image file path or an already decoded image.
 
     Args:
-        image_path (str): Path to the image file.
+        image (str | PIL.Image | np.ndarray): Path to the image file, a PIL image,
+            or a BGR/grayscale NumPy array.
 
     Returns:
         Tuple:
             - str: Combined text from the OCR output.
             - List[Tuple[str, float]]: List of (text, confidence) tuples.
     """
-    if not os.path.exists(image_path):
-        raise FileNotFoundError(f"Image not found: {image_path}")
+    # Paths are read by PaddleOCR itself; decoded images are handed over as arrays
+    if isinstance(image, str):
+        if not os.path.exists(image):
+            raise FileNotFoundError(f"Image not found: {image}")
+        ocr_input = image
+    else:
+        ocr_input = _to_bgr_array(image)
 
     try:
-        result = ocr_model.ocr(image_path, cls=True)
-        full_text = []
-        text_with_conf = []
-
-        # OCR returns a nested list of boxes
-        for line in result[0]:
-            text, confidence = line[1][0], line[1][1]
-            full_text.append(text)
-            text_with_conf.append((text, confidence))
-
-        combined_text = " ".join(full_text)
-        return combined_text, text_with_conf
+        result = get_ocr_model().ocr(ocr_input, cls=USE_ANGLE_CLS)
+        return _parse_lines(result[0])
 
     except Exception as e:
-        logger.error(f"OCR failed on {image_path}: {str(e)}")
+        logger.error(f"OCR failed on {_describe(image)}: {str(e)}")
         raise RuntimeError("OCR processing error.") from e
 
-def run_ocr_from_pil(image: Image.Image) -> Tuple[str, List[Tuple[str, float]]]:
+def run_ocr_from_pil(image: Image.Image) -> OCRResult:
     """
     Run OCR on a PIL image directly (used when image is uploaded in-memory).
 
@@ -59,12 +169,43 @@ def run_ocr_from_pil(image: Image.Image) -> Tuple[str, List[Tuple[str, float]]]:
             - str: Combined extracted text.
             - List[Tuple[str, float]]: List of (text, confidence) tuples.
     """
+    return run_ocr(image)
+
+def run_ocr_batch(images: Sequence[ImageInput]) -> List[OCRResult]:
+    """
+    Run OCR on many images through one detector and recognizer session.
+
+    Text regions are detected image by image, then the crops of every image are
+    angle-classified and recognized together, so the recognizer works on full
+    batches instead of a few lines per call.
+
+    Args:
+        images (Sequence): Paths, PIL images and/or BGR NumPy arrays.
+
+    Returns:
+        List[Tuple]: One (combined_text, [(text, confidence)]) tuple per input image, in order.
+    """
+    model = get_ocr_model()
+    arrays = [_to_bgr_array(image) for image in images]
+
+    crops = []
+    owners = []
     try:
-        temp_path = "temp_ocr_img.png"
-        image.save(temp_path)
-        output = run_ocr(temp_path)
-        os.remove(temp_path)
-        return output
+        for i, array in enumerate(arrays):
+            boxes = model.ocr(array, det=True, rec=False, cls=False)[0] or []
+            for box in _sorted_boxes(boxes):
+                crops.append(_crop_box(array, box))
+                owners.append(i)
+
+        recognized = model.ocr(crops, det=False, rec=True, cls=USE_ANGLE_CLS)[0] if crops else []
+
     except Exception as e:
-        logger.error(f"OCR failed on PIL image: {str(e)}")
-        raise RuntimeError("OCR from PIL failed.") from e
\ No newline at end of file
+        logger.error(f"Batch OCR failed on {len(arrays)} images: {str(e)}")
+        raise RuntimeError("OCR processing error.") from e
+
+    lines_per_image = [[] for _ in arrays]
+    for owner, (text, confidence) in zip(owners, recognized):
+        if confidence >= DROP_SCORE:
+            lines_per_image[owner].append((None, (text, confidence)))
+
+    return [_parse_lines(lines) for lines in lines_per_image]
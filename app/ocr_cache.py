@@ -0,0 +1,357 @@
+# app/ocr_cache.py
+
+import hashlib
+import io
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+OCRResult = Tuple[str, List[Tuple[str, float]]]
+
+_HASH_SIZE = 8
+_DCT_SIZE = 32
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    return np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+
+
+_DCT = _dct_matrix(_DCT_SIZE)
+
+
+def perceptual_hash(image: Image.Image) -> int:
+    """
+    64-bit DCT perceptual hash (pHash) of an image.
+
+    Recompressed, rescaled or lightly re-cropped copies of the same page land within
+    a few bits of each other in Hamming distance.
+
+    Args:
+        image (PIL.Image): Decoded image.
+
+    Returns:
+        int: Unsigned 64-bit hash.
+    """
+    # reducing_gap shrinks large photos with a cheap box reduce before resampling
+    gray = image.resize((_DCT_SIZE, _DCT_SIZE), Image.LANCZOS, reducing_gap=3.0).convert("L")
+    pixels = np.asarray(gray, dtype=np.float64)
+    low_freq = (_DCT @ pixels @ _DCT.T)[:_HASH_SIZE, :_HASH_SIZE]
+    bits = (low_freq > np.median(low_freq)).flatten()
+
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+_BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount64(values: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):  # NumPy 2
+        return np.bitwise_count(values)
+    return _BYTE_POPCOUNT[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class _PHashIndex:
+    """
+    digest -> 64-bit pHash, searched by Hamming distance in one vectorized pass over
+    a uint64 array (freed slots are reused).
+    """
+
+    def __init__(self):
+        self._hashes = np.zeros(64, dtype=np.uint64)
+        self._live = np.zeros(64, dtype=bool)
+        self._digests: List[Optional[str]] = []
+        self._slots: Dict[str, int] = {}
+        self._free: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self._slots
+
+    def add(self, digest: str, phash: int):
+        slot = self._slots.get(digest)
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+            else:
+                slot = len(self._digests)
+                self._digests.append(None)
+                if slot == len(self._hashes):
+                    self._hashes = np.concatenate([self._hashes, np.zeros_like(self._hashes)])
+                    self._live = np.concatenate([self._live, np.zeros_like(self._live)])
+            self._slots[digest] = slot
+            self._digests[slot] = digest
+            self._live[slot] = True
+        self._hashes[slot] = phash
+
+    def discard(self, digest: str):
+        slot = self._slots.pop(digest, None)
+        if slot is not None:
+            self._digests[slot] = None
+            self._live[slot] = False
+            self._free.append(slot)
+
+    def nearest(self, phash: int) -> Tuple[Optional[str], int]:
+        """
+        The digest with the closest hash and its distance ((None, 65) when empty).
+        """
+        if not self._slots:
+            return None, 65
+        used = len(self._digests)
+        distances = np.where(self._live[:used], _popcount64(self._hashes[:used] ^ np.uint64(phash)), 65)
+        slot = int(distances.argmin())
+        return self._digests[slot], int(distances[slot])
+
+
+class OCRCacheKey(NamedTuple):
+    digest: str   # SHA-256 of the exact upload bytes
+    phash: int    # perceptual hash of the decoded image
+
+
+class OCRCache:
+    """
+    Content-addressed cache for OCR results.
+
+    Lookups try the SHA-256 of the exact bytes first, then the nearest perceptual hash
+    within `phash_threshold` bits. Results live in a bounded in-memory LRU and,
+    optionally, in an SQLite file that survives restarts. The disk tier is bounded
+    too: beyond `max_disk_entries` the rows least recently written or read from disk
+    are deleted.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 2048,
+        disk_path: Optional[str] = None,
+        phash_threshold: int = 4,
+        max_disk_entries: int = 100_000,
+    ):
+        """
+        Args:
+            max_entries (int): Capacity of the in-memory LRU tier.
+            disk_path (str): SQLite file for the persistent tier (disabled if None).
+            phash_threshold (int): Max Hamming distance (of 64 bits) to treat two images as the same page.
+                Printed pages look alike at low resolution, so keep this small.
+            max_disk_entries (int): Capacity of the disk tier; it is trimmed to 90% when exceeded.
+        """
+        self.max_entries = max_entries
+        self.phash_threshold = phash_threshold
+        self.disk_path = disk_path
+        self.max_disk_entries = max_disk_entries
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[int, OCRResult]]" = OrderedDict()
+        self._memory_phashes = _PHashIndex()
+        self._disk_phashes = _PHashIndex()
+        self._counters = {
+            "exact_hits": 0,
+            "near_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "disk_evictions": 0,
+        }
+
+        self._db = None
+        if disk_path:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            self._db = self._connect()
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS ocr_cache ("
+                "digest TEXT PRIMARY KEY, phash INTEGER NOT NULL, result TEXT NOT NULL, "
+                "last_access REAL NOT NULL DEFAULT 0)"
+            )
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(ocr_cache)")]
+            if "last_access" not in columns:  # files written before the disk tier was bounded
+                self._db.execute("ALTER TABLE ocr_cache ADD COLUMN last_access REAL NOT NULL DEFAULT 0")
+            self._db.execute("CREATE INDEX IF NOT EXISTS ocr_cache_last_access ON ocr_cache (last_access)")
+            self._db.commit()
+            # Only the hashes are kept in memory; results are read on demand
+            for digest, phash in self._db.execute("SELECT digest, phash FROM ocr_cache"):
+                self._disk_phashes.add(digest, phash & 0xFFFFFFFFFFFFFFFF)
+            self._trim_disk()
+            logger.info(f"OCR cache loaded {len(self._disk_phashes)} entries from {disk_path}")
+
+    @staticmethod
+    def make_key(image_bytes: bytes, image: Optional[Image.Image] = None) -> OCRCacheKey:
+        """
+        Compute the cache key for an upload.
+
+        Args:
+            image_bytes (bytes): Raw uploaded bytes.
+            image (PIL.Image): Already decoded image, to avoid decoding twice.
+        """
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        if image is None:
+            image = Image.open(io.BytesIO(image_bytes))
+        return OCRCacheKey(digest, perceptual_hash(image))
+
+    def get(self, key: OCRCacheKey) -> Optional[OCRResult]:
+        """
+        Look up an OCR result by exact digest, then by nearest perceptual hash.
+        """
+        with self._lock:
+            entry = self._memory.get(key.digest)
+            if entry is not None:
+                self._memory.move_to_end(key.digest)
+                self._counters["exact_hits"] += 1
+                return entry[1]
+
+            if key.digest in self._disk_phashes:
+                result = self._read_disk(key.digest)
+                if result is not None:
+                    self._counters["exact_hits"] += 1
+                    self._counters["disk_hits"] += 1
+                    self._remember(key.digest, key.phash, result)
+                    return result
+
+            digest, in_memory = self._nearest(key.phash)
+            if digest is not None:
+                result = self._memory[digest][1] if in_memory else self._read_disk(digest)
+                if result is not None:
+                    self._counters["near_hits"] += 1
+                    if not in_memory:
+                        self._counters["disk_hits"] += 1
+                    # Alias the exact bytes too, so the next identical upload is an exact hit
+                    self._remember(key.digest, key.phash, result)
+                    return result
+
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, key: OCRCacheKey, result: OCRResult):
+        """
+        Store an OCR result in memory and, if enabled, on disk.
+        """
+        combined_text, lines = result
+        result = (combined_text, [(text, float(conf)) for text, conf in lines])
+        with self._lock:
+            self._remember(key.digest, key.phash, result)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO ocr_cache (digest, phash, result, last_access) VALUES (?, ?, ?, ?)",
+                    (key.digest, _to_signed64(key.phash), json.dumps(result, ensure_ascii=False), time.time()),
+                )
+                self._db.commit()
+                self._disk_phashes.add(key.digest, key.phash)
+                if len(self._disk_phashes) > self.max_disk_entries:
+                    self._trim_disk()
+
+    def get_or_compute(
+        self,
+        image_bytes: bytes,
+        image: Image.Image,
+        compute: Callable[[Image.Image], OCRResult],
+    ) -> OCRResult:
+        """
+        Return the cached OCR result for an upload, running `compute(image)` on a miss.
+        """
+        key = self.make_key(image_bytes, image)
+        result = self.get(key)
+        if result is None:
+            result = compute(image)
+            self.put(key, result)
+        return result
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_entries"] = len(self._disk_phashes)
+        lookups = stats["exact_hits"] + stats["near_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["exact_hits"] + stats["near_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def reopen(self):
+        """
+        Reconnect the disk tier in a forked worker: an SQLite connection must not be
+        used across fork, so each process needs its own.
+        """
+        self._lock = threading.Lock()
+        if self.disk_path:
+            self._db = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.disk_path, check_same_thread=False)
+
+    def _remember(self, digest: str, phash: int, result: OCRResult):
+        self._memory[digest] = (phash, result)
+        self._memory.move_to_end(digest)
+        self._memory_phashes.add(digest, phash)
+        while len(self._memory) > self.max_entries:
+            evicted, _ = self._memory.popitem(last=False)
+            self._memory_phashes.discard(evicted)
+            self._counters["evictions"] += 1
+
+    def _nearest(self, phash: int) -> Tuple[Optional[str], bool]:
+        memory_digest, memory_distance = self._memory_phashes.nearest(phash)
+        disk_digest, disk_distance = self._disk_phashes.nearest(phash)
+        if memory_distance <= min(disk_distance, self.phash_threshold):
+            return memory_digest, True
+        if disk_distance <= self.phash_threshold:
+            return disk_digest, False
+        return None, False
+
+    def _read_disk(self, digest: str) -> Optional[OCRResult]:
+        """
+        Read a disk-tier result and mark it as recently used.
+        """
+        if self._db is None:
+            return None
+        row = self._db.execute("SELECT result FROM ocr_cache WHERE digest = ?", (digest,)).fetchone()
+        if row is None:
+            # Trimmed by another worker sharing the file
+            self._disk_phashes.discard(digest)
+            return None
+        self._db.execute("UPDATE ocr_cache SET last_access = ? WHERE digest = ?", (time.time(), digest))
+        self._db.commit()
+        combined_text, lines = json.loads(row[0])
+        return combined_text, [(text, conf) for text, conf in lines]
+
+    def _trim_disk(self):
+        """
+        Delete the least recently used disk rows beyond 90% of max_disk_entries. The file
+        may be shared by several workers, so the rows to keep are decided by the file.
+        """
+        if self._db is None or len(self._disk_phashes) <= self.max_disk_entries:
+            return
+        keep = int(self.max_disk_entries * 0.9)
+        victims = [row[0] for row in self._db.execute(
+            "SELECT digest FROM ocr_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?", (keep,)
+        )]
+        self._db.executemany("DELETE FROM ocr_cache WHERE digest = ?", [(digest,) for digest in victims])
+        self._db.commit()
+        for digest in victims:
+            self._disk_phashes.discard(digest)
+        self._counters["disk_evictions"] += len(victims)
+        logger.info(f"OCR cache disk tier trimmed by {len(victims)} entries")
+
+
+def _to_signed64(value: int) -> int:
+    # SQLite INTEGER is signed 64-bit
+    return value - (1 << 64) if value >= (1 << 63) else value
@@ -0,0 +1,141 @@
+# app/pipeline.py
+
+import asyncio
+import functools
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StagePool:
+    """
+    Bounded executor for one stage of the /solve pipeline.
+
+    Blocking callables run on the stage's executor; coroutine functions (remote I/O)
+    are awaited directly on the event loop. Either way at most `max_concurrency`
+    calls of this stage are in flight at once.
+    """
+
+    def __init__(self, name: str, executor: Optional[Executor], max_concurrency: int):
+        """
+        Args:
+            name (str): Stage label (used in logs and stats).
+            executor (Executor): Process/thread pool for blocking work, or None for async-only stages.
+            max_concurrency (int): Maximum number of in-flight calls.
+        """
+        if max_concurrency < 1:
+            raise ValueError(f"max_concurrency for stage '{name}' must be >= 1")
+
+        self.name = name
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the event loop that actually serves requests
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run `fn(*args, **kwargs)` inside this stage's concurrency limit.
+        """
+        async with self.semaphore:
+            self.in_flight += 1
+            try:
+                if asyncio.iscoroutinefunction(fn):
+                    return await fn(*args, **kwargs)
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+            finally:
+                self.in_flight -= 1
+
+    async def stream(self, fn: Callable[..., AsyncIterator], *args, **kwargs) -> AsyncIterator:
+        """
+        Iterate the async generator `fn(*args, **kwargs)`, holding one of this stage's
+        concurrency slots until it is exhausted.
+        """
+        async with self.semaphore:
+            self.in_flight += 1
+            iterator = fn(*args, **kwargs)
+            try:
+                async for item in iterator:
+                    yield item
+            finally:
+                self.in_flight -= 1
+                # Closed right away when the consumer stops early, so the producer stops too
+                aclose = getattr(iterator, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+
+    def shutdown(self, wait: bool = True):
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"max_concurrency": self.max_concurrency, "in_flight": self.in_flight}
+
+
+class SolvePipeline:
+    """
+    Staged worker pools for the /solve pipeline, so the event loop only orchestrates:
+
+        - ocr:    process pool for PaddleOCR (CPU-bound, holds the GIL)
+        - encode: thread pool for torch text/image embedding
+        - search: thread pool for FAISS search
+        - llm:    async I/O for remote backends, thread pool for local models
+    """
+
+    def __init__(
+        self,
+        ocr_workers: int = 1,
+        encode_workers: int = 2,
+        search_workers: int = 2,
+        llm_concurrency: int = 8,
+        ocr_initializer: Optional[Callable] = None,
+    ):
+        """
+        Args:
+            ocr_workers (int): OCR processes (and in-flight OCR calls).
+            encode_workers (int): Embedding threads (and in-flight encode calls).
+            search_workers (int): FAISS search threads (and in-flight searches).
+            llm_concurrency (int): In-flight LLM generations.
+            ocr_initializer (Callable): Run once in each OCR process, e.g. to load PaddleOCR.
+        """
+        self.ocr = StagePool(
+            "ocr",
+            ProcessPoolExecutor(max_workers=ocr_workers, initializer=ocr_initializer),
+            ocr_workers,
+        )
+        self.encode = StagePool(
+            "encode",
+            ThreadPoolExecutor(max_workers=encode_workers, thread_name_prefix="encode"),
+            encode_workers,
+        )
+        self.search = StagePool(
+            "search",
+            ThreadPoolExecutor(max_workers=search_workers, thread_name_prefix="search"),
+            search_workers,
+        )
+        self.llm = StagePool(
+            "llm",
+            ThreadPoolExecutor(max_workers=llm_concurrency, thread_name_prefix="llm"),
+            llm_concurrency,
+        )
+
+    @property
+    def stages(self) -> Dict[str, StagePool]:
+        return {"ocr": self.ocr, "encode": self.encode, "search": self.search, "llm": self.llm}
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: stage.stats() for name, stage in self.stages.items()}
+
+    def shutdown(self, wait: bool = True):
+        for stage in self.stages.values():
+            stage.shutdown(wait=wait)
+        logger.info("Pipeline worker pools shut down.")
@@ -0,0 +1,227 @@
+# app/prefork.py
+
+import gc
+import logging
+import os
+import re
+import signal
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+_SMAPS_LINE = re.compile(r"^(\w+):\s+(\d+) kB$", re.MULTILINE)
+
+
+def parse_smaps(text: str) -> Dict[str, int]:
+    """
+    Sum the "<Field>: <n> kB" lines of /proc/<pid>/smaps or smaps_rollup, in bytes.
+    """
+    totals: Dict[str, int] = {}
+    for field, kb in _SMAPS_LINE.findall(text):
+        totals[field] = totals.get(field, 0) + int(kb) * 1024
+    return totals
+
+
+def read_smaps_rollup(pid: Optional[int] = None) -> Dict[str, int]:
+    """
+    Memory counters of a process from /proc (Linux). Empty where /proc is unavailable.
+    """
+    pid = pid or os.getpid()
+    # smaps_rollup (Linux 4.14+) is the pre-summed, much cheaper form of smaps
+    for name in ("smaps_rollup", "smaps"):
+        try:
+            with open(f"/proc/{pid}/{name}", encoding="ascii", errors="replace") as f:
+                return parse_smaps(f.read())
+        except FileNotFoundError:
+            continue
+    return {}
+
+
+def process_memory(pid: Optional[int] = None) -> Dict[str, int]:
+    """
+    Memory of one process, in bytes:
+
+        - rss:    resident pages, counting shared pages in full
+        - pss:    proportional share (a page mapped by n processes counts 1/n); sums to the host total
+        - unique: pages mapped by this process only (private), i.e. what another worker adds
+        - shared: resident pages also mapped by other processes (preloaded models, mmap-ed index)
+    """
+    smaps = read_smaps_rollup(pid)
+    if not smaps:
+        return {}
+    return {
+        "rss": smaps.get("Rss", 0),
+        "pss": smaps.get("Pss", 0),
+        "unique": smaps.get("Private_Clean", 0) + smaps.get("Private_Dirty", 0),
+        "shared": smaps.get("Shared_Clean", 0) + smaps.get("Shared_Dirty", 0),
+        "swap": smaps.get("Swap", 0),
+    }
+
+
+def memory_report(pids: Dict[str, int]) -> Dict[str, object]:
+    """
+    process_memory() of several labelled processes plus host-level totals.
+
+    Args:
+        pids (Dict[str, int]): Label -> pid, e.g. {"launcher": 100, "worker-0": 101}.
+
+    Returns:
+        Dict: "processes" (label -> counters, with "pid"), "total_pss" (real footprint of
+              the group), "total_rss" and "worker_unique_mean" (cost of one more worker).
+    """
+    processes = {}
+    for label, pid in pids.items():
+        memory = process_memory(pid)
+        if memory:
+            processes[label] = {"pid": pid, **memory}
+    workers = [m for label, m in processes.items() if label.startswith("worker")]
+    return {
+        "processes": processes,
+        "total_rss": sum(m["rss"] for m in processes.values()),
+        "total_pss": sum(m["pss"] for m in processes.values()),
+        "worker_unique_mean": sum(m["unique"] for m in workers) / len(workers) if workers else 0,
+    }
+
+
+def _mb(num_bytes: float) -> str:
+    return f"{num_bytes / 2**20:.0f}MB"
+
+
+class PreforkSupervisor:
+    """
+    Fork `num_workers` copies of the current process and keep them running.
+
+    Whatever the process loaded before run() (models, memory-mapped index, corpus) is
+    shared copy-on-write by every worker. A worker that dies is replaced; SIGTERM/SIGINT
+    (or stop()) forwards SIGTERM to the workers and waits for them to drain.
+    """
+
+    def __init__(
+        self,
+        worker_fn: Callable[[int], None],
+        num_workers: int,
+        graceful_timeout: float = 30.0,
+        restart_delay: float = 1.0,
+        memory_report_interval: float = 60.0,
+    ):
+        """
+        Args:
+            worker_fn (Callable): Runs in each forked worker with its index; the worker exits when it returns.
+            num_workers (int): Worker processes to keep alive.
+            graceful_timeout (float): Seconds workers get to finish after SIGTERM before SIGKILL.
+            restart_delay (float): Pause before replacing a dead worker (avoids a tight crash loop).
+            memory_report_interval (float): Seconds between memory reports in the log (0 disables).
+        """
+        if num_workers < 1:
+            raise ValueError("num_workers must be >= 1")
+        self.worker_fn = worker_fn
+        self.num_workers = num_workers
+        self.graceful_timeout = graceful_timeout
+        self.restart_delay = restart_delay
+        self.memory_report_interval = memory_report_interval
+
+        self.workers: Dict[int, int] = {}  # pid -> worker index
+        self.restarts = 0
+        self._stopping = threading.Event()
+
+    def run(self, install_signal_handlers: bool = True):
+        """
+        Fork the workers and supervise them until stop(). Blocks.
+        """
+        if install_signal_handlers:
+            signal.signal(signal.SIGTERM, lambda *_: self.stop())
+            signal.signal(signal.SIGINT, lambda *_: self.stop())
+
+        # Objects that exist now are never touched by the collector again, so a worker's
+        # GC passes do not write to (and un-share) the launcher's pages
+        gc.collect()
+        gc.freeze()
+
+        for index in range(self.num_workers):
+            self._spawn(index)
+        logger.info(f"Started {self.num_workers} workers: {sorted(self.workers)}")
+
+        next_report = time.monotonic() + self.memory_report_interval
+        while not self._stopping.is_set():
+            self._reap(respawn=True)
+            if self.memory_report_interval and time.monotonic() >= next_report:
+                self.log_memory()
+                next_report = time.monotonic() + self.memory_report_interval
+            self._stopping.wait(0.2)
+        self._shutdown()
+
+    def stop(self):
+        self._stopping.set()
+
+    def memory_report(self) -> Dict[str, object]:
+        pids = {"launcher": os.getpid()}
+        pids.update({f"worker-{index}": pid for pid, index in sorted(self.workers.items(), key=lambda w: w[1])})
+        return memory_report(pids)
+
+    def log_memory(self):
+        report = self.memory_report()
+        for label, m in report["processes"].items():
+            logger.info(
+                f"{label} pid={m['pid']} rss={_mb(m['rss'])} pss={_mb(m['pss'])} "
+                f"unique={_mb(m['unique'])} shared={_mb(m['shared'])}"
+            )
+        logger.info(
+            f"total pss={_mb(report['total_pss'])} (rss sum {_mb(report['total_rss'])}), "
+            f"{_mb(report['worker_unique_mean'])} unique per worker"
+        )
+
+    def _spawn(self, index: int):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                self.worker_fn(index)
+            except BaseException:
+                logger.exception(f"Worker {index} crashed")
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers[pid] = index
+
+    def _reap(self, respawn: bool):
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            index = self.workers.pop(pid, None)
+            if index is None:
+                continue
+            if not respawn or self._stopping.is_set():
+                continue
+            logger.warning(f"Worker {index} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+            self.restarts += 1
+            if self._stopping.wait(self.restart_delay):
+                return
+            self._spawn(index)
+
+    def _shutdown(self):
+        logger.info(f"Stopping {len(self.workers)} workers")
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            self._reap(respawn=False)
+            time.sleep(0.05)
+        for pid in list(self.workers):
+            logger.warning(f"Worker pid {pid} did not stop in {self.graceful_timeout}s, killing it")
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        self.workers.clear()
@@ -0,0 +1,232 @@
+# app/prompts/composer.py
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Set
+
+from prompts.cot_templates import generate_prompt_cot, get_prompt_prefix
+
+# Closing lines of get_prompt_suffix, around the question
+QUESTION_HEADER = "Now solve this problem:\n"
+QUESTION_FOOTER = "Let's think step by step:"
+TRUNCATION_MARK = " …"
+
+_WORD = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+# Places where a long solution can be cut without splitting a step
+_BREAKS = re.compile(r"\n+|(?<=[.;!?])\s+")
+
+
+def _shingles(text: str, n: int = 3) -> Set[tuple]:
+    words = _WORD.findall(text.lower())
+    if len(words) < n:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+def jaccard(a: Set[tuple], b: Set[tuple]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class ComposedPrompt(NamedTuple):
+    prompt: str
+    # Token counts per section, kept/dropped/truncated examples, budget
+    metadata: Dict[str, Any]
+
+
+class PromptComposer:
+    """
+    Builds the CoT prompt of generate_prompt_cot under a token budget.
+
+    The static prefix and the question are always kept. Retrieved examples are then
+    considered in descending retrieval score: near-duplicates of an example already
+    kept are dropped, solutions longer than `max_example_tokens` are cut at a line or
+    sentence boundary, and examples are added while they fit in what is left of the
+    budget. The result is exactly generate_prompt_cot over the kept examples, so the
+    local model's prefix cache still matches.
+
+    Token counts come from `count_tokens` (the backend's tokenizer). Template segments
+    are counted once and cached; counts of retrieved examples, which recur across
+    requests, are kept in a bounded LRU. Section counts are summed per segment, which
+    can differ from tokenizing the whole prompt by a token or two at each boundary.
+    """
+
+    def __init__(
+        self,
+        count_tokens: Callable[[str], int],
+        token_budget: Optional[int] = None,
+        max_example_tokens: Optional[int] = 384,
+        min_example_tokens: int = 48,
+        dedup_threshold: float = 0.8,
+        cache_size: int = 4096,
+    ):
+        """
+        Args:
+            count_tokens (Callable): Token count of a string under the backend's tokenizer.
+            token_budget (int): Maximum prompt tokens (None: no overall limit).
+            max_example_tokens (int): Longer retrieved examples are truncated (None: never).
+            min_example_tokens (int): A truncated example shorter than this is dropped instead.
+            dedup_threshold (float): Word-trigram Jaccard similarity above which an example
+                counts as a near-duplicate of one already kept.
+            cache_size (int): Example token counts kept in the LRU.
+        """
+        self.count_tokens = count_tokens
+        self.token_budget = token_budget
+        self.max_example_tokens = max_example_tokens
+        self.min_example_tokens = min_example_tokens
+        self.dedup_threshold = dedup_threshold
+        self.cache_size = cache_size
+
+        self._lock = threading.Lock()
+        self._segments: Dict[str, int] = {}
+        self._examples: "OrderedDict[str, int]" = OrderedDict()
+
+    def segment_tokens(self, text: str) -> int:
+        """
+        Token count of a fixed template segment (prefix, headers), computed once.
+        """
+        count = self._segments.get(text)
+        if count is None:
+            count = self.count_tokens(text)
+            with self._lock:
+                self._segments[text] = count
+        return count
+
+    def text_tokens(self, text: str) -> int:
+        with self._lock:
+            count = self._examples.get(text)
+            if count is not None:
+                self._examples.move_to_end(text)
+                return count
+        count = self.count_tokens(text)
+        with self._lock:
+            self._examples[text] = count
+            if len(self._examples) > self.cache_size:
+                self._examples.popitem(last=False)
+        return count
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        Longest prefix of `text` within max_tokens (mark included), cut at a line or
+        sentence boundary when one is available, else at a word boundary.
+        """
+        if self.text_tokens(text) <= max_tokens:
+            return text
+        limit = max_tokens - self.segment_tokens(TRUNCATION_MARK)
+        if limit <= 0:
+            return ""
+
+        # Largest character prefix within the limit (binary search: O(log n) tokenizer calls)
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.count_tokens(text[:mid]) <= limit:
+                low = mid
+            else:
+                high = mid - 1
+        if low == 0:
+            return ""
+
+        cut = low
+        breaks = [m.start() for m in _BREAKS.finditer(text, 0, low)]
+        # Only back off to a step boundary if it keeps most of what fits
+        if breaks and breaks[-1] >= low // 2:
+            cut = breaks[-1]
+        elif low < len(text) and not text[low].isspace():
+            space = text.rfind(" ", 0, low)
+            cut = space if space > 0 else low
+        return text[:cut].rstrip() + TRUNCATION_MARK
+
+    def compose(
+        self,
+        user_question: str,
+        retrieved_examples: Sequence[str],
+        category: str = "",
+        scores: Optional[Sequence[float]] = None,
+    ) -> ComposedPrompt:
+        """
+        Args:
+            user_question (str): The math problem provided by the user.
+            retrieved_examples (List[str]): Retrieved problems with solutions.
+            category (str): CoT template category.
+            scores (List[float]): Retrieval score per example, higher is better
+                (default: the given order is the ranking).
+
+        Returns:
+            ComposedPrompt: The prompt and its composition metadata.
+        """
+        examples = [e.strip() for e in retrieved_examples or []]
+        if scores is None:
+            order = list(range(len(examples)))
+        else:
+            order = sorted(range(len(examples)), key=lambda i: -scores[i])
+
+        prefix_tokens = self.segment_tokens(get_prompt_prefix(category))
+        question_tokens = (
+            self.segment_tokens(QUESTION_HEADER)
+            + self.text_tokens(user_question.strip())
+            + self.segment_tokens("\n" + QUESTION_FOOTER)
+        )
+        fixed = prefix_tokens + question_tokens
+        remaining = None if self.token_budget is None else self.token_budget - fixed
+
+        kept: List[str] = []
+        kept_shingles: List[Set[tuple]] = []
+        example_tokens = 0
+        duplicates, over_budget, truncated, empty = [], [], [], []
+        for i in order:
+            text = examples[i]
+            if not text:
+                empty.append(i)
+                continue
+            shingles = _shingles(text)
+            if any(jaccard(shingles, other) >= self.dedup_threshold for other in kept_shingles):
+                duplicates.append(i)
+                continue
+
+            header = self.segment_tokens(f"Example {len(kept) + 1}:\n") + self.segment_tokens("\n\n")
+            limit = self.max_example_tokens
+            if remaining is not None:
+                available = remaining - header
+                limit = available if limit is None else min(limit, available)
+
+            tokens = self.text_tokens(text)
+            if limit is not None and tokens > limit:
+                text = self.truncate(text, limit) if limit >= self.min_example_tokens else ""
+                if not text:
+                    over_budget.append(i)
+                    continue
+                truncated.append(i)
+                tokens = self.count_tokens(text)
+
+            kept.append(text)
+            kept_shingles.append(shingles)
+            example_tokens += header + tokens
+            if remaining is not None:
+                remaining -= header + tokens
+
+        prompt = generate_prompt_cot(user_question, kept, category)
+        metadata = {
+            "token_budget": self.token_budget,
+            "tokens": {
+                "prefix": prefix_tokens,
+                "examples": example_tokens,
+                "question": question_tokens,
+                "total": fixed + example_tokens,
+            },
+            "examples_given": len(examples),
+            "examples_kept": len(kept),
+            "dropped_duplicates": duplicates,
+            "dropped_over_budget": over_budget,
+            "dropped_empty": empty,
+            "truncated": truncated,
+            # The prefix and question alone do not fit; they are sent anyway
+            "over_budget": self.token_budget is not None and fixed > self.token_budget,
+        }
+        return ComposedPrompt(prompt, metadata)
+
+    def cache_info(self) -> Dict[str, int]:
+        with self._lock:
+            return {"segments": len(self._segments), "examples": len(self._examples)}
@@ -1,5 +1,7 @@
 # app/prompts/cot_templates.py
 
+import hashlib
+import json
 from typing import List
 
 COT_TEMPLATES = {
@@ -48,19 +50,19 @@ def get_few_shot_examples(category: str = "algebra", n: int = 2) -> str:
 
 
 
-def generate_prompt_cot(user_question: str, retrieved_examples: List[str], category: str = "") -> str:
+def get_prompt_prefix(category: str = "") -> str:
     """
-    Generate a CoT (Chain-of-Thought) prompt from the user's question and retrieved examples.
+    Static part of the CoT prompt: intro plus the category's few-shot block.
+
+    It depends only on the category, so a local model can compute its key/value cache once
+    and reuse it for every request (see LLMEngine).
 
     Args:
-        user_question (str): The math problem provided by the user.
-        retrieved_examples (List[str]): Similar math problems and solutions retrieved from the index.
         category (str): (Optional) Category such as "Algebra", "Geometry", etc.
 
     Returns:
-        str: Prompt formatted for LLM with examples and reasoning instructions.
+        str: Prompt prefix, ending right before the retrieved examples.
     """
-
     intro = (
         f"You are a Vietnamese high school math assistant. "
         f"Use step-by-step logical reasoning (chain-of-thought) to solve problems. "
@@ -70,19 +72,57 @@ def generate_prompt_cot(user_question: str, retrieved_examples: List[str], categ
 
     few_show_examples = get_few_shot_examples(category=category, n=2)
 
-    examples = ""
-    for i, example in enumerate(retrieved_examples, 1):
-        examples += f"Example {i}:\n{example.strip()}\n\n"
-
-    final_prompt = (
+    return (
         f"{intro}\n"
         "Example based on your problem category:\n"
         f"{few_show_examples}\n"
         "Example retrieved from database:\n"
+    )
+
+
+def get_prompt_suffix(user_question: str, retrieved_examples: List[str]) -> str:
+    """
+    Request-specific part of the CoT prompt: retrieved examples plus the question.
+
+    Args:
+        user_question (str): The math problem provided by the user.
+        retrieved_examples (List[str]): Similar math problems and solutions retrieved from the index.
+
+    Returns:
+        str: Prompt suffix, appended to get_prompt_prefix.
+    """
+    examples = ""
+    for i, example in enumerate(retrieved_examples or [], 1):
+        examples += f"Example {i}:\n{example.strip()}\n\n"
+
+    return (
         f"{examples}"
         "Now solve this problem:\n"
         f"{user_question.strip()}\n"
         "Let's think step by step:"
     )
 
-    return final_prompt
\ No newline at end of file
+
+def generate_prompt_cot(user_question: str, retrieved_examples: List[str], category: str = "") -> str:
+    """
+    Generate a CoT (Chain-of-Thought) prompt from the user's question and retrieved examples.
+
+    Args:
+        user_question (str): The math problem provided by the user.
+        retrieved_examples (List[str]): Similar math problems and solutions retrieved from the index.
+        category (str): (Optional) Category such as "Algebra", "Geometry", etc.
+
+    Returns:
+        str: Prompt formatted for LLM with examples and reasoning instructions.
+    """
+    return get_prompt_prefix(category) + get_prompt_suffix(user_question, retrieved_examples)
+
+
+def prompt_fingerprint() -> str:
+    """
+    Hash of the prompt template (few-shot examples and the prefix/suffix wording).
+    Changes whenever editing this module would change the prompt an LLM sees.
+    """
+    rendered = [generate_prompt_cot("{question}", ["{example}"], category) for category in ["", *COT_TEMPLATES]]
+    payload = json.dumps([COT_TEMPLATES, rendered], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
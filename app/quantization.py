@@ -0,0 +1,256 @@
+# app/quantization.py
+
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Iterable, Literal, Tuple
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+logger = logging.getLogger(__name__)
+
+PRECISION_MODES = Literal["fp32", "fp16", "bf16", "int8-dynamic", "int8-weight", "int4-weight"]
+
+# Modes that rewrite nn.Linear layers (and therefore only run on CPU)
+QUANTIZED_MODES = ("int8-dynamic", "int8-weight", "int4-weight")
+
+QUANTIZED_STATE_FILE = "quantized_state.pt"
+QUANTIZATION_CONFIG_FILE = "quantization_config.json"
+
+# Weight elements a weight-only layer dequantizes at once in forward (16 MB in float32),
+# instead of a float copy of the whole matrix per call
+DEQUANT_BLOCK_ELEMENTS = 1 << 22
+
+_scratch = threading.local()
+
+
+def load_dtype(precision: str) -> torch.dtype:
+    """
+    dtype the model is loaded in before any quantization is applied.
+
+    int8-dynamic needs float32 Linear layers; weight-only modes keep the remaining
+    (non-Linear) parameters and the activations in float32, which is fastest on CPU.
+    """
+    if precision == "fp16":
+        return torch.float16
+    if precision == "bf16":
+        return torch.bfloat16
+    if precision in ("fp32",) + QUANTIZED_MODES:
+        return torch.float32
+    raise ValueError(f"Unsupported precision mode: {precision}")
+
+
+def _scratch_buffer(numel: int, dtype: torch.dtype, device: torch.device) -> torch.Tensor:
+    """
+    Per-thread buffer shared by all weight-only layers, which run one at a time on a thread.
+    """
+    buffers = getattr(_scratch, "buffers", None)
+    if buffers is None:
+        buffers = _scratch.buffers = {}
+    buffer = buffers.get((dtype, device))
+    if buffer is None or buffer.numel() < numel:
+        buffer = buffers[(dtype, device)] = torch.empty(numel, dtype=dtype, device=device)
+    return buffer[:numel]
+
+
+class WeightOnlyLinear(nn.Module):
+    """
+    Linear layer storing int8 or packed int4 weights with per-group float scales.
+
+    Weights are dequantized to the activation dtype on the fly, so activations and
+    accumulation stay in floating point: RAM drops 4x (int8) or ~8x (int4) versus
+    float32, at the price of a dequantize per forward pass. forward() dequantizes
+    blocks of output rows into a reused buffer, so that price is compute only; the
+    precision benchmark reports it as dequant_ms per decode step.
+    """
+
+    def __init__(self, in_features: int, out_features: int, bits: int = 8, group_size: int = 128, bias: bool = True):
+        super().__init__()
+        if bits not in (4, 8):
+            raise ValueError("bits must be 4 or 8")
+        self.in_features = in_features
+        self.out_features = out_features
+        self.bits = bits
+        self.group_size = group_size if bits == 4 else in_features
+
+        n_groups = -(-in_features // self.group_size)
+        padded = n_groups * self.group_size
+        packed_cols = padded // 2 if bits == 4 else padded
+        self.register_buffer("qweight", torch.zeros(out_features, packed_cols, dtype=torch.uint8 if bits == 4 else torch.int8))
+        self.register_buffer("scales", torch.ones(out_features, n_groups, dtype=torch.float32))
+        if bias:
+            self.register_buffer("bias", torch.zeros(out_features, dtype=torch.float32))
+        else:
+            self.bias = None
+
+    @classmethod
+    def from_linear(cls, linear: nn.Linear, bits: int = 8, group_size: int = 128) -> "WeightOnlyLinear":
+        module = cls(linear.in_features, linear.out_features, bits, group_size, bias=linear.bias is not None)
+        weight = linear.weight.detach().float()
+
+        padded = module.scales.shape[1] * module.group_size
+        if padded != module.in_features:
+            weight = F.pad(weight, (0, padded - module.in_features))
+        grouped = weight.view(module.out_features, -1, module.group_size)
+
+        qmax = 2 ** (bits - 1) - 1
+        scales = grouped.abs().amax(dim=-1).clamp(min=1e-8) / qmax
+        q = torch.round(grouped / scales.unsqueeze(-1)).clamp(-qmax - 1, qmax).to(torch.int8)
+        q = q.view(module.out_features, padded)
+
+        if bits == 4:
+            # Two signed 4-bit values per byte: low nibble = even column, high nibble = odd column
+            q = (q + 8).to(torch.uint8)
+            q = q[:, 0::2] | (q[:, 1::2] << 4)
+
+        module.qweight.copy_(q)
+        module.scales.copy_(scales)
+        if linear.bias is not None:
+            module.bias.copy_(linear.bias.detach().float())
+        return module
+
+    @property
+    def padded_features(self) -> int:
+        return self.scales.shape[1] * self.group_size
+
+    def dequantize(self, dtype: torch.dtype = torch.float32) -> torch.Tensor:
+        out = torch.empty(self.out_features, self.padded_features, dtype=dtype, device=self.qweight.device)
+        return self._dequantize_rows(0, self.out_features, out)
+
+    def _dequantize_rows(self, start: int, stop: int, out: torch.Tensor) -> torch.Tensor:
+        """
+        Dequantize output rows [start, stop) into `out`, shaped (rows, padded_features).
+        """
+        rows = stop - start
+        q = self.qweight[start:stop]
+        if self.bits == 4:
+            pairs = out.view(rows, -1, 2)
+            pairs[..., 0].copy_((q & 0x0F).to(torch.int8) - 8)
+            pairs[..., 1].copy_((q >> 4).to(torch.int8) - 8)
+        else:
+            out.copy_(q)
+        out.view(rows, -1, self.group_size).mul_(self.scales[start:stop].to(out.dtype).unsqueeze(-1))
+        return out[:, :self.in_features]
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        bias = self.bias.to(x.dtype) if self.bias is not None else None
+        padded = self.padded_features
+        block = max(1, DEQUANT_BLOCK_ELEMENTS // padded)
+        buffer = _scratch_buffer(min(block, self.out_features) * padded, x.dtype, x.device)
+        if block >= self.out_features:
+            weight = self._dequantize_rows(0, self.out_features, buffer.view(self.out_features, padded))
+            return F.linear(x, weight, bias)
+
+        output = x.new_empty(*x.shape[:-1], self.out_features)
+        for start in range(0, self.out_features, block):
+            stop = min(start + block, self.out_features)
+            weight = self._dequantize_rows(start, stop, buffer[:(stop - start) * padded].view(-1, padded))
+            output[..., start:stop] = F.linear(x, weight, bias[start:stop] if bias is not None else None)
+        return output
+
+    def extra_repr(self) -> str:
+        return f"in_features={self.in_features}, out_features={self.out_features}, bits={self.bits}, group_size={self.group_size}"
+
+
+def _replace_linears(module: nn.Module, bits: int, group_size: int, skip: Tuple[str, ...], prefix: str = ""):
+    for name, child in module.named_children():
+        full_name = f"{prefix}.{name}" if prefix else name
+        if isinstance(child, nn.Linear) and not any(full_name.endswith(s) for s in skip):
+            setattr(module, name, WeightOnlyLinear.from_linear(child, bits, group_size))
+        else:
+            _replace_linears(child, bits, group_size, skip, full_name)
+
+
+def quantize_model(
+    model: nn.Module,
+    precision: str,
+    group_size: int = 128,
+    skip_modules: Iterable[str] = ("lm_head",),
+) -> nn.Module:
+    """
+    Apply a CPU quantization mode to a float model loaded with `load_dtype(precision)`.
+
+    Args:
+        model (nn.Module): Causal LM in float32.
+        precision (str): One of "int8-dynamic", "int8-weight", "int4-weight"; other modes are returned unchanged.
+        group_size (int): Columns sharing one scale for int4 weight-only quantization.
+        skip_modules (Iterable[str]): Linear layers kept in float (the output head is the most sensitive).
+
+    Returns:
+        nn.Module: The quantized model (in place for weight-only modes).
+    """
+    if precision == "int8-dynamic":
+        # int8 weights and int8 matmuls with activations quantized per batch at runtime
+        return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+    if precision in ("int8-weight", "int4-weight"):
+        bits = 8 if precision == "int8-weight" else 4
+        _replace_linears(model, bits, group_size, tuple(skip_modules))
+        return model
+    return model
+
+
+def save_quantized(model: nn.Module, tokenizer, path: str, precision: str, group_size: int = 128):
+    """
+    Save a quantized model so it can be reloaded without re-quantizing.
+    """
+    os.makedirs(path, exist_ok=True)
+    model.config.save_pretrained(path)
+    tokenizer.save_pretrained(path)
+    torch.save(model.state_dict(), os.path.join(path, QUANTIZED_STATE_FILE))
+    with open(os.path.join(path, QUANTIZATION_CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump({"precision": precision, "group_size": group_size}, f)
+    logger.info(f"Saved {precision} model to {path}")
+
+
+def is_quantized_checkpoint(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, QUANTIZATION_CONFIG_FILE))
+
+
+def load_quantized(path: str) -> Tuple[nn.Module, str]:
+    """
+    Reload a model written by save_quantized.
+
+    Returns:
+        Tuple: (model in eval mode on CPU, precision mode)
+    """
+    from transformers import AutoConfig, AutoModelForCausalLM
+    try:
+        from transformers.initialization import no_init_weights
+    except ImportError:  # transformers < 5
+        from transformers.modeling_utils import no_init_weights
+
+    with open(os.path.join(path, QUANTIZATION_CONFIG_FILE), encoding="utf-8") as f:
+        quant_config = json.load(f)
+    precision = quant_config["precision"]
+
+    config = AutoConfig.from_pretrained(path)
+    # Skip random init: every weight is overwritten by the saved state dict
+    with no_init_weights():
+        model = AutoModelForCausalLM.from_config(config, dtype=load_dtype(precision))
+    model = quantize_model(model, precision, group_size=quant_config.get("group_size", 128))
+
+    state_dict = torch.load(os.path.join(path, QUANTIZED_STATE_FILE), map_location="cpu")
+    model.load_state_dict(state_dict)
+    model.eval()
+    return model, precision
+
+
+@contextmanager
+def inference_context(precision: str, device: torch.device):
+    """
+    Context for forward passes/generation in a given precision mode.
+
+    bf16 on CPU runs under autocast so the few float32 buffers (rotary tables, norms)
+    don't force mixed-dtype matmuls back to float32.
+    """
+    autocast = (
+        torch.autocast(device_type="cpu", dtype=torch.bfloat16)
+        if precision == "bf16" and device.type == "cpu"
+        else nullcontext()
+    )
+    with torch.no_grad(), autocast:
+        yield
@@ -0,0 +1,199 @@
+# app/registry.py
+
+import asyncio
+import importlib
+import inspect
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PENDING, LOADING, LOADED, WARM, FAILED = "pending", "loading", "loaded", "warm", "failed"
+
+
+class _Component:
+    def __init__(self, name: str, factory: Callable[[], Any], warmup: Optional[Callable], close: Optional[Callable],
+                 required: bool, retry_interval: Optional[float]):
+        self.name = name
+        self.factory = factory
+        self.warmup = warmup
+        self.close = close
+        self.required = required
+        self.retry_interval = retry_interval
+        self.instance = None
+        self.state = PENDING
+        self.error: Optional[str] = None
+        self.failed_at: Optional[float] = None
+        self.warmup_error: Optional[str] = None
+        self.load_s: Optional[float] = None
+        self.warmup_s: Optional[float] = None
+        self.lock = threading.Lock()
+
+
+class ComponentRegistry:
+    """
+    Named service components that are created on first use.
+
+    Each component has a factory (called at most once, thread-safe), an optional
+    warm-up callable that runs one dummy inference, and an optional close callable.
+    A factory that fails is not called again for `retry_interval` seconds (never, if
+    None); until then get() raises at once instead of rebuilding on every request.
+    A failed warm-up leaves the built component in use and only records the error.
+    The registry also records how long imports and loads took so /healthz can show
+    where startup time goes.
+    """
+
+    def __init__(self):
+        self._components: Dict[str, _Component] = {}
+        self.import_times: Dict[str, float] = {}
+        self.warmup_started = False
+        self.warmup_done = False
+
+    def register(
+        self,
+        name: str,
+        factory: Callable[[], Any],
+        warmup: Optional[Callable[[Any], Any]] = None,
+        close: Optional[Callable[[Any], Any]] = None,
+        required: bool = True,
+        retry_interval: Optional[float] = 30.0,
+    ):
+        """
+        Args:
+            name (str): Component name.
+            factory (Callable): Builds the component; may get other components from the registry.
+            warmup (Callable): Runs a dummy inference on the built component (sync or async).
+            close (Callable): Releases the component on shutdown.
+            required (bool): Whether /readyz waits for this component.
+            retry_interval (float): Seconds before a failed factory is retried; None makes a failure permanent.
+
+        Registering an existing name replaces it in place (benchmarks swap in stand-ins this way).
+        """
+        self._components[name] = _Component(name, factory, warmup, close, required, retry_interval)
+
+    def import_module(self, module_name: str):
+        """
+        importlib.import_module that records how long the first import took.
+        """
+        start = time.perf_counter()
+        module = importlib.import_module(module_name)
+        self.import_times.setdefault(module_name, round(time.perf_counter() - start, 3))
+        return module
+
+    def get(self, name: str) -> Any:
+        """
+        Return the component, building it on first use. Blocks while another thread builds it.
+        Raises RuntimeError without calling the factory while a failed load is backing off.
+        """
+        component = self._components[name]
+        if component.state in (LOADED, WARM):
+            return component.instance
+        with component.lock:
+            if component.state not in (LOADED, WARM):
+                if component.state == FAILED and not self._may_retry(component):
+                    raise RuntimeError(f"Component '{name}' failed to load: {component.error}")
+                component.state = LOADING
+                start = time.perf_counter()
+                try:
+                    component.instance = component.factory()
+                except Exception as e:
+                    component.state = FAILED
+                    component.error = str(e)
+                    component.failed_at = time.monotonic()
+                    logger.error(f"Failed to load component '{name}': {e}")
+                    raise
+                component.load_s = round(time.perf_counter() - start, 3)
+                component.error = None
+                component.failed_at = None
+                component.state = LOADED
+                logger.info(f"Loaded component '{name}' in {component.load_s:.2f}s")
+        return component.instance
+
+    async def aget(self, name: str) -> Any:
+        """
+        Async get(): a component that still has to be built is built off the event loop.
+        """
+        component = self._components[name]
+        if component.state in (LOADED, WARM):
+            return component.instance
+        return await asyncio.to_thread(self.get, name)
+
+    def is_loaded(self, name: str) -> bool:
+        return self._components[name].state in (LOADED, WARM)
+
+    async def warm_up(self, names: Optional[List[str]] = None):
+        """
+        Build every component (in registration order) and run its warm-up inference.
+        Failures are recorded in status() and do not stop the other components.
+        """
+        self.warmup_started = True
+        for name in names or list(self._components):
+            component = self._components[name]
+            try:
+                instance = await self.aget(name)
+            except Exception:
+                continue  # recorded by get()
+            try:
+                start = time.perf_counter()
+                if component.warmup is not None:
+                    if inspect.iscoroutinefunction(component.warmup):
+                        await component.warmup(instance)
+                    else:
+                        await asyncio.to_thread(component.warmup, instance)
+                component.warmup_s = round(time.perf_counter() - start, 3)
+                component.warmup_error = None
+                component.state = WARM
+                logger.info(f"Warmed up component '{name}' in {component.warmup_s:.2f}s")
+            except Exception as e:
+                # The component itself loaded: it keeps serving, just without the warm-up
+                component.warmup_error = str(e)
+                logger.error(f"Warm-up of component '{name}' failed: {e}")
+        self.warmup_done = True
+
+    def ready(self, require_warm: bool = True) -> bool:
+        """
+        True when every required component is warm (or, without warm-up, none has failed).
+        Once the warm-up has finished, loaded components whose warm-up failed, or that
+        loaded later after a failed first attempt, count as ready too.
+        """
+        for component in self._components.values():
+            if not component.required:
+                continue
+            if component.state == FAILED:
+                return False
+            if require_warm and component.state != WARM and not (self.warmup_done and component.state == LOADED):
+                return False
+        return True
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {
+                "state": c.state,
+                "required": c.required,
+                "load_s": c.load_s,
+                "warmup_s": c.warmup_s,
+                "error": c.error,
+                "warmup_error": c.warmup_error,
+            }
+            for name, c in self._components.items()
+        }
+
+    def close(self):
+        """
+        Close the components that were built, in reverse registration order.
+        """
+        for component in reversed(list(self._components.values())):
+            if component.close is None or component.state not in (LOADED, WARM):
+                continue
+            try:
+                component.close(component.instance)
+            except Exception as e:
+                logger.warning(f"Closing component '{component.name}' failed: {e}")
+
+    @staticmethod
+    def _may_retry(component: _Component) -> bool:
+        if component.retry_interval is None or component.failed_at is None:
+            return False
+        return time.monotonic() - component.failed_at >= component.retry_interval
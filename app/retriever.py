@@ -1,52 +1,270 @@
 # app/retriever.py
 
-from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, List, NamedTuple, Optional, Sequence, Tuple, Union
 import numpy as np
-import faiss
 
-from embeddings.text_encoder import TextEncoder
-from embeddings.image_encoder import ImageEncoder
-from utils import load_jsonl
+if TYPE_CHECKING:
+    from embeddings.text_encoder import TextEncoder
+    from embeddings.image_encoder import ImageEncoder
+from corpus_store import load_corpus
+from fusion import FUSION_METHODS, fuse
+from index_factory import read_index, search_parameters, set_search_params
 from PIL import Image
 
+
+class QueryEmbedding(NamedTuple):
+    """
+    Query vectors for separate text and image indexes.
+    `image` is None when the image branch is skipped; otherwise rows without an image are zero.
+    """
+    text: np.ndarray                         # (n, text_dim)
+    image: Optional[np.ndarray] = None       # (n, image_dim)
+    has_image: Optional[np.ndarray] = None   # (n,) bool
+
+
 class Retriever:
     def __init__(
         self,
         index_path: str,
         db_path: str,
-        text_encoder: TextEncoder,
-        image_encoder: ImageEncoder = None,
+        text_encoder: "TextEncoder",
+        image_encoder: "ImageEncoder" = None,
         top_k: int = 5,
+        nprobe: int = None,
+        ef_search: int = None,
+        image_index_path: str = None,
+        fusion: str = "rrf",
+        text_weight: float = 1.0,
+        image_weight: float = 1.0,
+        rrf_k: int = 60,
+        candidate_multiplier: int = 4,
+        mmap_index: bool = False,
     ):
+        """
+        Args:
+            index_path (str): FAISS index file (flat, IVF-Flat, IVF-PQ or HNSW, see index_factory).
+                Text vectors, or concatenated text+image vectors when there is no image index.
+            db_path (str): Example corpus: a CorpusStore directory (memory-mapped, preferred),
+                a .jsonl file or a pickled list.
+            text_encoder (TextEncoder): Query text encoder.
+            image_encoder (ImageEncoder): Optional query image encoder.
+            top_k (int): Default number of examples to return.
+            nprobe (int): IVF lists probed per query (IVF indexes only).
+            ef_search (int): HNSW search beam width (HNSW indexes only).
+            image_index_path (str): Optional separate index of image vectors (ids = corpus rows).
+                Text and image are then searched independently and merged by `fusion`.
+            fusion (str): "rrf" (reciprocal rank fusion) or "weighted" (weighted similarity sum).
+            text_weight (float): Weight of the text results in the fusion.
+            image_weight (float): Weight of the image results; 0 skips the image branch (no CLIP pass).
+            rrf_k (int): RRF rank offset.
+            candidate_multiplier (int): Each branch returns top_k * this many candidates before fusion.
+            mmap_index (bool): Memory-map the index files instead of reading them into memory, so
+                worker processes on one host share the pages (see index_factory.read_index).
+        """
+        if fusion not in FUSION_METHODS:
+            raise ValueError(f"Unsupported fusion method: {fusion} (expected one of {FUSION_METHODS})")
         self.index_path = index_path
         self.db_path = db_path
         self.text_encoder = text_encoder
         self.image_encoder = image_encoder
         self.top_k = top_k
+        self.fusion = fusion
+        self.text_weight = text_weight
+        self.image_weight = image_weight
+        self.rrf_k = rrf_k
+        self.candidate_multiplier = candidate_multiplier
 
-        self.examples = load_jsonl(self.db_path)
-        self.index = faiss.read_index(self.index_path)
+        self.examples = load_corpus(self.db_path)
+        self.index = read_index(self.index_path, mmap=mmap_index)
+        self.image_index = read_index(image_index_path, mmap=mmap_index) if image_index_path else None
+        self.set_search_params(nprobe=nprobe, ef_search=ef_search)
 
-    def _encode_query(self, text: str, image: Image.Image = None) -> np.ndarray:
-        """Generate embedding for a text (and optional image)."""
-        if image is not None and self.image_encoder:
-            image_vec = self.image_encoder.encode(image)
-            text_vec = self.text_encoder.encode(text)
-            combined = np.concatenate([text_vec, image_vec])
-            return combined.astype("float32")
-        else:
-            return self.text_encoder.encode(text).astype("float32")
+        # The image search runs next to the text search, FAISS releases the GIL
+        self._branch_pool = (
+            ThreadPoolExecutor(max_workers=2, thread_name_prefix="retriever-image")
+            if self.image_index is not None else None
+        )
 
-    def retrieve(self, text_query: str, image: np.ndarray = None) -> List[str]:
+    def encode_query(self, text: str, image: Image.Image = None) -> Union[np.ndarray, QueryEmbedding]:
+        """
+        Generate the query embedding for a text (and optional image): a 1-D vector for a
+        single index, or a one-row QueryEmbedding when there is a separate image index.
+        """
+        query = self.encode_queries([text], [image])
+        return query if isinstance(query, QueryEmbedding) else query[0]
+
+    # Kept for callers of the old private name
+    _encode_query = encode_query
+
+    def set_search_params(self, nprobe: int = None, ef_search: int = None):
+        """Change the default nprobe / efSearch used by every query."""
+        set_search_params(self.index, nprobe=nprobe, ef_search=ef_search)
+        if self.image_index is not None:
+            set_search_params(self.image_index, nprobe=nprobe, ef_search=ef_search)
+
+    def close(self):
+        if self._branch_pool is not None:
+            self._branch_pool.shutdown(wait=False)
+
+    def uses_image(self, images: Sequence[Optional[Image.Image]] = None) -> bool:
+        """Whether these queries need the image encoder at all."""
+        return (
+            self.image_encoder is not None
+            and images is not None
+            and any(img is not None for img in images)
+            and (self.image_index is None or self.image_weight > 0)
+        )
+
+    def encode_queries(
+        self,
+        texts: Sequence[str],
+        images: Sequence[Optional[Image.Image]] = None,
+    ) -> Union[np.ndarray, QueryEmbedding]:
+        """
+        Encode many queries at once: one text encode call for all texts and, when the
+        image branch is used, one image encode call for the images that are present.
+
+        Returns:
+            np.ndarray: (n, dim) float32 for a single (text or text+image) index, where rows
+                without an image get a zero image part; or
+            QueryEmbedding: separate text and image vectors when there is an image index.
+        """
+        text_vecs = np.asarray(self.text_encoder.encode(list(texts)), dtype="float32")
+        image_vecs, has_image = None, None
+        if self.uses_image(images):
+            has_image = np.array([img is not None for img in images])
+            encoded = np.asarray(
+                self.image_encoder.encode([img for img in images if img is not None]), dtype="float32"
+            )
+            image_vecs = np.zeros((len(text_vecs), encoded.shape[1]), dtype="float32")
+            image_vecs[has_image] = encoded
+
+        if self.image_index is not None:
+            return QueryEmbedding(text_vecs, image_vecs, has_image)
+
+        vecs = text_vecs if image_vecs is None else np.hstack([text_vecs, image_vecs])
+        # Text-only queries against a text+image index: the image part stays zero
+        pad = self.index.d - vecs.shape[1]
+        if pad > 0:
+            vecs = np.hstack([vecs, np.zeros((len(vecs), pad), dtype="float32")])
+        return vecs
+
+    def search(
+        self,
+        query_vec: Union[np.ndarray, QueryEmbedding],
+        top_k: int = None,
+        nprobe: int = None,
+        ef_search: int = None,
+    ) -> List[str]:
+        """
+        Search the FAISS index with a precomputed query embedding.
+        `nprobe` / `ef_search` override the index defaults for this query only.
+        Returns list of example strings.
+        """
+        if not isinstance(query_vec, QueryEmbedding):
+            query_vec = np.asarray(query_vec, dtype="float32").reshape(1, -1)
+        return self.search_batch(query_vec, top_k, nprobe=nprobe, ef_search=ef_search)[0]
+
+    def search_batch(
+        self,
+        query_vecs: Union[np.ndarray, QueryEmbedding],
+        top_k: int = None,
+        nprobe: int = None,
+        ef_search: int = None,
+    ) -> List[List[str]]:
+        """
+        Search the index for every query row in a single FAISS call per index.
+        Returns one list of example strings per query row.
+        """
+        top_k = top_k or self.top_k
+        if isinstance(query_vecs, QueryEmbedding):
+            return [self._contents(ids) for ids in self._search_fused(query_vecs, top_k, nprobe, ef_search)]
+
+        if len(query_vecs) == 0:
+            return []
+        _, indices = self._search_index(self.index, query_vecs, top_k, nprobe, ef_search)
+        return [self._contents(row) for row in indices]
+
+    def _contents(self, ids: Sequence[int]) -> List[str]:
+        # Only the hit rows are decoded
+        return [self.examples[int(idx)].get("content", "") for idx in ids if 0 <= idx < len(self.examples)]
+
+    @staticmethod
+    def _search_index(index, queries: np.ndarray, k: int, nprobe: int = None, ef_search: int = None):
+        queries = np.ascontiguousarray(queries, dtype="float32")
+        params = search_parameters(index, nprobe=nprobe, ef_search=ef_search)
+        if params is not None:
+            return index.search(queries, k, params=params)
+        return index.search(queries, k)
+
+    def _search_fused(self, query: QueryEmbedding, top_k: int, nprobe: int = None, ef_search: int = None) -> List[List[int]]:
+        """
+        Search the text and image indexes independently (image rows only, in parallel)
+        and fuse each row's results.
+        """
+        if len(query.text) == 0:
+            return []
+        use_image = query.image is not None and self.image_weight > 0
+        k = top_k * self.candidate_multiplier if use_image else top_k
+
+        image_future = None
+        if use_image:
+            image_rows = np.flatnonzero(query.has_image)
+            image_future = self._branch_pool.submit(
+                self._search_index, self.image_index, query.image[image_rows], k, nprobe, ef_search
+            )
+        text_scores, text_ids = self._search_index(self.index, query.text, k, nprobe, ef_search)
+
+        image_hits = [None] * len(query.text)
+        if image_future is not None:
+            image_scores, image_ids = image_future.result()
+            for j, row in enumerate(image_rows):
+                image_hits[row] = (image_scores[j], image_ids[j])
+
+        return [
+            fuse(
+                (text_scores[row], text_ids[row]),
+                image_hits[row],
+                top_k,
+                method=self.fusion,
+                text_weight=self.text_weight,
+                image_weight=self.image_weight,
+                rrf_k=self.rrf_k,
+            )
+            for row in range(len(query.text))
+        ]
+
+    def retrieve(
+        self,
+        text_query: str,
+        image: Image.Image = None,
+        top_k: int = None,
+        nprobe: int = None,
+        ef_search: int = None,
+    ) -> List[str]:
         """
         Retrieve top-k similar math examples from database given a text query and optional image.
         Returns list of example strings.
         """
-        query_vec = self._encode_query(text_query, image)
-        distances, indices = self.index.search(np.array([query_vec]), self.top_k)
+        query_vec = self.encode_query(text_query, image)
+        return self.search(query_vec, top_k, nprobe=nprobe, ef_search=ef_search)
 
-        retrieved = []
-        for idx in indices[0]:
-            if 0 <= idx < len(self.examples):
-                retrieved.append(self.examples[idx].get("content", ""))
-        return retrieved
+    def retrieve_batch(
+        self,
+        texts: Sequence[str],
+        images: Sequence[Optional[Image.Image]] = None,
+        top_k: int = None,
+        nprobe: int = None,
+        ef_search: int = None,
+    ) -> List[List[str]]:
+        """
+        Retrieve top-k examples for many queries: one encode pass and one multi-row search.
+        Returns one list of example strings per query, in input order.
+        """
+        if images is not None and len(images) != len(texts):
+            raise ValueError(f"Got {len(texts)} texts but {len(images)} images")
+        if not texts:
+            return []
+        query_vecs = self.encode_queries(texts, images)
+        return self.search_batch(query_vecs, top_k, nprobe=nprobe, ef_search=ef_search)
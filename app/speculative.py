@@ -0,0 +1,299 @@
+# app/speculative.py
+
+import logging
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SPECULATIVE_METHODS = ("prompt-lookup", "draft-model")
+
+
+def prompt_lookup_candidates(tokens: Sequence[int], num_tokens: int, max_ngram: int = 3,
+                             min_ngram: int = 1) -> List[int]:
+    """
+    Prompt-lookup drafting: find the most recent earlier occurrence of the last n tokens
+    (longest n first) and propose the tokens that followed it. Answers copy whole steps
+    and formulas from the retrieved solutions in the prompt, so these spans are often
+    exactly what the model is about to write.
+
+    Args:
+        tokens (Sequence[int]): Prompt plus the tokens generated so far.
+        num_tokens (int): Maximum number of tokens to propose.
+        max_ngram (int): Longest suffix to match.
+        min_ngram (int): Shortest suffix to match.
+
+    Returns:
+        List[int]: Proposed continuation (empty when nothing matches).
+    """
+    if num_tokens <= 0 or len(tokens) < min_ngram + 1:
+        return []
+    ids = np.asarray(tokens, dtype=np.int64)
+    for n in range(min(max_ngram, len(ids) - 1), min_ngram - 1, -1):
+        pattern = ids[-n:]
+        # Windows starting at 0..len-n-1: every occurrence except the suffix itself
+        windows = np.lib.stride_tricks.sliding_window_view(ids[:-1], n)
+        matches = np.flatnonzero((windows == pattern).all(axis=1))
+        if matches.size:
+            start = int(matches[-1]) + n
+            return ids[start:start + num_tokens].tolist()
+    return []
+
+
+def _cache_length(cache: Any) -> int:
+    if cache is None:
+        return 0
+    if hasattr(cache, "get_seq_length"):
+        return int(cache.get_seq_length())
+    return int(cache[0][0].shape[2])
+
+
+def _crop_cache(cache: Any, length: int) -> Any:
+    """
+    Drop cached positions beyond `length` (the rejected draft tokens).
+    """
+    if hasattr(cache, "crop"):
+        # A negative count removes positions from the end (absolute lengths are deprecated in transformers 5)
+        excess = _cache_length(cache) - length
+        if excess > 0:
+            cache.crop(-excess)
+        return cache
+    return tuple((k[:, :, :length], v[:, :, :length]) for k, v in cache)
+
+
+class PromptLookupProposer:
+    def __init__(self, max_ngram: int = 3, min_ngram: int = 1):
+        self.max_ngram = max_ngram
+        self.min_ngram = min_ngram
+
+    def propose(self, tokens: List[int], num_tokens: int) -> List[int]:
+        return prompt_lookup_candidates(tokens, num_tokens, self.max_ngram, self.min_ngram)
+
+
+class DraftModelProposer:
+    """
+    Greedy drafts from a small model sharing the main model's tokenizer. Keeps its own
+    key/value cache for one request and rolls it back to the tokens the main model kept.
+    """
+
+    def __init__(self, model: Any, device: Any = "cpu"):
+        self.model = model
+        self.device = device
+        self._cache = None
+        self._seen: List[int] = []
+
+    def propose(self, tokens: List[int], num_tokens: int) -> List[int]:
+        import torch
+
+        if num_tokens <= 0:
+            return []
+        # Longest prefix of what the draft cache holds that is still part of the sequence
+        common = 0
+        for a, b in zip(self._seen, tokens):
+            if a != b:
+                break
+            common += 1
+        common = min(common, len(tokens) - 1)
+        if self._cache is not None:
+            self._cache = _crop_cache(self._cache, common)
+        self._seen = list(tokens[:common])
+
+        feed = tokens[common:]
+        draft: List[int] = []
+        for _ in range(num_tokens):
+            input_ids = torch.tensor([feed], device=self.device)
+            outputs = self.model(input_ids=input_ids, past_key_values=self._cache, use_cache=True)
+            self._cache = outputs.past_key_values
+            self._seen.extend(feed)
+            token = int(outputs.logits[0, -1].argmax())
+            draft.append(token)
+            feed = [token]
+        return draft
+
+
+class SpeculativeDecoder:
+    """
+    Speculative decoding for a HF causal LM, batch size 1.
+
+    Each step drafts up to `num_draft_tokens` tokens (prompt lookup or a draft model),
+    runs the main model once over the last accepted token plus the draft, and keeps the
+    longest draft prefix the main model agrees with plus one token of its own. Greedy
+    decoding is reproduced exactly; with a temperature, a draft token d is accepted with
+    probability p(d) and a rejection resamples from p without d, which leaves the output
+    distribution unchanged (drafts are deterministic). p is what model.generate(do_sample=True)
+    samples from: temperature, then top-k, then top-p. A step with no draft is a plain
+    decoding step, so output never gets slower than one token per forward pass.
+    """
+
+    def __init__(
+        self,
+        model: Any,
+        eos_token_id: Optional[int],
+        method: str = "prompt-lookup",
+        draft_model: Any = None,
+        num_draft_tokens: int = 8,
+        max_ngram: int = 3,
+        device: Any = "cpu",
+        inference_context: Callable = nullcontext,
+        top_k: int = 0,
+        top_p: float = 1.0,
+    ):
+        """
+        Args:
+            model: Main HF causal LM (already in eval mode).
+            eos_token_id (int): Token that ends generation.
+            method (str): "prompt-lookup" or "draft-model".
+            draft_model: Small HF causal LM with the same vocabulary (method="draft-model").
+            num_draft_tokens (int): Tokens proposed per verification step.
+            max_ngram (int): Longest suffix matched by prompt lookup.
+            device: Device the models run on.
+            inference_context (Callable): Context manager factory for grad mode / autocast.
+            top_k (int): Sample from the k most likely tokens only (0 disables); pass the model's
+                generation_config value to match model.generate.
+            top_p (float): Nucleus sampling threshold (1.0 disables).
+        """
+        if method not in SPECULATIVE_METHODS:
+            raise ValueError(f"Unknown speculative method '{method}', expected one of {SPECULATIVE_METHODS}")
+        if method == "draft-model" and draft_model is None:
+            raise ValueError("method='draft-model' needs a draft_model")
+        self.model = model
+        self.eos_token_id = eos_token_id
+        self.method = method
+        self.draft_model = draft_model
+        self.num_draft_tokens = num_draft_tokens
+        self.max_ngram = max_ngram
+        self.device = device
+        self.inference_context = inference_context
+        self.top_k = top_k
+        self.top_p = top_p
+
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "steps": 0, "drafted": 0, "accepted": 0, "tokens": 0, "decode_s": 0.0}
+
+    def _proposer(self):
+        if self.method == "draft-model":
+            return DraftModelProposer(self.draft_model, self.device)
+        return PromptLookupProposer(self.max_ngram)
+
+    def generate(self, input_ids: Any, max_tokens: int, temperature: float = 0.0,
+                 past_key_values: Any = None) -> List[int]:
+        return [token for chunk in self.iter_generate(input_ids, max_tokens, temperature, past_key_values)
+                for token in chunk]
+
+    def iter_generate(self, input_ids: Any, max_tokens: int, temperature: float = 0.0,
+                      past_key_values: Any = None) -> Iterator[List[int]]:
+        """
+        Generate up to max_tokens new tokens, yielding the tokens accepted at each step.
+
+        Args:
+            input_ids (Tensor): Prompt token IDs of shape [1, T].
+            max_tokens (int): Maximum number of new tokens.
+            temperature (float): Sampling temperature (<= 0 means greedy).
+            past_key_values: Optional cache covering a prefix of input_ids (it is extended in place).
+        """
+        import torch
+
+        with self.inference_context():
+            tokens = input_ids[0].tolist()
+            cache = past_key_values
+            # Everything but the last prompt token goes into the cache; that token starts the first step
+            pending = input_ids[:, _cache_length(cache):-1]
+            if pending.shape[1]:
+                cache = self.model(input_ids=pending.to(self.device), past_key_values=cache, use_cache=True).past_key_values
+
+            proposer = self._proposer()
+            generated = steps = drafted = accepted_total = 0
+            start = time.perf_counter()
+            try:
+                while generated < max_tokens:
+                    draft = proposer.propose(tokens, min(self.num_draft_tokens, max_tokens - generated - 1))
+                    feed = torch.tensor([[tokens[-1]] + draft], device=self.device)
+                    outputs = self.model(input_ids=feed, past_key_values=cache, use_cache=True)
+                    logits = outputs.logits[0].float()
+                    cache = outputs.past_key_values
+
+                    accepted = []
+                    correction = None
+                    for i, token in enumerate(draft):
+                        ok, replacement = self._verify(logits[i], token, temperature)
+                        if not ok:
+                            correction = replacement
+                            break
+                        accepted.append(token)
+                    if correction is None:
+                        correction = self._sample(logits[len(accepted)], temperature)
+
+                    steps += 1
+                    drafted += len(draft)
+                    accepted_total += len(accepted)
+                    # Keep the fed token and the accepted drafts; the correction is fed next step
+                    cache = _crop_cache(cache, len(tokens) + len(accepted))
+
+                    new = accepted + [correction]
+                    if self.eos_token_id is not None and self.eos_token_id in new:
+                        new = new[:new.index(self.eos_token_id) + 1]
+                    new = new[:max_tokens - generated]
+                    tokens.extend(new)
+                    generated += len(new)
+                    yield new
+                    if self.eos_token_id is not None and new[-1] == self.eos_token_id:
+                        break
+            finally:
+                with self._lock:
+                    self._stats["requests"] += 1
+                    self._stats["steps"] += steps
+                    self._stats["drafted"] += drafted
+                    self._stats["accepted"] += accepted_total
+                    self._stats["tokens"] += generated
+                    self._stats["decode_s"] += time.perf_counter() - start
+
+    def _probs(self, logits: Any, temperature: float) -> Any:
+        """
+        Sampling distribution, filtered like transformers' TopK / TopP logits warpers.
+        """
+        import torch
+
+        scores = logits / temperature
+        if self.top_k and self.top_k < scores.shape[-1]:
+            kth = torch.topk(scores, self.top_k).values[-1]
+            scores = scores.masked_fill(scores < kth, float("-inf"))
+        if self.top_p < 1.0:
+            sorted_scores, order = torch.sort(scores)
+            remove = sorted_scores.softmax(dim=-1).cumsum(dim=-1) <= 1 - self.top_p
+            remove[-1] = False  # the most likely token always stays
+            scores = scores.masked_fill(remove.scatter(0, order, remove), float("-inf"))
+        return torch.softmax(scores, dim=-1)
+
+    def _sample(self, logits: Any, temperature: float) -> int:
+        import torch
+
+        if temperature <= 0:
+            return int(logits.argmax())
+        return int(torch.multinomial(self._probs(logits, temperature), 1))
+
+    def _verify(self, logits: Any, token: int, temperature: float):
+        """
+        Returns (accepted, replacement token when rejected).
+        """
+        import torch
+
+        if temperature <= 0:
+            best = int(logits.argmax())
+            return best == token, best
+        probs = self._probs(logits, temperature)
+        if float(torch.rand(1)) < float(probs[token]):
+            return True, None
+        probs[token] = 0
+        return False, int(torch.multinomial(probs / probs.sum(), 1))
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["acceptance_rate"] = stats["accepted"] / stats["drafted"] if stats["drafted"] else 0.0
+        stats["tokens_per_step"] = stats["tokens"] / stats["steps"] if stats["steps"] else 0.0
+        stats["tokens_per_s"] = stats["tokens"] / stats["decode_s"] if stats["decode_s"] else 0.0
+        return stats
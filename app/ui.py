@@ -1,5 +1,6 @@
 # app/ui.py
 
+import json
 import requests
 import streamlit as st
 from PIL import Image
@@ -7,6 +8,25 @@ from PIL import Image
 st.set_page_config(page_title="Vietnamese Math Solver", layout="centered")
 
 API_URL = "http://localhost:8000/solve"  # or public IP if deployed
+STREAM_URL = "http://localhost:8000/solve/stream"
+
+
+def iter_sse(response):
+    """
+    Parse a server-sent events response into (event, data) pairs.
+    """
+    event, data_lines = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if line == "":
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
 
 st.title("📘 Vietnamese High School Math Solver")
 
@@ -32,27 +52,42 @@ if submit_button:
             data = {"question": question}
 
             try:
-                response = requests.post(API_URL, files=files, data=data)
-                response.raise_for_status()
-                result = response.json()
-
-                st.success("✅ Đã giải xong!")
-
-                with st.expander("📄 Câu hỏi gốc"):
-                    st.write(result["question"])
-
-                with st.expander("🔍 Văn bản trích xuất từ ảnh (OCR)"):
-                    st.write(result["ocr_text"])
-
-                with st.expander("📚 Ví dụ tương tự được truy xuất"):
-                    if result["retrieved_examples"]:
-                        for i, ex in enumerate(result["retrieved_examples"], 1):
-                            st.markdown(f"**Ví dụ {i}:** {ex}")
-                    else:
-                        st.write("Không tìm thấy ví dụ nào.")
-
-                st.markdown("## 💡 Đáp án:")
-                st.markdown(f"```text\n{result['answer']}\n```")
+                # Stream the answer so it renders as soon as the first tokens arrive
+                with requests.post(STREAM_URL, files=files, data=data, stream=True) as response:
+                    response.raise_for_status()
+                    response.encoding = "utf-8"
+
+                    with st.expander("📄 Câu hỏi gốc"):
+                        st.write(question)
+
+                    answer = ""
+                    answer_placeholder = None
+                    for event, payload in iter_sse(response):
+                        if event == "ocr":
+                            with st.expander("🔍 Văn bản trích xuất từ ảnh (OCR)"):
+                                st.write(payload["ocr_text"])
+
+                        elif event == "retrieved":
+                            with st.expander("📚 Ví dụ tương tự được truy xuất"):
+                                if payload["retrieved_examples"]:
+                                    for i, ex in enumerate(payload["retrieved_examples"], 1):
+                                        st.markdown(f"**Ví dụ {i}:** {ex}")
+                                else:
+                                    st.write("Không tìm thấy ví dụ nào.")
+
+                        elif event == "token":
+                            if answer_placeholder is None:
+                                st.markdown("## 💡 Đáp án:")
+                                answer_placeholder = st.empty()
+                            answer += payload["text"]
+                            answer_placeholder.markdown(f"```text\n{answer}\n```")
+
+                        elif event == "done":
+                            st.success("✅ Đã giải xong!")
+
+                        elif event == "error":
+                            st.error(f"Lỗi API: {payload['error']}")
+                            break
 
             except requests.exceptions.RequestException as e:
                 st.error(f"Lỗi API: {e}")
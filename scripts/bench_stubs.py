@@ -0,0 +1,201 @@
+# scripts/bench_stubs.py
+"""
+Deterministic stand-ins for the model backends, so the service can be load-tested
+offline (no GPU, no model downloads, no Gemini quota).
+
+    - FakeLLMEngine: LLMEngine interface with a configurable time-to-first-token and token rate
+    - HashingTextEncoder / PixelImageEncoder: cheap deterministic embeddings
+    - fake_run_ocr / fake_run_ocr_batch: OCR with a fixed per-image latency
+    - build_synthetic_corpus: FAISS index + corpus of templated problems for a real Retriever
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import AsyncIterator, Iterator, List, Optional, Union
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from prompts.composer import ComposedPrompt, PromptComposer
+from prompts.cot_templates import prompt_fingerprint
+from utils import clean_text
+
+# Settings of fake_run_ocr; set by configure_fake_ocr before the server starts
+_OCR_LATENCY_S = 0.05
+
+
+class FakeLLMEngine:
+    """
+    Drop-in for LLMEngine: real prompt building, canned answers generated at a fixed pace.
+    """
+
+    def __init__(self, ttft_ms: float = 300.0, tokens_per_s: float = 50.0, answer_tokens: int = 120,
+                 remote: bool = True, prompt_token_budget: Optional[int] = None):
+        """
+        Args:
+            ttft_ms (float): Delay before the first token.
+            tokens_per_s (float): Decode rate after the first token.
+            answer_tokens (int): Tokens per answer.
+            remote (bool): Behave like Gemini (async, no thread) or like the local model (blocking).
+            prompt_token_budget (int): Passed to the prompt composer.
+        """
+        self.ttft = ttft_ms / 1000.0
+        self.token_interval = 1.0 / tokens_per_s if tokens_per_s > 0 else 0.0
+        self.answer_tokens = answer_tokens
+        self.backend = "fake"
+        self.scheduler = None
+        self._remote = remote
+        self.composer = PromptComposer(self.count_tokens, token_budget=prompt_token_budget)
+
+    @property
+    def is_remote(self) -> bool:
+        return self._remote
+
+    def build_prompt(self, user_question: str, retrieved_examples: List[str] = None, category: str = "") -> str:
+        return self.compose_prompt(user_question, retrieved_examples, category).prompt
+
+    def compose_prompt(self, user_question: str, retrieved_examples: List[str] = None, category: str = "",
+                       scores: Optional[List[float]] = None) -> ComposedPrompt:
+        return self.composer.compose(user_question, retrieved_examples or [], category, scores)
+
+    def fingerprint(self) -> List[str]:
+        return [prompt_fingerprint(), self.backend, str(self.answer_tokens)]
+
+    def count_tokens(self, text: str) -> int:
+        return len(text.split()) if text else 0
+
+    def stats(self) -> dict:
+        return {}
+
+    def close(self):
+        pass
+
+    def _tokens(self, prompt: str) -> List[str]:
+        seed = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+        return [f"t{seed[i % len(seed)]}{i} " for i in range(self.answer_tokens)]
+
+    def generate_answer(self, prompt: str, max_tokens: Optional[int] = None, temperature: Optional[float] = None) -> str:
+        tokens = self._tokens(prompt)[:max_tokens or self.answer_tokens]
+        time.sleep(self.ttft + self.token_interval * max(len(tokens) - 1, 0))
+        return "".join(tokens).strip()
+
+    async def agenerate_answer(self, prompt: str) -> str:
+        tokens = self._tokens(prompt)
+        await asyncio.sleep(self.ttft + self.token_interval * (len(tokens) - 1))
+        return "".join(tokens).strip()
+
+    def stream_answer(self, prompt: str) -> Iterator[str]:
+        time.sleep(self.ttft)
+        for i, token in enumerate(self._tokens(prompt)):
+            if i:
+                time.sleep(self.token_interval)
+            yield token
+
+    async def astream_answer(self, prompt: str) -> AsyncIterator[str]:
+        await asyncio.sleep(self.ttft)
+        for i, token in enumerate(self._tokens(prompt)):
+            if i:
+                await asyncio.sleep(self.token_interval)
+            yield token
+
+
+class HashingTextEncoder:
+    """
+    Character-trigram hashing embeddings: deterministic, no model, similar texts get similar vectors.
+    """
+
+    def __init__(self, dim: int = 256, delay_ms: float = 0.0):
+        self.dim = dim
+        self.delay = delay_ms / 1000.0
+
+    def encode(self, texts: Union[str, List[str]]) -> np.ndarray:
+        if isinstance(texts, str):
+            texts = [texts]
+        if self.delay:
+            time.sleep(self.delay)
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            text = f"  {clean_text(text).lower()} "
+            for i in range(len(text) - 2):
+                bucket = int.from_bytes(hashlib.blake2b(text[i:i + 3].encode("utf-8"), digest_size=4).digest(), "little")
+                vectors[row, bucket % self.dim] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.clip(norms, 1e-12, None)
+
+
+class PixelImageEncoder:
+    """
+    Downscaled grayscale pixels as an embedding (dim = side * side).
+    """
+
+    def __init__(self, side: int = 8):
+        self.side = side
+
+    def encode(self, images: Union[Image.Image, List[Image.Image]], normalize: bool = True) -> np.ndarray:
+        if isinstance(images, Image.Image):
+            images = [images]
+        vectors = np.stack([
+            np.asarray(image.convert("L").resize((self.side, self.side)), dtype=np.float32).ravel() - 127.5
+            for image in images
+        ])
+        if normalize:
+            vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors
+
+
+def configure_fake_ocr(latency_ms: float):
+    global _OCR_LATENCY_S
+    _OCR_LATENCY_S = latency_ms / 1000.0
+
+
+def fake_run_ocr(image) -> tuple:
+    time.sleep(_OCR_LATENCY_S)
+    text = "Giải phương trình x^2 - 5x + 6 = 0"
+    return text, [(text, 0.99)]
+
+
+def fake_run_ocr_batch(images: list) -> list:
+    return [fake_run_ocr(image) for image in images]
+
+
+PROBLEM_TEMPLATES = [
+    "Giải phương trình x^2 - {a}x + {b} = 0",
+    "Tính đạo hàm của hàm số y = {a}x^3 + {b}x",
+    "Cho tam giác ABC vuông tại A, AB = {a}, AC = {b}. Tính BC.",
+    "Tính diện tích hình tròn có bán kính {a} cm",
+    "Một xe máy đi với vận tốc {a} km/h trong {b} giờ. Tính quãng đường.",
+    "Tìm giá trị lớn nhất của hàm số y = -x^2 + {a}x + {b}",
+]
+
+
+def synthetic_problem(i: int) -> str:
+    return PROBLEM_TEMPLATES[i % len(PROBLEM_TEMPLATES)].format(a=2 + i % 17, b=1 + (i * 7) % 23)
+
+
+def build_synthetic_corpus(directory: str, n: int, encoder: HashingTextEncoder, batch_size: int = 1024):
+    """
+    Write math.index (exact inner product) and corpus.jsonl with n templated problems.
+
+    Returns:
+        Tuple[str, str]: (index path, corpus path)
+    """
+    import faiss
+
+    os.makedirs(directory, exist_ok=True)
+    index_path = os.path.join(directory, "math.index")
+    corpus_path = os.path.join(directory, "corpus.jsonl")
+    index = faiss.IndexFlatIP(encoder.dim)
+    with open(corpus_path, "w", encoding="utf-8") as f:
+        for start in range(0, n, batch_size):
+            problems = [synthetic_problem(i) for i in range(start, min(start + batch_size, n))]
+            index.add(encoder.encode(problems))
+            for problem in problems:
+                f.write(json.dumps({"content": f"{problem}\nLời giải: ...", "problem": problem}, ensure_ascii=False) + "\n")
+    faiss.write_index(index, index_path)
+    return index_path, corpus_path
@@ -0,0 +1,82 @@
+# scripts/benchmark_continuous_batching.py
+"""
+Aggregate decode throughput of the local backend under concurrency:
+one model.generate per request (batch size 1) vs the continuous batching scheduler.
+
+Usage:
+    python scripts/benchmark_continuous_batching.py --model microsoft/phi-2 --concurrency 1 4 8
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from continuous_batching import ContinuousBatcher
+from llm import LLMEngine
+
+QUESTIONS = [
+    "Tìm nghiệm của phương trình x^2 - 5x + 6 = 0",
+    "Tính diện tích hình tròn có bán kính 7 cm",
+    "Giải phương trình 2x + 3 = 11",
+    "Một ô tô đi 150 km trong 3 giờ. Tính vận tốc trung bình.",
+    "Tìm giá trị lớn nhất của hàm số y = -x^2 + 4x + 1",
+    "Tính đạo hàm của hàm số y = x^3 - 3x",
+    "Giải bất phương trình x^2 - 4 < 0",
+    "Tính tổng 1 + 2 + ... + 100",
+]
+
+
+def run(engine: LLMEngine, concurrency: int, n_requests: int, max_tokens: int) -> float:
+    prompts = [engine.build_prompt(QUESTIONS[i % len(QUESTIONS)], [], "algebra") for i in range(n_requests)]
+    generated = []
+
+    def solve(prompt):
+        answer = engine.generate_answer(prompt, max_tokens=max_tokens, temperature=0.3)
+        generated.append(len(engine.tokenizer(answer).input_ids))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(solve, prompts))
+    return sum(generated) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="microsoft/phi-2")
+    parser.add_argument("--precision", default="fp32")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--max-tokens", type=int, default=64)
+    args = parser.parse_args()
+
+    engine = LLMEngine(model_name_or_path=args.model, backend="phi-2", precision=args.precision)
+    # Same sampling as the sequential model.generate runs
+    generation_config = engine.model.generation_config
+    batcher = ContinuousBatcher(
+        engine.model,
+        eos_token_id=engine.tokenizer.eos_token_id,
+        max_batch_size=max(args.concurrency),
+        device=engine.device,
+        inference_context=engine._inference_context,
+        top_k=generation_config.top_k if generation_config.top_k is not None else 50,
+        top_p=generation_config.top_p if generation_config.top_p is not None else 1.0,
+    )
+
+    print(f"{'concurrency':>11} {'sequential tok/s':>17} {'continuous tok/s':>17}")
+    for concurrency in args.concurrency:
+        engine.scheduler = None
+        sequential = run(engine, concurrency, args.requests, args.max_tokens)
+        engine.scheduler = batcher
+        continuous = run(engine, concurrency, args.requests, args.max_tokens)
+        print(f"{concurrency:>11} {sequential:>17.1f} {continuous:>17.1f}")
+
+    print("scheduler stats:", batcher.stats())
+    batcher.close()
+
+
+if __name__ == "__main__":
+    main()
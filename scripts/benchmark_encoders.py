@@ -0,0 +1,129 @@
+# scripts/benchmark_encoders.py
+"""
+Compare encoder backends (torch, onnx, onnx-int8): load time, per-query and batched
+encode latency, and RSS. Each backend runs in its own subprocess so RSS is measured
+in isolation.
+
+Usage:
+    python scripts/export_onnx.py --output-dir models/onnx --quantize
+    python scripts/benchmark_encoders.py --onnx-dir models/onnx --backends torch onnx onnx-int8
+    python scripts/benchmark_encoders.py --encoder image --threads 4 --output bench_encoders.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from export_onnx import IMAGE_MODEL, SAMPLE_TEXTS, TEXT_MODEL, sample_images
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_worker(encoder: str, backend: str, onnx_dir: str, iterations: int, batch_size: int, threads: int = None) -> dict:
+    base = rss_mb()
+    start = time.perf_counter()
+    if encoder == "text":
+        from embeddings.text_encoder import TextEncoder
+
+        if backend == "torch":
+            model = TextEncoder(TEXT_MODEL)
+        else:
+            model = TextEncoder(os.path.join(onnx_dir, "text"), backend=backend, num_threads=threads)
+        inputs = SAMPLE_TEXTS
+    else:
+        from embeddings.image_encoder import ImageEncoder
+
+        if backend == "torch":
+            model = ImageEncoder(IMAGE_MODEL)
+        else:
+            model = ImageEncoder(os.path.join(onnx_dir, "image"), backend=backend, num_threads=threads)
+        inputs = sample_images()
+    load_s = time.perf_counter() - start
+    if backend == "torch" and threads:
+        import torch
+        torch.set_num_threads(threads)
+
+    model.encode(inputs[:1])  # warm-up
+    single = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        model.encode([inputs[i % len(inputs)]])
+        single.append((time.perf_counter() - start) * 1000)
+
+    batch = [inputs[i % len(inputs)] for i in range(batch_size)]
+    batched = []
+    for _ in range(max(1, iterations // 10)):
+        start = time.perf_counter()
+        model.encode(batch)
+        batched.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "encoder": encoder,
+        "backend": backend,
+        "load_s": round(load_s, 2),
+        "p50_ms": round(float(np.percentile(single, 50)), 2),
+        "p95_ms": round(float(np.percentile(single, 95)), 2),
+        "batch_ms": round(float(np.median(batched)), 2),
+        "rss_delta_mb": round(rss_mb() - base, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--encoder", choices=["text", "image", "both"], default="both")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"],
+                        choices=["torch", "onnx", "onnx-int8"])
+    parser.add_argument("--onnx-dir", default=os.path.join("models", "onnx"))
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=None, help="Intra-op threads for every backend")
+    parser.add_argument("--output", default=None, help="Write results as JSON")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = run_worker(args.encoder, args.backends[0], args.onnx_dir, args.iterations, args.batch_size, args.threads)
+        print(json.dumps(result))
+        return
+
+    results = []
+    for encoder in (["text", "image"] if args.encoder == "both" else [args.encoder]):
+        for backend in args.backends:
+            cmd = [sys.executable, os.path.abspath(__file__), "--worker", "--encoder", encoder, "--backends", backend,
+                   "--onnx-dir", args.onnx_dir, "--iterations", str(args.iterations),
+                   "--batch-size", str(args.batch_size)]
+            if args.threads:
+                cmd += ["--threads", str(args.threads)]
+            proc = subprocess.run(cmd, capture_output=True, text=True)
+            if proc.returncode != 0:
+                print(f"[{encoder}/{backend}] failed:\n{proc.stderr[-2000:]}")
+                continue
+            results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    print(f"{'encoder':<8} {'backend':<10} {'load s':>7} {'p50 ms':>8} {'p95 ms':>8} {'batch ms':>9} {'RSS MB':>8}")
+    for r in results:
+        print(f"{r['encoder']:<8} {r['backend']:<10} {r['load_s']:>7} {r['p50_ms']:>8} {r['p95_ms']:>8} "
+              f"{r['batch_ms']:>9} {r['rss_delta_mb']:>8}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
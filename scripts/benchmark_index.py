@@ -0,0 +1,119 @@
+# scripts/benchmark_index.py
+"""
+Recall@k and per-query latency of approximate FAISS indexes against the exact flat index.
+
+Vectors come from an existing index (--index, reconstructed) or are synthetic (--synthetic N).
+Queries are held-out vectors with a little noise, so they are not exact matches of the base set.
+
+Usage:
+    python scripts/benchmark_index.py --index data/faiss_index/math.index --k 5
+    python scripts/benchmark_index.py --synthetic 200000 --dim 768 --output bench_index.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from index_factory import build_index, search_parameters
+
+
+def load_vectors(args) -> np.ndarray:
+    if args.index:
+        index = faiss.read_index(args.index)
+        return index.reconstruct_n(0, index.ntotal).astype("float32")
+    rng = np.random.default_rng(args.seed)
+    # Clustered data behaves more like real embeddings than uniform noise
+    centers = rng.standard_normal((max(1, args.synthetic // 100), args.dim)).astype("float32")
+    vectors = centers[rng.integers(0, len(centers), args.synthetic)]
+    vectors += 0.3 * rng.standard_normal(vectors.shape).astype("float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def time_queries(index, queries: np.ndarray, k: int, params) -> tuple:
+    latencies = []
+    found = []
+    for q in queries:
+        start = time.perf_counter()
+        if params is not None:
+            _, ids = index.search(q[None, :], k, params=params)
+        else:
+            _, ids = index.search(q[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found.append(ids[0])
+    return np.array(found), np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", default=None, help="Existing index to take vectors from")
+    parser.add_argument("--synthetic", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 64, 128, 256])
+    parser.add_argument("--pq-m", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write results as JSON")
+    args = parser.parse_args()
+
+    vectors = load_vectors(args)
+    rng = np.random.default_rng(args.seed)
+    query_rows = rng.choice(len(vectors), min(args.queries, len(vectors) // 10), replace=False)
+    queries = vectors[query_rows] + 0.05 * rng.standard_normal((len(query_rows), vectors.shape[1])).astype("float32")
+    faiss.normalize_L2(queries)
+    base = np.delete(vectors, query_rows, axis=0)
+    print(f"{len(base)} base vectors, {len(queries)} queries, dim {base.shape[1]}, k={args.k}")
+
+    exact = build_index(base, "flat")
+    truth, flat_latency = time_queries(exact, queries, args.k, None)
+
+    configs = [("flat", {}, None, None)]
+    configs += [("ivf_flat", {}, "nprobe", v) for v in args.nprobe]
+    configs += [("ivf_pq", {"pq_m": args.pq_m}, "nprobe", v) for v in args.nprobe]
+    configs += [("hnsw", {}, "ef_search", v) for v in args.ef_search]
+
+    results = []
+    built = {"flat": (exact, 0.0)}
+    print(f"{'index':<9} {'param':<14} {'recall@k':>8} {'p50 ms':>8} {'p95 ms':>8} {'build s':>8}")
+    for index_type, build_kwargs, knob, value in configs:
+        if index_type not in built:
+            start = time.perf_counter()
+            built[index_type] = (build_index(base, index_type, **build_kwargs), time.perf_counter() - start)
+        index, build_s = built[index_type]
+
+        params = search_parameters(index, **{knob: value}) if knob else None
+        found, latency = (truth, flat_latency) if index_type == "flat" else time_queries(index, queries, args.k, params)
+        row = {
+            "index": index_type,
+            knob or "param": value,
+            "recall_at_k": recall_at_k(found, truth),
+            "p50_ms": float(np.percentile(latency, 50)),
+            "p95_ms": float(np.percentile(latency, 95)),
+            "build_s": build_s,
+        }
+        results.append(row)
+        label = f"{knob}={value}" if knob else "exact"
+        print(f"{index_type:<9} {label:<14} {row['recall_at_k']:>8.3f} {row['p50_ms']:>8.3f} "
+              f"{row['p95_ms']:>8.3f} {build_s:>8.1f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
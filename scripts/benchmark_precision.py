@@ -0,0 +1,120 @@
+# scripts/benchmark_precision.py
+"""
+Compare local-model precision modes: load time, decode tokens/sec and peak RSS.
+
+Each mode runs in its own subprocess so peak RSS is measured in isolation.
+
+Usage:
+    python scripts/benchmark_precision.py --model microsoft/phi-2 --modes fp32 bf16 int8-dynamic int4-weight
+    python scripts/benchmark_precision.py --model microsoft/phi-2 --modes int4-weight --save-dir models/phi-2-int4
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+sys.path.insert(0, APP_DIR)
+
+PROMPT = (
+    "You are a Vietnamese high school math assistant. Use step-by-step logical reasoning.\n"
+    "Now solve this problem:\nTìm nghiệm của phương trình x^2 - 5x + 6 = 0\nLet's think step by step:"
+)
+ALL_MODES = ["fp32", "fp16", "bf16", "int8-dynamic", "int8-weight", "int4-weight"]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def dequant_ms_per_step(model) -> float:
+    """
+    Time weight-only layers spend dequantizing their weights in one forward pass (every decode step pays it).
+    """
+    import torch
+    from quantization import WeightOnlyLinear
+
+    layers = [m for m in model.modules() if isinstance(m, WeightOnlyLinear)]
+    if not layers:
+        return 0.0
+    with torch.no_grad():
+        start = time.perf_counter()
+        for layer in layers:
+            layer.dequantize()
+        return (time.perf_counter() - start) * 1000
+
+
+def run_worker(model: str, mode: str, new_tokens: int, save_dir: str = None) -> dict:
+    from llm import LLMEngine
+
+    start = time.perf_counter()
+    engine = LLMEngine(model_name_or_path=model, backend="phi-2", precision=mode, use_prefix_cache=False)
+    load_s = time.perf_counter() - start
+
+    input_ids = engine.tokenizer(PROMPT, return_tensors="pt").input_ids.to(engine.device)
+    with engine._inference_context():
+        engine.model.generate(input_ids=input_ids, max_new_tokens=4, do_sample=False)  # warm-up
+        start = time.perf_counter()
+        output = engine.model.generate(
+            input_ids=input_ids, max_new_tokens=new_tokens, min_new_tokens=new_tokens, do_sample=False
+        )
+        elapsed = time.perf_counter() - start
+    generated = output.shape[1] - input_ids.shape[1]
+
+    if save_dir:
+        engine.save_quantized(save_dir)
+
+    return {
+        "mode": engine.precision,
+        "load_s": round(load_s, 2),
+        "tokens_per_s": round(generated / elapsed, 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "dequant_ms": round(dequant_ms_per_step(engine.model), 2),
+        "sample": engine.tokenizer.decode(output[0, input_ids.shape[1]:], skip_special_tokens=True)[:80],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="microsoft/phi-2", help="HF model ID or a save_quantized checkpoint")
+    parser.add_argument("--modes", nargs="+", default=["fp32", "bf16", "int8-dynamic", "int8-weight", "int4-weight"],
+                        choices=ALL_MODES)
+    parser.add_argument("--new-tokens", type=int, default=64)
+    parser.add_argument("--save-dir", default=None, help="Save the quantized weights (single mode only)")
+    parser.add_argument("--output", default=None, help="Write results as JSON")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.model, args.modes[0], args.new_tokens, args.save_dir), ensure_ascii=False))
+        return
+
+    results = []
+    for mode in args.modes:
+        cmd = [sys.executable, os.path.abspath(__file__), "--worker", "--model", args.model,
+               "--modes", mode, "--new-tokens", str(args.new_tokens)]
+        if args.save_dir:
+            cmd += ["--save-dir", args.save_dir]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"[{mode}] failed:\n{proc.stderr[-2000:]}")
+            continue
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    print(f"{'mode':<14} {'load s':>7} {'tok/s':>7} {'peak RSS MB':>12} {'dequant ms/step':>16}")
+    for r in results:
+        print(f"{r['mode']:<14} {r['load_s']:>7} {r['tokens_per_s']:>7} {r['peak_rss_mb']:>12} {r['dequant_ms']:>16}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# scripts/benchmark_preprocess.py
+"""
+Time saved by the decode-once preprocessing stage: the old path (full-size decode,
+RGB conversion, BGR array for OCR) against ImagePreprocessor (draft JPEG decode,
+EXIF orientation, downscale), plus OCR on both outputs when PaddleOCR is installed.
+
+Without --images, synthetic phone-sized JPEGs (4000x3000, EXIF rotated) are used.
+
+Usage:
+    python scripts/benchmark_preprocess.py
+    python scripts/benchmark_preprocess.py --images photos/*.jpg --max-side 1280 --ocr --output bench_preprocess.json
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import time
+from typing import Callable, List
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from preprocess import EXIF_ORIENTATION, ImagePreprocessor
+
+
+def synthetic_photo(width: int = 4000, height: int = 3000, seed: int = 0) -> bytes:
+    """
+    A JPEG that looks like a photographed worksheet: noisy paper, lines of dark strokes,
+    stored sideways with EXIF orientation 6 like most phone cameras.
+    """
+    rng = np.random.default_rng(seed)
+    paper = rng.normal(225, 12, size=(height // 8, width // 8, 3)).clip(0, 255).astype(np.uint8)
+    image = Image.fromarray(paper).resize((width, height), Image.BILINEAR)
+    draw = ImageDraw.Draw(image)
+    for line in range(12):
+        y = height // 5 + line * height // 20
+        x = width // 8
+        while x < width * 3 // 4:
+            w = int(rng.integers(width // 80, width // 25))
+            draw.rectangle([x, y, x + w, y + height // 60], fill=(30, 30, 40))
+            x += w + width // 100
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION] = 6
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG", quality=90, exif=exif)
+    return buf.getvalue()
+
+
+def naive_decode(image_bytes: bytes) -> np.ndarray:
+    # What /solve did before: full-resolution decode, then the BGR copy OCR needs
+    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    return np.ascontiguousarray(np.asarray(image)[:, :, ::-1])
+
+
+def time_ms(fn: Callable, inputs: List, repeat: int) -> List[float]:
+    timings = []
+    for _ in range(repeat):
+        for item in inputs:
+            start = time.perf_counter()
+            fn(item)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def ocr_timings(arrays: List[np.ndarray], use_angle_cls: bool) -> List[float]:
+    from paddleocr import PaddleOCR
+
+    model = PaddleOCR(use_angle_cls=use_angle_cls, lang="vi", use_gpu=False, show_log=False)
+    model.ocr(arrays[0], cls=use_angle_cls)  # warm-up
+    return time_ms(lambda array: model.ocr(array, cls=use_angle_cls), arrays, 1)
+
+
+def main(argv: List[str] = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", nargs="*", default=None, help="Image files (default: synthetic photos)")
+    parser.add_argument("--synthetic", type=int, default=4, help="Number of synthetic photos")
+    parser.add_argument("--max-side", type=int, default=1600)
+    parser.add_argument("--crop-to-text", action="store_true")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--ocr", action="store_true", help="Also time PaddleOCR on full-size vs preprocessed images")
+    parser.add_argument("--output", default=None, help="Write results as JSON")
+    args = parser.parse_args(argv)
+
+    if args.images:
+        payloads = []
+        for path in args.images:
+            with open(path, "rb") as f:
+                payloads.append(f.read())
+    else:
+        payloads = [synthetic_photo(seed=i) for i in range(args.synthetic)]
+
+    preprocessor = ImagePreprocessor(max_side=args.max_side, crop_to_text=args.crop_to_text)
+    naive = time_ms(naive_decode, payloads, args.repeat)
+    prepared = time_ms(lambda data: preprocessor.process(data).ocr_array, payloads, args.repeat)
+    stats = preprocessor.stats()
+
+    results = {
+        "images": len(payloads),
+        "max_side": args.max_side,
+        "naive_ms": round(float(np.median(naive)), 1),
+        "preprocess_ms": round(float(np.median(prepared)), 1),
+        "saved_ms": round(float(np.median(naive) - np.median(prepared)), 1),
+        "input_megapixels": round(stats["input_pixels"] / stats["processed"] / 1e6, 2),
+        "output_megapixels": round(stats["output_pixels"] / stats["processed"] / 1e6, 2),
+        "pixel_reduction": round(stats["pixel_reduction"], 3),
+        "draft_decodes": stats["draft_decodes"],
+        "cropped": stats["cropped"],
+    }
+
+    print(f"{'path':<12} {'median ms':>10}")
+    print(f"{'naive':<12} {results['naive_ms']:>10}")
+    print(f"{'preprocess':<12} {results['preprocess_ms']:>10}")
+    print(f"saved {results['saved_ms']} ms per image; {results['input_megapixels']} MP -> "
+          f"{results['output_megapixels']} MP ({results['pixel_reduction']:.0%} fewer pixels for OCR)")
+
+    if args.ocr:
+        try:
+            import paddleocr  # noqa: F401
+        except ImportError:
+            results["ocr"] = {"skipped": "paddleocr is not installed"}
+            print("OCR: skipped, paddleocr is not installed")
+        else:
+            full = [naive_decode(data) for data in payloads]
+            small = [preprocessor.process(data).ocr_array for data in payloads]
+            results["ocr"] = {
+                "full_cls_ms": round(float(np.median(ocr_timings(full, True))), 1),
+                "preprocessed_cls_ms": round(float(np.median(ocr_timings(small, True))), 1),
+                "preprocessed_no_cls_ms": round(float(np.median(ocr_timings(small, False))), 1),
+            }
+            for name, value in results["ocr"].items():
+                print(f"OCR {name:<24} {value:>10}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
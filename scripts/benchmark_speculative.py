@@ -0,0 +1,138 @@
+# scripts/benchmark_speculative.py
+"""
+Speculative decoding on the local backend: tokens/sec and acceptance rate of
+prompt-lookup and draft-model drafting versus plain greedy model.generate, on a fixed
+set of prompts with retrieved solutions (the situation where answers copy long spans).
+
+All modes decode greedily, so their outputs should be identical; the script counts the
+prompts where they differ (in fp16/bf16, verifying several tokens in one pass can flip
+near-tied argmaxes).
+
+Usage:
+    python scripts/benchmark_speculative.py --model microsoft/phi-2 --max-tokens 128
+    python scripts/benchmark_speculative.py --draft-model microsoft/phi-1_5 --draft-tokens 4 8 --output bench_spec.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from llm import LLMEngine
+from speculative import SpeculativeDecoder
+
+QUESTIONS = [
+    "Giải phương trình x^2 - 7x + 12 = 0",
+    "Tính diện tích hình tròn có bán kính 6 cm",
+    "Một xe máy đi với vận tốc 35 km/h trong 3 giờ. Tính quãng đường.",
+    "Tính đạo hàm của hàm số y = 2x^3 - 5x",
+]
+
+RETRIEVED = [
+    [
+        "Giải phương trình x^2 - 5x + 6 = 0\nLời giải: Ta có Δ = b^2 - 4ac = 25 - 24 = 1 > 0. "
+        "Phương trình có hai nghiệm phân biệt x1 = (5 + 1) / 2 = 3 và x2 = (5 - 1) / 2 = 2. Vậy S = {2; 3}.",
+        "Giải phương trình x^2 - 9x + 20 = 0\nLời giải: Ta có Δ = 81 - 80 = 1 > 0. "
+        "Phương trình có hai nghiệm phân biệt x1 = (9 + 1) / 2 = 5 và x2 = (9 - 1) / 2 = 4. Vậy S = {4; 5}.",
+    ],
+    [
+        "Tính diện tích hình tròn có bán kính 5 cm\nLời giải: Diện tích hình tròn là S = π r^2. "
+        "Với r = 5 cm, ta có S = π * 5^2 = 25π ≈ 78,54 cm^2.",
+    ],
+    [
+        "Một ô tô đi với vận tốc 60 km/h trong 2 giờ. Tính quãng đường.\nLời giải: "
+        "Quãng đường = Vận tốc × Thời gian = 60 × 2 = 120 km. Vậy ô tô đi được 120 km.",
+    ],
+    [
+        "Tính đạo hàm của hàm số y = x^3 - 3x\nLời giải: Áp dụng (x^n)' = n x^(n-1), "
+        "ta có y' = 3x^2 - 3. Vậy y' = 3x^2 - 3.",
+    ],
+]
+
+
+def plain(engine: LLMEngine, input_ids, max_tokens: int) -> List[int]:
+    with engine._inference_context():
+        output = engine.model.generate(
+            input_ids=input_ids, max_new_tokens=max_tokens, do_sample=False,
+            pad_token_id=engine.tokenizer.eos_token_id,
+        )
+    return output[0, input_ids.shape[1]:].tolist()
+
+
+def run_mode(name: str, generate, prompts, max_tokens: int, decoder: SpeculativeDecoder = None) -> tuple:
+    outputs, tokens = [], 0
+    start = time.perf_counter()
+    for input_ids in prompts:
+        generated = generate(input_ids, max_tokens)
+        outputs.append(generated)
+        tokens += len(generated)
+    elapsed = time.perf_counter() - start
+    result = {"mode": name, "tokens": tokens, "tokens_per_s": round(tokens / elapsed, 2)}
+    if decoder is not None:
+        stats = decoder.stats()
+        result["acceptance_rate"] = round(stats["acceptance_rate"], 3)
+        result["tokens_per_step"] = round(stats["tokens_per_step"], 2)
+    return result, outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="microsoft/phi-2")
+    parser.add_argument("--precision", default="fp32")
+    parser.add_argument("--draft-model", default=None, help="Also benchmark draft-model drafting")
+    parser.add_argument("--draft-tokens", type=int, nargs="+", default=[4, 8])
+    parser.add_argument("--max-tokens", type=int, default=128)
+    parser.add_argument("--output", default=None, help="Write results as JSON")
+    args = parser.parse_args()
+
+    engine = LLMEngine(model_name_or_path=args.model, backend="phi-2", precision=args.precision,
+                       use_prefix_cache=False)
+    prompts = [
+        engine.tokenizer(engine.build_prompt(q, examples, "algebra"), return_tensors="pt").input_ids.to(engine.device)
+        for q, examples in zip(QUESTIONS, RETRIEVED)
+    ]
+
+    draft_model = None
+    if args.draft_model:
+        from transformers import AutoModelForCausalLM
+
+        draft_model = AutoModelForCausalLM.from_pretrained(
+            args.draft_model, dtype=engine.model.dtype
+        ).to(engine.device).eval()
+
+    plain(engine, prompts[0], 8)  # warm-up; every mode below runs on the same warm model
+    results = []
+    baseline, reference = run_mode("plain", lambda ids, n: plain(engine, ids, n), prompts, args.max_tokens)
+    results.append(baseline)
+
+    methods = ["prompt-lookup"] + (["draft-model"] if draft_model is not None else [])
+    for method in methods:
+        for k in args.draft_tokens:
+            decoder = SpeculativeDecoder(
+                engine.model, eos_token_id=engine.tokenizer.eos_token_id, method=method, draft_model=draft_model,
+                num_draft_tokens=k, device=engine.device, inference_context=engine._inference_context,
+            )
+            result, outputs = run_mode(
+                f"{method} k={k}", lambda ids, n: decoder.generate(ids, n, temperature=0.0), prompts,
+                args.max_tokens, decoder,
+            )
+            result["speedup"] = round(result["tokens_per_s"] / baseline["tokens_per_s"], 2)
+            result["mismatches"] = sum(a != b for a, b in zip(outputs, reference))
+            results.append(result)
+
+    print(f"{'mode':<20} {'tok/s':>8} {'speedup':>8} {'accept':>7} {'tok/step':>9} {'mismatch':>9}")
+    for r in results:
+        print(f"{r['mode']:<20} {r['tokens_per_s']:>8} {r.get('speedup', 1.0):>8} "
+              f"{r.get('acceptance_rate', '-'):>7} {r.get('tokens_per_step', 1.0):>9} {r.get('mismatches', 0):>9}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+# scripts/benchmark_suite.py
+"""
+Offline capacity benchmark for the /solve service with stubbed model backends.
+
+The real FastAPI app (main.py) runs in-process with deterministic stand-ins from
+bench_stubs.py: a fake LLM with configurable time-to-first-token and token rate,
+hashing text embeddings over a synthetic FAISS index, and fixed-latency OCR. A load
+generator drives /solve at each concurrency level and reports p50/p95/p99 latency,
+throughput and the per-stage breakdown from the Server-Timing headers. Micro-benchmarks
+cover Retriever.retrieve, NearDuplicateIndex.lookup, generate_prompt_cot, PromptComposer.compose
+and OCR (real PaddleOCR if installed).
+
+Results are written as JSON; pass a previous result as --baseline to flag regressions.
+
+Usage:
+    python scripts/benchmark_suite.py --concurrency 1 4 16 --requests 200 --output bench.json
+    python scripts/benchmark_suite.py --llm-ttft-ms 800 --llm-tokens-per-s 30 --baseline bench.json
+    python scripts/benchmark_suite.py --url http://localhost:8000 --concurrency 8  # a running server
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(SCRIPTS_DIR), "app"))
+
+from bench_stubs import (
+    FakeLLMEngine, HashingTextEncoder, PixelImageEncoder, build_synthetic_corpus, configure_fake_ocr,
+    fake_run_ocr, fake_run_ocr_batch, synthetic_problem,
+)
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"n": 0}
+    arr = np.asarray(values, dtype=np.float64)
+    return {
+        "n": int(arr.size),
+        "mean": round(float(arr.mean()), 3),
+        "p50": round(float(np.percentile(arr, 50)), 3),
+        "p95": round(float(np.percentile(arr, 95)), 3),
+        "p99": round(float(np.percentile(arr, 99)), 3),
+        "max": round(float(arr.max()), 3),
+    }
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    """
+    "ocr;dur=12.5, llm;dur=800.1, total;dur=815.0" -> {"ocr": 12.5, "llm": 800.1, "total": 815.0}
+    """
+    stages = {}
+    for part in filter(None, (p.strip() for p in (header or "").split(","))):
+        name, _, params = part.partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur":
+                stages[name] = stages.get(name, 0.0) + float(value)
+    return stages
+
+
+def make_payloads(n: int, seed: int = 0) -> List[dict]:
+    """
+    Distinct (image, question) pairs so the OCR and embedding caches see realistic misses.
+    """
+    rng = np.random.default_rng(seed)
+    payloads = []
+    for i in range(n):
+        image = Image.new("RGB", (480, 160), "white")
+        draw = ImageDraw.Draw(image)
+        question = synthetic_problem(int(rng.integers(0, 10_000)))
+        draw.text((10, 60), question, fill="black")
+        x0, y0 = (int(v) for v in rng.integers(0, 120, 2))
+        draw.rectangle([x0, y0, x0 + 40, y0 + 30], outline=(0, 0, 0))
+        buf = io.BytesIO()
+        image.save(buf, format="PNG")
+        payloads.append({"image": buf.getvalue(), "question": f"{question} (#{i})"})
+    return payloads
+
+
+def install_stubs(args, workdir: str):
+    """
+    Import main.py with the stand-in backends registered in place of the real models.
+    """
+    os.environ.setdefault("VIMATH_WARMUP", "0")
+    os.environ["VIMATH_ANSWER_CACHE"] = "1" if args.answer_cache else "0"
+    os.environ.pop("VIMATH_IMAGE_INDEX_PATH", None)
+
+    import main
+    from embeddings.batcher import MicroBatcher
+    from pipeline import StagePool
+    from retriever import Retriever
+
+    text_encoder = HashingTextEncoder(dim=args.dim, delay_ms=args.encode_ms)
+    index_path, corpus_path = build_synthetic_corpus(workdir, args.corpus_size, text_encoder)
+    configure_fake_ocr(args.ocr_ms)
+
+    registry = main.registry
+    registry.register(
+        "text_encoder",
+        lambda: MicroBatcher(text_encoder, max_batch_size=main.ENCODE_MAX_BATCH, max_wait_ms=main.ENCODE_MAX_WAIT_MS),
+        close=lambda encoder: encoder.close(),
+    )
+    registry.register("image_encoder", PixelImageEncoder, required=False)
+    registry.register(
+        "retriever",
+        lambda: Retriever(index_path=index_path, db_path=corpus_path, text_encoder=registry.get("text_encoder")),
+        close=lambda retriever: retriever.close(),
+    )
+    registry.register("llm", lambda: FakeLLMEngine(
+        ttft_ms=args.llm_ttft_ms, tokens_per_s=args.llm_tokens_per_s, answer_tokens=args.llm_answer_tokens,
+        remote=not args.llm_blocking,
+    ))
+
+    # OCR runs on threads with a fixed latency instead of the PaddleOCR process pool
+    main.pipeline.ocr.shutdown(wait=False)
+    main.pipeline.ocr = StagePool("ocr", ThreadPoolExecutor(max_workers=args.ocr_workers), args.ocr_workers)
+    main.run_ocr = fake_run_ocr
+    main.run_ocr_batch = fake_run_ocr_batch
+    registry.register("ocr", lambda: main.pipeline.ocr)
+    return main
+
+
+async def run_level(client, concurrency: int, payloads: List[dict], n_requests: int) -> dict:
+    latencies, stages, errors = [], {}, 0
+    next_request = 0
+
+    async def worker():
+        nonlocal next_request, errors
+        while next_request < n_requests:
+            payload = payloads[next_request % len(payloads)]
+            next_request += 1
+            start = time.perf_counter()
+            try:
+                response = await client.post(
+                    "/solve",
+                    files={"image": ("problem.png", payload["image"], "image/png")},
+                    data={"question": payload["question"]},
+                )
+                ok = response.status_code == 200
+            except Exception:
+                ok, response = False, None
+            elapsed = (time.perf_counter() - start) * 1000
+            if not ok:
+                errors += 1
+                continue
+            latencies.append(elapsed)
+            for stage, ms in parse_server_timing(response.headers.get("server-timing")).items():
+                stages.setdefault(stage, []).append(ms)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "latency_ms": summarize(latencies),
+        "stages_ms": {stage: summarize(values) for stage, values in sorted(stages.items())},
+    }
+
+
+async def run_load(args, app=None) -> List[dict]:
+    import httpx
+
+    if app is not None:
+        transport = httpx.ASGITransport(app=app)
+        client = httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout)
+    else:
+        limits = httpx.Limits(max_connections=max(args.concurrency))
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits)
+
+    # Fresh payloads per level, so a level does not hit the OCR/embedding caches filled by the previous one
+    results = []
+    async with client:
+        if args.warmup_requests:
+            await run_level(client, 1, make_payloads(args.warmup_requests, seed=args.seed), args.warmup_requests)
+        for i, concurrency in enumerate(args.concurrency, start=1):
+            payloads = make_payloads(max(args.distinct, 1), seed=args.seed + i)
+            results.append(await run_level(client, concurrency, payloads, args.requests))
+    return results
+
+
+def time_calls(fn, iterations: int) -> Dict[str, float]:
+    fn()  # warm-up
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1e6)
+    return {f"{k}_us" if k != "n" else k: v for k, v in summarize(timings).items()}
+
+
+def run_micro(args, workdir: str) -> dict:
+    from near_duplicate import NearDuplicateIndex
+    from prompts.composer import PromptComposer
+    from prompts.cot_templates import generate_prompt_cot
+    from retriever import Retriever
+
+    encoder = HashingTextEncoder(dim=args.dim)
+    index_path, corpus_path = os.path.join(workdir, "math.index"), os.path.join(workdir, "corpus.jsonl")
+    if not os.path.exists(index_path):
+        build_synthetic_corpus(workdir, args.corpus_size, encoder)
+    retriever = Retriever(index_path=index_path, db_path=corpus_path, text_encoder=encoder)
+    question = synthetic_problem(12345)
+    examples = retriever.retrieve(question, top_k=3)
+    composer = PromptComposer(FakeLLMEngine().count_tokens, token_budget=512)
+    near_duplicates = NearDuplicateIndex.build(retriever.examples)
+
+    micro = {
+        "retriever.retrieve": time_calls(lambda: retriever.retrieve(question, top_k=3), args.micro_iterations),
+        "NearDuplicateIndex.lookup": time_calls(lambda: near_duplicates.lookup(question), args.micro_iterations),
+        "generate_prompt_cot": time_calls(
+            lambda: generate_prompt_cot(question, examples, "algebra"), args.micro_iterations
+        ),
+        "PromptComposer.compose": time_calls(
+            lambda: composer.compose(question, examples, "algebra"), args.micro_iterations
+        ),
+    }
+    retriever.close()
+
+    try:
+        import paddleocr  # noqa: F401
+    except ImportError:
+        micro["run_ocr"] = {"skipped": "paddleocr is not installed"}
+    else:
+        from ocr import run_ocr
+
+        image = Image.open(io.BytesIO(make_payloads(1)[0]["image"])).convert("RGB")
+        micro["run_ocr"] = time_calls(lambda: run_ocr(image), max(1, args.micro_iterations // 100))
+    return micro
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=SCRIPTS_DIR).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "git_commit": commit,
+    }
+
+
+def compare(results: dict, baseline: dict, max_regression: float) -> List[str]:
+    """
+    p95 latency / throughput regressions per concurrency level and micro-benchmark.
+    """
+    problems = []
+    base_levels = {level["concurrency"]: level for level in baseline.get("load", [])}
+    for level in results.get("load", []):
+        base = base_levels.get(level["concurrency"])
+        if not base or not base["latency_ms"].get("p95"):
+            continue
+        ratio = level["latency_ms"]["p95"] / base["latency_ms"]["p95"] - 1
+        if ratio > max_regression:
+            problems.append(f"/solve p95 at concurrency {level['concurrency']} is {ratio:+.0%} vs baseline")
+        if base["throughput_rps"] and level["throughput_rps"] < base["throughput_rps"] * (1 - max_regression):
+            problems.append(f"/solve throughput at concurrency {level['concurrency']} dropped below baseline")
+    for name, stats in results.get("micro", {}).items():
+        base = baseline.get("micro", {}).get(name, {})
+        if "p95_us" in stats and base.get("p95_us"):
+            ratio = stats["p95_us"] / base["p95_us"] - 1
+            if ratio > max_regression:
+                problems.append(f"{name} p95 is {ratio:+.0%} vs baseline")
+    return problems
+
+
+def print_report(results: dict):
+    if results.get("load"):
+        print(f"{'conc':>5} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}  stages (mean ms)")
+        for level in results["load"]:
+            lat = level["latency_ms"]
+            stages = " ".join(f"{s}={v['mean']:.1f}" for s, v in level["stages_ms"].items() if s != "total")
+            print(f"{level['concurrency']:>5} {level['throughput_rps']:>8} {lat.get('p50', '-'):>9} "
+                  f"{lat.get('p95', '-'):>9} {lat.get('p99', '-'):>9} {level['errors']:>7}  {stages}")
+    for name, stats in results.get("micro", {}).items():
+        if "skipped" in stats:
+            print(f"{name:<22} skipped: {stats['skipped']}")
+        else:
+            print(f"{name:<22} p50 {stats['p50_us']:>10} us   p95 {stats['p95_us']:>10} us")
+
+
+def main(argv: Optional[List[str]] = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument("--warmup-requests", type=int, default=5)
+    parser.add_argument("--distinct", type=int, default=200, help="Distinct (image, question) payloads")
+    parser.add_argument("--url", default=None, help="Load-test a running server instead of the in-process app")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    # Stand-in backends
+    parser.add_argument("--llm-ttft-ms", type=float, default=300.0)
+    parser.add_argument("--llm-tokens-per-s", type=float, default=50.0)
+    parser.add_argument("--llm-answer-tokens", type=int, default=120)
+    parser.add_argument("--llm-blocking", action="store_true", help="Fake a local (thread-bound) LLM instead of a remote one")
+    parser.add_argument("--ocr-ms", type=float, default=50.0)
+    parser.add_argument("--ocr-workers", type=int, default=1)
+    parser.add_argument("--encode-ms", type=float, default=0.0, help="Extra latency per encode batch")
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--corpus-size", type=int, default=20000)
+    parser.add_argument("--answer-cache", action="store_true", help="Keep the semantic answer cache on")
+    # Micro-benchmarks and output
+    parser.add_argument("--micro-iterations", type=int, default=1000)
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--output", default=None, help="Write results as JSON")
+    parser.add_argument("--baseline", default=None, help="Previous --output JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed p95 slowdown vs baseline")
+    args = parser.parse_args(argv)
+
+    # One log line per request would drown the report
+    for name in ("vimath.requests", "httpx"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    results = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "environment": environment(), "config": vars(args)}
+    with tempfile.TemporaryDirectory(prefix="vimath-bench-") as workdir:
+        if not args.skip_load:
+            if args.url:
+                results["load"] = asyncio.run(run_load(args))
+            else:
+                service = install_stubs(args, workdir)
+                try:
+                    results["load"] = asyncio.run(run_load(args, service.app))
+                finally:
+                    service.shutdown_pipeline()
+        if not args.skip_micro:
+            results["micro"] = run_micro(args, workdir)
+
+    print_report(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            problems = compare(results, json.load(f), args.max_regression)
+        for problem in problems:
+            print(f"❌ {problem}")
+        if problems:
+            sys.exit(1)
+        print("✅ No regressions against the baseline")
+    return results
+
+
+if __name__ == "__main__":
+    main()
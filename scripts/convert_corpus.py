@@ -0,0 +1,100 @@
+# scripts/convert_corpus.py
+"""
+Convert the retriever corpus (corpus.jsonl or corpus.pkl) into a memory-mapped
+CorpusStore directory, and compare how long each format takes to open, the RSS
+it costs and how fast the top-k rows of a query are read back.
+
+Each loader runs in its own subprocess so RSS is measured in isolation.
+
+Usage:
+    python scripts/convert_corpus.py --source data/processed/corpus.pkl --store data/processed/corpus_store
+    python scripts/convert_corpus.py --source data/processed/corpus.jsonl --store data/processed/corpus_store --compare
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+sys.path.insert(0, APP_DIR)
+
+from corpus_store import convert_to_store, load_corpus
+
+
+def rss_mb() -> float:
+    # Current (not peak) resident set size, so mapped-but-untouched pages don't count
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_worker(path: str, queries: int, top_k: int) -> dict:
+    base = rss_mb()
+    start = time.perf_counter()
+    corpus = load_corpus(path)
+    load_s = time.perf_counter() - start
+    loaded = rss_mb()
+
+    rng = np.random.default_rng(0)
+    rows = rng.integers(0, len(corpus), size=(queries, top_k))
+    start = time.perf_counter()
+    for hit in rows:
+        [corpus[int(i)].get("content", "") for i in hit]
+    lookup_us = (time.perf_counter() - start) / queries * 1e6
+
+    return {
+        "path": path,
+        "records": len(corpus),
+        "load_ms": round(load_s * 1000, 2),
+        "rss_delta_mb": round(loaded - base, 1),
+        "top_k_lookup_us": round(lookup_us, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", required=True, help="corpus.jsonl or corpus.pkl")
+    parser.add_argument("--store", required=True, help="Output CorpusStore directory")
+    parser.add_argument("--compare", action="store_true", help="Benchmark the source file against the store")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.source, args.queries, args.top_k), ensure_ascii=False))
+        return
+
+    start = time.perf_counter()
+    n = convert_to_store(args.source, args.store)
+    print(f"✅ Wrote {n} records to {args.store} in {time.perf_counter() - start:.1f}s")
+
+    if not args.compare:
+        return
+
+    results = []
+    for path in (args.source, args.store):
+        cmd = [sys.executable, os.path.abspath(__file__), "--worker", "--source", path, "--store", args.store,
+               "--queries", str(args.queries), "--top-k", str(args.top_k)]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"[{path}] failed:\n{proc.stderr[-2000:]}")
+            continue
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    print(f"{'corpus':<40} {'load ms':>9} {'RSS MB':>8} {'top-k us':>9}")
+    for r in results:
+        print(f"{os.path.basename(r['path'].rstrip(os.sep)):<40} {r['load_ms']:>9} {r['rss_delta_mb']:>8} {r['top_k_lookup_us']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# scripts/export_onnx.py
+"""
+Export TextEncoder / ImageEncoder models to ONNX (optionally int8 quantized) and
+check that the ONNX Runtime embeddings match the PyTorch ones.
+
+The exported directories are what TextEncoder(..., backend="onnx") and
+ImageEncoder(..., backend="onnx" / "onnx-int8") load (VIMATH_ENCODER_BACKEND in main.py).
+
+Usage:
+    python scripts/export_onnx.py --output-dir models/onnx --quantize
+    python scripts/export_onnx.py --output-dir models/onnx --skip-image --check-only
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from embeddings.onnx_backend import export_image_model, export_text_model, parity_report
+
+TEXT_MODEL = "VoVanPhuc/sup-SimCSE-VietNamese-phobert-base"
+IMAGE_MODEL = "clip-ViT-B-32"
+
+SAMPLE_TEXTS = [
+    "Giải phương trình x^2 - 5x + 6 = 0",
+    "Tính đạo hàm của hàm số y = sin(2x) + cos(x)",
+    "Cho tam giác ABC vuông tại A, AB = 3, AC = 4. Tính BC.",
+    "Tìm giá trị lớn nhất của hàm số y = -x^2 + 4x + 1 trên đoạn [0; 3]",
+    "Một cấp số cộng có u1 = 2 và công sai d = 3. Tính tổng 10 số hạng đầu.",
+]
+
+# Minimum cosine similarity between torch and ONNX embeddings of the same input
+FP32_MIN_COSINE = 0.9999
+INT8_MIN_COSINE = 0.99
+
+
+def sample_images():
+    images = []
+    for i, size in enumerate([(640, 480), (480, 640), (300, 300), (1024, 200)]):
+        image = Image.new("RGB", size, "white")
+        draw = ImageDraw.Draw(image)
+        draw.text((10 + 20 * i, size[1] // 3), SAMPLE_TEXTS[i], fill="black")
+        draw.line((0, 0, size[0], size[1]), fill=(40 * i, 0, 200), width=3)
+        images.append(image)
+    return images
+
+
+def check_text(path: str, backends):
+    from embeddings.text_encoder import TextEncoder
+
+    reference = TextEncoder(TEXT_MODEL).encode(SAMPLE_TEXTS)
+    return {b: parity_report(reference, TextEncoder(path, backend=b).encode(SAMPLE_TEXTS)) for b in backends}
+
+
+def check_image(path: str, backends):
+    from embeddings.image_encoder import ImageEncoder
+
+    images = sample_images()
+    reference = ImageEncoder(IMAGE_MODEL).encode(images)
+    return {b: parity_report(reference, ImageEncoder(path, backend=b).encode(images)) for b in backends}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output-dir", default=os.path.join("models", "onnx"))
+    parser.add_argument("--text-model", default=TEXT_MODEL)
+    parser.add_argument("--image-model", default=IMAGE_MODEL)
+    parser.add_argument("--quantize", action="store_true", help="Also write an int8 dynamically quantized model")
+    parser.add_argument("--opset", type=int, default=14)
+    parser.add_argument("--skip-text", action="store_true")
+    parser.add_argument("--skip-image", action="store_true")
+    parser.add_argument("--check-only", action="store_true", help="Only run the parity check on existing exports")
+    args = parser.parse_args()
+
+    text_dir = os.path.join(args.output_dir, "text")
+    image_dir = os.path.join(args.output_dir, "image")
+    if not args.check_only:
+        if not args.skip_text:
+            export_text_model(args.text_model, text_dir, quantize=args.quantize, opset=args.opset)
+            print(f"✅ Exported {args.text_model} to {text_dir}")
+        if not args.skip_image:
+            export_image_model(args.image_model, image_dir, quantize=args.quantize, opset=args.opset)
+            print(f"✅ Exported {args.image_model} to {image_dir}")
+
+    failed = False
+    for kind, path, check in (("text", text_dir, check_text), ("image", image_dir, check_image)):
+        if getattr(args, f"skip_{kind}"):
+            continue
+        backends = ["onnx"] + (["onnx-int8"] if os.path.isfile(os.path.join(path, "model_int8.onnx")) else [])
+        for backend, report in check(path, backends).items():
+            min_cosine = INT8_MIN_COSINE if backend == "onnx-int8" else FP32_MIN_COSINE
+            ok = report["min_cosine"] >= min_cosine
+            failed |= not ok
+            print(f"{'✅' if ok else '❌'} {kind:<5} {backend:<9} {json.dumps(report)} (min cosine >= {min_cosine})")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# scripts/serve.py
+"""
+Pre-fork production launcher for the /solve service.
+
+`uvicorn app.main:app --workers N` starts N independent processes, each reading the
+FAISS index and the corpus and loading its own PhoBERT / CLIP / PaddleOCR weights, so
+memory grows by a full copy per worker. This launcher loads that read-only state once
+(main.PREFORK_COMPONENTS, without warm-up), opens the index memory-mapped, binds the
+port and then forks the workers, which share the loaded pages copy-on-write and the
+index pages through the page cache. Each worker then warms up and serves as usual.
+
+Dead workers are restarted; SIGTERM / SIGINT stops them gracefully. Every
+--memory-report-interval seconds the log shows each process's RSS, PSS, unique
+(private) and shared memory: unique is what one more worker would cost.
+GET /stats/memory reports the same for the worker answering it.
+
+Usage:
+    python scripts/serve.py --workers 4 --port 8000
+    python scripts/serve.py --workers 2 --preload text_encoder retriever --memory-report-interval 10
+"""
+
+import argparse
+import logging
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from prefork import PreforkSupervisor
+
+logger = logging.getLogger("serve")
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--preload", nargs="*", default=None,
+                        help="Components loaded before forking (default: main.PREFORK_COMPONENTS; none if empty)")
+    parser.add_argument("--no-mmap", action="store_true", help="Read the FAISS index into each process instead")
+    parser.add_argument("--graceful-timeout", type=float, default=30.0)
+    parser.add_argument("--memory-report-interval", type=float, default=60.0, help="Seconds, 0 disables")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(process)d %(name)s %(levelname)s %(message)s")
+    # Read by main.create_retriever, so it has to be set before main is imported
+    os.environ["VIMATH_INDEX_MMAP"] = "0" if args.no_mmap else "1"
+
+    import uvicorn
+
+    import main as service
+
+    start = time.perf_counter()
+    preload = service.PREFORK_COMPONENTS if args.preload is None else args.preload
+    if preload:
+        service.preload_shared(preload)
+    logger.info(f"Preloaded {preload} in {time.perf_counter() - start:.1f}s")
+
+    sock = bind_socket(args.host, args.port)
+    logger.info(f"Listening on {args.host}:{args.port} with {args.workers} workers")
+
+    def run_worker(index: int):
+        service.after_fork()
+        config = uvicorn.Config(service.app, log_level=args.log_level)
+        uvicorn.Server(config).run(sockets=[sock])
+
+    supervisor = PreforkSupervisor(
+        run_worker, args.workers,
+        graceful_timeout=args.graceful_timeout,
+        memory_report_interval=args.memory_report_interval,
+    )
+    try:
+        supervisor.run()
+    finally:
+        sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,66 @@
 # scripts/setup_vectorstore.py
+"""
+Build (or update) the FAISS index and corpus store used by the retriever.
+
+The dataset is streamed in chunks: each chunk's questions are encoded in batches
+and, with --image-dir, its images are decoded and CLIP-encoded in a process pool
+while the text is being encoded. Vectors are appended to an IndexIDMap2 whose ids
+are corpus rows, records to the CorpusStore, and a checkpoint is written every
+--checkpoint-every chunks, so an interrupted build resumes where it stopped.
+
+With --image-index, image vectors go to their own index (same ids) instead of
+being concatenated to the text vectors, so the retriever can search text-only
+queries on the smaller text index and fuse the two result lists.
+
+--incremental keeps a manifest of problem id -> content hash next to the index and
+only embeds problems that are new or changed; changed and deleted problems are
+removed from the index (not supported for HNSW, rebuild instead).
+
+Every build also rewrites the MinHash/LSH index of the problem texts (--dedup-index),
+which lets the API answer problems that are already in the corpus from their stored
+solution (see app/near_duplicate.py).
+
+Usage:
+    python scripts/setup_vectorstore.py --dataset data/math_samples.jsonl --index-type ivf_flat
+    python scripts/setup_vectorstore.py --dataset data/math_samples.jsonl --image-dir data/images --image-workers 4
+    python scripts/setup_vectorstore.py --dataset data/math_samples.jsonl --image-dir data/images \
+        --image-index data/faiss_index/math_image.index
+    python scripts/setup_vectorstore.py --dataset data/math_samples.jsonl --incremental
+    python scripts/setup_vectorstore.py --dataset data/math_samples.jsonl --no-dedup-index
+"""
 
 import os
+import sys
 import json
+import time
+import hashlib
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
+
+import faiss
+import numpy as np
 from tqdm import tqdm
-from PIL import Image
 
-from app.embeddings.text_encoder import TextEncoder
-from app.embeddings.image_encoder import ImageEncoder
-from app.retriever import Retriever
-from app.utils import clean_text
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from corpus_store import CorpusStore, CorpusStoreWriter
+from index_factory import INDEX_TYPES, create_index, train_index
+from near_duplicate import NearDuplicateIndex
+from utils import clean_text, ensure_dir
+
+logger = logging.getLogger(__name__)
 
-DATASET_PATH = "data/math_samples.json"     # JSONL or JSON list format
-IMAGE_FOLDER = "data/images/"               # Where associated images (if any) are stored
+DATASET_PATH = "data/math_samples.json"     # JSONL (streamed) or JSON list format
+INDEX_PATH = "data/faiss_index/math.index"
+CORPUS_PATH = "data/processed/corpus_store"
+DEDUP_INDEX_PATH = "data/faiss_index/math.minhash"
+IMAGE_MODEL = "clip-ViT-B-32"
+
+# Index types that must be trained before the first vector is added
+TRAINED_INDEX_TYPES = ("ivf_flat", "ivf_pq")
 
-# Initialize models
-text_encoder = TextEncoder()
-image_encoder = ImageEncoder()
-retriever = Retriever(text_encoder=text_encoder, image_encoder=image_encoder)
 
 def load_dataset(dataset_path: str):
     """
@@ -25,45 +69,542 @@ def load_dataset(dataset_path: str):
     Returns:
         List[Dict]: List of problems with keys: 'id', 'question', 'solution', (optional) 'image_filename'
     """
+    return list(iter_dataset(dataset_path))
+
+
+def iter_dataset(dataset_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yield problems one at a time. JSONL is read line by line; a JSON list has to be
+    parsed whole first.
+    """
     with open(dataset_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    return data
+        if dataset_path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(f)
+
+
+def iter_chunks(dataset_path: str, chunk_size: int) -> Iterator[List[Dict[str, Any]]]:
+    chunk = []
+    for item in iter_dataset(dataset_path):
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
 
 
-def build_vector_index():
+def count_problems(dataset_path: str) -> int:
+    if dataset_path.endswith(".jsonl"):
+        with open(dataset_path, "rb") as f:
+            return sum(1 for line in f if line.strip())
+    return len(load_dataset(dataset_path))
+
+
+def content_hash(item: Dict[str, Any]) -> str:
+    """
+    Hash of everything that ends up in the embedding or the corpus row.
     """
-    Process dataset into vector store using the retriever.
+    payload = json.dumps(
+        [item.get("question", ""), item.get("solution", ""), item.get("image_filename")],
+        ensure_ascii=False,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def make_record(item: Dict[str, Any]) -> Dict[str, Any]:
+    question = clean_text(item["question"])
+    solution = clean_text(item.get("solution", ""))
+    return {
+        "id": item["id"],
+        "question": question,
+        "solution": solution,
+        "image_filename": item.get("image_filename"),
+        "content": f"{question}\n{solution}".strip(),
+    }
+
+
+# Image worker processes: each loads its own CLIP encoder once
+_image_encoder = None
+
+
+def _init_image_worker(model_name: str):
+    global _image_encoder
+    from embeddings.image_encoder import ImageEncoder
+    _image_encoder = ImageEncoder(model_name)
+
+
+def _image_dim() -> int:
+    from PIL import Image
+    return _image_encoder.encode(Image.new("RGB", (32, 32))).shape[1]
+
+
+def _encode_image_files(paths: List[str]) -> tuple:
+    """
+    Decode and encode a batch of image files. Unreadable files are skipped.
+
+    Returns:
+        Tuple: (embeddings of the readable images, list of booleans marking which paths were read)
+    """
+    from PIL import Image
+
+    images, ok = [], []
+    for path in paths:
+        try:
+            with Image.open(path) as img:
+                images.append(img.convert("RGB"))
+            ok.append(True)
+        except Exception as e:
+            logger.warning(f"Skipping unreadable image {path}: {e}")
+            ok.append(False)
+    if not images:
+        return np.zeros((0, 0), dtype="float32"), ok
+    return np.asarray(_image_encoder.encode(images), dtype="float32"), ok
+
+
+def _write_json_atomic(path: str, data: Any):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+class VectorStoreBuilder:
+    """
+    Streaming, checkpointed builder for the retriever's index and corpus store.
+
+    Next to the index it keeps `<index>.state.json` (progress of the current run) and
+    `<index>.manifest.json` (problem id -> {"hash", "row"} for every indexed problem).
     """
-    problems = load_dataset(DATASET_PATH)
-    added = 0
-
-    for item in tqdm(problems, desc="Indexing problems"):
-        problem_id = item["id"]
-        question = clean_text(item["question"])
-        solution = clean_text(item.get("solution", ""))
-        image_path = None
-
-        if "image_filename" in item:
-            image_path = os.path.join(IMAGE_FOLDER, item["image_filename"])
-            if not os.path.exists(image_path):
-                print(f"[Warning] Image {image_path} not found, skipping image encoding.")
-
-        image = None
-        if image_path and os.path.exists(image_path):
-            try:
-                image = Image.open(image_path).convert("RGB")
-            except Exception as e:
-                print(f"[Error] Failed to open image {image_path}: {e}")
-
-        retriever.add_to_index(
-            problem_id=problem_id,
-            text=question,
-            solution=solution,
-            image=image
-        )
-        added += 1
-
-    print(f"✅ Indexed {added} math problems.")
+
+    def __init__(
+        self,
+        index_path: str = INDEX_PATH,
+        corpus_path: str = CORPUS_PATH,
+        index_type: str = "flat",
+        chunk_size: int = 1024,
+        batch_size: int = 64,
+        checkpoint_every: int = 1,
+        image_dir: Optional[str] = None,
+        image_workers: int = 2,
+        image_model: str = IMAGE_MODEL,
+        train_size: int = 100_000,
+        text_encoder: Any = None,
+        image_index_path: Optional[str] = None,
+        image_index_type: str = "flat",
+        dedup_index_path: Optional[str] = None,
+        **index_kwargs,
+    ):
+        """
+        Args:
+            index_path (str): Output FAISS index file.
+            corpus_path (str): Output CorpusStore directory (row i = index id i).
+            index_type (str): One of index_factory.INDEX_TYPES.
+            chunk_size (int): Problems read and encoded per chunk.
+            batch_size (int): Texts / images per encoder call.
+            checkpoint_every (int): Write index, store and state every N chunks.
+            image_dir (str): Root of the problems' image_filename; enables image embeddings.
+            image_workers (int): Processes decoding and CLIP-encoding images.
+            image_model (str): Image encoder model.
+            train_size (int): Vectors buffered to train IVF indexes before anything is added.
+            text_encoder: Encoder with an `encode(list_of_str)` method; defaults to TextEncoder().
+            image_index_path (str): Write image vectors to this separate index (needs image_dir)
+                instead of concatenating them to the text vectors.
+            image_index_type (str): "flat" or "hnsw" for the image index.
+            dedup_index_path (str): Also write the MinHash near-duplicate index of the indexed problems here.
+            **index_kwargs: Passed to index_factory.create_index (nlist, pq_m, hnsw_m, ...).
+        """
+        self.index_path = index_path
+        self.corpus_path = corpus_path
+        self.state_path = index_path + ".state.json"
+        self.manifest_path = index_path + ".manifest.json"
+        self.index_type = index_type
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.checkpoint_every = checkpoint_every
+        self.image_dir = image_dir
+        self.train_size = train_size
+        self.index_kwargs = {k: v for k, v in index_kwargs.items() if v is not None}
+        if image_index_path and not image_dir:
+            raise ValueError("image_index_path needs image_dir")
+        if image_index_type not in ("flat", "hnsw"):
+            raise ValueError("The image index must be flat or hnsw (it is never trained)")
+        self.image_index_path = image_index_path
+        self.image_index_type = image_index_type
+        self.dedup_index_path = dedup_index_path
+
+        if text_encoder is None:
+            from embeddings.text_encoder import TextEncoder
+            text_encoder = TextEncoder()
+        self.text_encoder = text_encoder
+
+        self.image_pool = None
+        self.image_dim = 0
+        if image_dir:
+            self.image_pool = ProcessPoolExecutor(
+                max_workers=image_workers, initializer=_init_image_worker, initargs=(image_model,)
+            )
+            self.image_dim = self.image_pool.submit(_image_dim).result()
+
+        self.index = None
+        self.image_index = None
+        self.writer = None
+        self.manifest: Dict[str, Dict[str, Any]] = {}
+        self.state: Dict[str, Any] = {}
+
+    def close(self):
+        if self.image_pool is not None:
+            self.image_pool.shutdown()
+
+    def _load_state(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.state_path):
+            return None
+        with open(self.state_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _open(self, dataset_path: str, incremental: bool, resume: bool):
+        """
+        Start a fresh build, continue an interrupted one, or open a finished one for an incremental update.
+        """
+        previous = self._load_state()
+        ensure_dir(os.path.dirname(self.index_path))
+        ensure_dir(os.path.dirname(os.path.normpath(self.corpus_path)))
+
+        if previous and resume and not previous["complete"]:
+            if self._settings() != self._settings(previous):
+                raise ValueError(
+                    f"Checkpoint was written with {self._settings(previous)}; use the same settings or --no-resume"
+                )
+            self.state = previous
+            logger.info(f"Resuming {previous['mode']} build after {previous['records_done']} problems")
+        elif incremental:
+            if not (previous and previous["complete"] and os.path.exists(self.manifest_path)):
+                raise FileNotFoundError("--incremental needs a completed build to update")
+            if self._settings() != self._settings(previous):
+                raise ValueError(f"The original build used {self._settings(previous)}; use the same settings")
+            self.state = dict(previous, mode="incremental", dataset=dataset_path, records_done=0, complete=False)
+        else:
+            # A stale index or manifest must not be picked up by a later resume
+            for path in (self.index_path, self.image_index_path, self.manifest_path):
+                if path and os.path.exists(path):
+                    os.remove(path)
+            self.state = {
+                "mode": "full",
+                "dataset": dataset_path,
+                "index_type": self.index_type,
+                "image_dim": self.image_dim,
+                "image_index": bool(self.image_index_path),
+                "records_done": 0,
+                "rows": 0,
+                "complete": False,
+            }
+            self.writer = CorpusStoreWriter(self.corpus_path)
+            _write_json_atomic(self.state_path, self.state)
+            return
+
+        # Roll the store, index and manifest back to the last state checkpoint
+        rows = self.state["rows"]
+        self.writer = CorpusStoreWriter(self.corpus_path, append=True)
+        if len(self.writer) < rows:
+            raise RuntimeError(f"Corpus store has {len(self.writer)} rows, checkpoint expects {rows}")
+        self.writer.truncate(rows)
+
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding="utf-8") as f:
+                self.manifest = {k: v for k, v in json.load(f).items() if v["row"] < rows}
+        self.index = self._read_index_at(self.index_path, self.index_type, rows)
+        if self.index is None and rows:
+            raise RuntimeError(f"{self.index_path} is missing but the checkpoint expects {rows} rows")
+        if self.image_index_path:
+            self.image_index = self._read_index_at(self.image_index_path, self.image_index_type, rows)
+
+    def _settings(self, state: Dict[str, Any] = None) -> Dict[str, Any]:
+        if state is None:
+            return {"index_type": self.index_type, "image_dim": self.image_dim,
+                    "image_index": bool(self.image_index_path)}
+        return {"index_type": state["index_type"], "image_dim": state["image_dim"],
+                "image_index": state.get("image_index", False)}
+
+    @staticmethod
+    def _read_index_at(path: str, index_type: str, rows: int):
+        """
+        Read an index and drop any ids written after the checkpoint (ids >= rows).
+        """
+        if not os.path.exists(path):
+            return None
+        index = faiss.read_index(path)
+        ids = faiss.vector_to_array(faiss.downcast_index(index).id_map)
+        if len(ids) and ids.max() >= rows:
+            if index_type == "hnsw":
+                raise RuntimeError(f"HNSW index {path} is ahead of its checkpoint and cannot be rolled back; use --no-resume")
+            index.remove_ids(faiss.IDSelectorRange(rows, int(ids.max()) + 1))
+        return index
+
+    def _encode_chunk(self, items: List[Dict[str, Any]], records: List[Dict[str, Any]]) -> tuple:
+        """
+        Embed one chunk: images are encoded in the pool while the text is encoded here.
+
+        Returns:
+            Tuple: (index vectors, image vectors or None, bool mask of rows with a readable image or None).
+                Without a separate image index the image part is already concatenated to the index vectors.
+        """
+        image_jobs = []
+        if self.image_pool is not None:
+            with_image = [i for i, item in enumerate(items) if item.get("image_filename")]
+            for start in range(0, len(with_image), self.batch_size):
+                rows = with_image[start:start + self.batch_size]
+                paths = [os.path.join(self.image_dir, items[i]["image_filename"]) for i in rows]
+                image_jobs.append((rows, self.image_pool.submit(_encode_image_files, paths)))
+
+        questions = [r["question"] for r in records]
+        text_vecs = np.vstack([
+            self.text_encoder.encode(questions[start:start + self.batch_size])
+            for start in range(0, len(questions), self.batch_size)
+        ]).astype("float32")
+        if self.image_pool is None:
+            return text_vecs, None, None
+
+        # Problems without a (readable) image keep a zero image part, like text-only queries
+        image_vecs = np.zeros((len(items), self.image_dim), dtype="float32")
+        has_image = np.zeros(len(items), dtype=bool)
+        for rows, future in image_jobs:
+            vectors, ok = future.result()
+            read = [row for row, was_read in zip(rows, ok) if was_read]
+            if read:
+                image_vecs[read] = vectors
+                has_image[read] = True
+        if self.image_index_path:
+            return text_vecs, image_vecs, has_image
+        return np.hstack([text_vecs, image_vecs]), None, None
+
+    def _remove_rows(self, rows: List[int]):
+        if not rows:
+            return
+        for index, index_type in ((self.index, self.index_type), (self.image_index, self.image_index_type)):
+            if index is None:
+                continue
+            if index_type == "hnsw":
+                raise NotImplementedError("HNSW indexes cannot remove vectors; rebuild without --incremental")
+            index.remove_ids(np.asarray(rows, dtype="int64"))
+
+    def _commit(
+        self,
+        vectors: np.ndarray,
+        image_vecs: Optional[np.ndarray],
+        has_image: Optional[np.ndarray],
+        items: List[Dict[str, Any]],
+        records: List[Dict[str, Any]],
+        n_problems: int,
+    ):
+        """
+        Append vectors and records, replacing the earlier rows of changed problems.
+        """
+        if self.index is None:
+            base = create_index(vectors.shape[1], self.index_type, n_vectors=n_problems, **self.index_kwargs)
+            self.index = faiss.IndexIDMap2(base)
+        if not self.index.is_trained:
+            train_index(self.index, vectors, train_size=self.train_size)
+
+        stale = [self.manifest[str(item["id"])]["row"] for item in items if str(item["id"]) in self.manifest]
+        self._remove_rows(stale)
+
+        rows = np.asarray(self.writer.add_many(records), dtype="int64")
+        self.index.add_with_ids(vectors, rows)
+        if image_vecs is not None and has_image.any():
+            if self.image_index is None:
+                base = create_index(image_vecs.shape[1], self.image_index_type, **self.index_kwargs)
+                self.image_index = faiss.IndexIDMap2(base)
+            self.image_index.add_with_ids(image_vecs[has_image], rows[has_image])
+        for item, row in zip(items, rows.tolist()):
+            self.manifest[str(item["id"])] = {"hash": content_hash(item), "row": row}
+
+    def _checkpoint(self, records_done: int, complete: bool = False):
+        # Order matters for resume: store, then index, then manifest, then state
+        self.writer.flush()
+        for index, path in ((self.index, self.index_path), (self.image_index, self.image_index_path)):
+            if index is not None:
+                faiss.write_index(index, path + ".tmp")
+                os.replace(path + ".tmp", path)
+        _write_json_atomic(self.manifest_path, self.manifest)
+        self.state.update(records_done=records_done, rows=len(self.writer), complete=complete)
+        _write_json_atomic(self.state_path, self.state)
+
+    def _build_dedup_index(self):
+        """
+        Rebuild the near-duplicate index from the live rows (rows of changed or deleted
+        problems stay in the store but must not be matched). Hashing is cheap next to
+        embedding, so it is not updated incrementally.
+        """
+        store = CorpusStore(self.corpus_path)
+        try:
+            rows = sorted(entry["row"] for entry in self.manifest.values())
+            NearDuplicateIndex.build(store, rows).save(self.dedup_index_path)
+        finally:
+            store.close()
+
+    def build(self, dataset_path: str, incremental: bool = False, resume: bool = True) -> Dict[str, Any]:
+        """
+        Stream the dataset into the index and corpus store.
+
+        Args:
+            dataset_path (str): JSONL (streamed) or JSON list of problems.
+            incremental (bool): Only embed new/changed problems and drop deleted ones.
+            resume (bool): Continue an interrupted run from its checkpoint if there is one.
+
+        Returns:
+            Dict: Counters for the run (embedded, unchanged, removed, vectors, seconds).
+        """
+        start_time = time.perf_counter()
+        self._open(dataset_path, incremental, resume)
+        skip = self.state["records_done"]
+        only_changed = self.state["mode"] == "incremental"
+        n_problems = count_problems(dataset_path)
+
+        seen = set()
+        pending_vecs, pending_image_vecs, pending_has_image, pending_items, pending_records = [], [], [], [], []
+        counters = {"embedded": 0, "unchanged": 0, "removed": 0}
+        position = 0
+        chunks_since_checkpoint = 0
+
+        def stack_pending():
+            if pending_image_vecs[0] is None:
+                return np.vstack(pending_vecs), None, None
+            return np.vstack(pending_vecs), np.vstack(pending_image_vecs), np.concatenate(pending_has_image)
+
+        progress = tqdm(total=n_problems, initial=min(skip, n_problems), desc="Indexing problems")
+        for chunk in iter_chunks(dataset_path, self.chunk_size):
+            todo = []
+            fresh = 0
+            for item in chunk:
+                position += 1
+                key = str(item["id"])
+                seen.add(key)
+                if position <= skip:
+                    continue
+                fresh += 1
+                entry = self.manifest.get(key)
+                if only_changed and entry is not None and entry["hash"] == content_hash(item):
+                    counters["unchanged"] += 1
+                    continue
+                todo.append(item)
+            if not fresh:
+                continue
+
+            if todo:
+                records = [make_record(item) for item in todo]
+                vectors, image_vecs, has_image = self._encode_chunk(todo, records)
+                pending_vecs.append(vectors)
+                pending_image_vecs.append(image_vecs)
+                pending_has_image.append(has_image)
+                pending_items.extend(todo)
+                pending_records.extend(records)
+                counters["embedded"] += len(todo)
+
+            # An untrained IVF index buffers vectors until there are enough to train on
+            training = self.index_type in TRAINED_INDEX_TYPES and (self.index is None or not self.index.is_trained)
+            if not training or len(pending_items) >= min(self.train_size, n_problems):
+                if pending_items:
+                    self._commit(*stack_pending(), pending_items, pending_records, n_problems)
+                    pending_vecs, pending_image_vecs, pending_has_image, pending_items, pending_records = [], [], [], [], []
+                chunks_since_checkpoint += 1
+                if chunks_since_checkpoint >= self.checkpoint_every:
+                    self._checkpoint(position)
+                    chunks_since_checkpoint = 0
+            progress.update(fresh)
+        progress.close()
+
+        if pending_items:
+            self._commit(*stack_pending(), pending_items, pending_records, n_problems)
+        if only_changed:
+            deleted = [key for key in self.manifest if key not in seen]
+            self._remove_rows([self.manifest[key]["row"] for key in deleted])
+            for key in deleted:
+                del self.manifest[key]
+            counters["removed"] = len(deleted)
+        self._checkpoint(position, complete=True)
+        self.writer.close()
+        if self.dedup_index_path:
+            self._build_dedup_index()
+
+        counters["vectors"] = self.index.ntotal if self.index is not None else 0
+        counters["seconds"] = round(time.perf_counter() - start_time, 1)
+        return counters
+
+
+def build_vector_index(
+    dataset_path: str = DATASET_PATH,
+    index_path: str = INDEX_PATH,
+    corpus_path: str = CORPUS_PATH,
+    index_type: str = "flat",
+    batch_size: int = 64,
+    incremental: bool = False,
+    resume: bool = True,
+    **builder_kwargs,
+):
+    """
+    Encode the problems and write the FAISS index plus the matching corpus store
+    (index id i is corpus row i).
+    """
+    builder = VectorStoreBuilder(index_path, corpus_path, index_type=index_type, batch_size=batch_size, **builder_kwargs)
+    try:
+        counters = builder.build(dataset_path, incremental=incremental, resume=resume)
+    finally:
+        builder.close()
+
+    print(f"✅ {counters['embedded']} problems embedded, {counters['unchanged']} unchanged, "
+          f"{counters['removed']} removed; {counters['vectors']} vectors in the {index_type} index "
+          f"({counters['seconds']}s).")
+    return counters
 
 if __name__ == "__main__":
-    build_vector_index()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--index", default=INDEX_PATH)
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--index-type", default="flat", choices=INDEX_TYPES)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--chunk-size", type=int, default=1024, help="Problems per streamed chunk")
+    parser.add_argument("--checkpoint-every", type=int, default=1, help="Chunks between checkpoints")
+    parser.add_argument("--incremental", action="store_true", help="Only embed new or changed problems")
+    parser.add_argument("--no-resume", action="store_true", help="Ignore an interrupted run and start over")
+    parser.add_argument("--image-dir", default=None, help="Root of image_filename; enables image embeddings")
+    parser.add_argument("--image-workers", type=int, default=2)
+    parser.add_argument("--image-model", default=IMAGE_MODEL)
+    parser.add_argument("--image-index", default=None, help="Separate image index file (default: concatenate)")
+    parser.add_argument("--image-index-type", default="flat", choices=("flat", "hnsw"))
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default ~4*sqrt(n))")
+    parser.add_argument("--pq-m", type=int, default=16, help="IVF-PQ sub-quantizers")
+    parser.add_argument("--pq-bits", type=int, default=8, help="IVF-PQ bits per code")
+    parser.add_argument("--hnsw-m", type=int, default=32, help="HNSW neighbours per node")
+    parser.add_argument("--ef-construction", type=int, default=200, help="HNSW build beam width")
+    parser.add_argument("--train-size", type=int, default=100_000, help="IVF training sample size")
+    parser.add_argument("--dedup-index", default=DEDUP_INDEX_PATH, help="MinHash near-duplicate index directory")
+    parser.add_argument("--no-dedup-index", action="store_true", help="Do not write the near-duplicate index")
+    args = parser.parse_args()
+
+    build_vector_index(
+        dataset_path=args.dataset,
+        index_path=args.index,
+        corpus_path=args.corpus,
+        index_type=args.index_type,
+        batch_size=args.batch_size,
+        incremental=args.incremental,
+        resume=not args.no_resume,
+        chunk_size=args.chunk_size,
+        checkpoint_every=args.checkpoint_every,
+        image_dir=args.image_dir,
+        image_workers=args.image_workers,
+        image_model=args.image_model,
+        image_index_path=args.image_index,
+        image_index_type=args.image_index_type,
+        train_size=args.train_size,
+        dedup_index_path=None if args.no_dedup_index else args.dedup_index,
+        nlist=args.nlist,
+        pq_m=args.pq_m,
+        pq_bits=args.pq_bits,
+        hnsw_m=args.hnsw_m,
+        ef_construction=args.ef_construction,
+    )
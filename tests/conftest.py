@@ -0,0 +1,10 @@
+# tests/conftest.py
+
+import os
+import sys
+
+# Modules under app/ import each other by flat name (e.g. `from utils import clean_text`),
+# as they do when the service runs from inside app/.
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
@@ -0,0 +1,84 @@
+# tests/test_answer_cache.py
+
+import numpy as np
+
+from app.answer_cache import AnswerCache, make_fingerprint, math_signature
+
+PAYLOAD = {"answer": "x = 2 hoặc x = 3"}
+
+
+def unit(*values):
+    vec = np.array(values, dtype=np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+def test_paraphrase_hits_and_different_numbers_miss():
+    cache = AnswerCache(fingerprint="v1", threshold=0.9)
+    cache.put(unit(1, 0, 0), "Giải phương trình x^2 - 5x + 6 = 0", PAYLOAD)
+
+    hit = cache.lookup(unit(1, 0.1, 0), "Tìm nghiệm của x^2 - 5x + 6 = 0", None)
+    assert hit["answer"] == PAYLOAD["answer"]
+    assert hit["similarity"] > 0.9
+
+    assert cache.lookup(unit(1, 0.1, 0), "Giải phương trình x^2 - 5x + 7 = 0") is None
+    assert cache.lookup(unit(0, 1, 0), "Giải phương trình x^2 - 5x + 6 = 0") is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+    assert stats["hit_rate"] == 1 / 3
+
+
+def test_image_hash_must_match():
+    cache = AnswerCache(fingerprint="v1", phash_threshold=2)
+    cache.put(unit(1, 0), "x + 1 = 2", PAYLOAD, image_hash=0b1111)
+
+    assert cache.lookup(unit(1, 0), "x + 1 = 2", image_hash=0b1110) is not None
+    assert cache.lookup(unit(1, 0), "x + 1 = 2", image_hash=0b0000) is None
+    assert cache.lookup(unit(1, 0), "x + 1 = 2", image_hash=None) is None
+
+
+def test_lru_and_ttl_eviction(monkeypatch):
+    cache = AnswerCache(fingerprint="v1", max_entries=2, ttl_seconds=60)
+    for i, q in enumerate(["1", "2", "3"]):
+        cache.put(unit(*np.eye(3)[i]), q, {"answer": q})
+    assert cache.lookup(unit(1, 0, 0), "1") is None
+    assert cache.stats()["evictions"] == 1
+
+    import app.answer_cache as module
+    now = module.time.time()
+    monkeypatch.setattr(module.time, "time", lambda: now + 120)
+    assert cache.lookup(unit(0, 1, 0), "2") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_fingerprint_change_invalidates_disk_entries(tmp_path):
+    path = str(tmp_path / "answers.sqlite")
+    cache = AnswerCache(fingerprint=make_fingerprint("template-a", "gemini"), disk_path=path)
+    cache.put(unit(1, 0), "1 + 1", PAYLOAD)
+    cache.close()
+
+    reopened = AnswerCache(fingerprint=make_fingerprint("template-a", "gemini"), disk_path=path)
+    assert reopened.lookup(unit(1, 0), "1 + 1")["answer"] == PAYLOAD["answer"]
+    reopened.close()
+
+    changed = AnswerCache(fingerprint=make_fingerprint("template-b", "gemini"), disk_path=path)
+    assert changed.lookup(unit(1, 0), "1 + 1") is None
+    assert changed.stats()["invalidations"] == 1
+
+
+def test_workers_sharing_the_disk_tier_get_distinct_ids(tmp_path):
+    path = str(tmp_path / "answers.sqlite")
+    first = AnswerCache(fingerprint="v1", disk_path=path)
+    second = AnswerCache(fingerprint="v1", disk_path=path)
+    first.put(unit(1, 0), "1 + 1", {"answer": "2"})
+    second.put(unit(0, 1), "2 + 2", {"answer": "4"})
+    first.close()
+    second.close()
+
+    reopened = AnswerCache(fingerprint="v1", disk_path=path)
+    assert reopened.lookup(unit(1, 0), "1 + 1")["answer"] == "2"
+    assert reopened.lookup(unit(0, 1), "2 + 2")["answer"] == "4"
+
+
+def test_math_signature_ignores_wording():
+    assert math_signature("Giải  x^2 = 4") == math_signature("Tìm x biết x^2 = 4") == "^ 2 = 4"
@@ -0,0 +1,76 @@
+# tests/test_batcher.py
+
+import threading
+
+import numpy as np
+import pytest
+
+from app.embeddings.batcher import MicroBatcher
+
+
+class FakeEncoder:
+    """Deterministic stand-in: row i is [len(text), call_index]."""
+
+    def __init__(self):
+        self.calls = []
+        self.model_name_or_path = "fake"
+
+    def encode(self, texts):
+        self.calls.append(list(texts))
+        return np.array([[len(t), len(self.calls)] for t in texts], dtype="float32")
+
+
+def test_each_caller_gets_its_own_row():
+    encoder = FakeEncoder()
+    batcher = MicroBatcher(encoder, max_batch_size=8, max_wait_ms=50)
+    texts = ["a" * i for i in range(1, 17)]
+    results = {}
+
+    def worker(t):
+        results[t] = batcher.encode(t)
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in texts]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    batcher.close()
+
+    for t in texts:
+        assert results[t].shape == (1, 2)
+        assert results[t][0, 0] == len(t)
+
+    # Concurrent single-query calls were coalesced into fewer forward passes
+    assert len(encoder.calls) < len(texts)
+    assert all(len(call) <= 8 for call in encoder.calls)
+
+    stats = batcher.stats()
+    assert stats["items"] == len(texts)
+    assert stats["batches"] == len(encoder.calls)
+    assert sum(stats["batch_size_histogram"].values()) == stats["batches"]
+    assert 0 < stats["mean_fill_ratio"] <= 1
+
+
+def test_list_input_and_attribute_passthrough():
+    batcher = MicroBatcher(FakeEncoder(), max_batch_size=4, max_wait_ms=1)
+    out = batcher.encode(["x", "yy", "zzz"])
+    batcher.close()
+
+    assert out.shape == (3, 2)
+    assert list(out[:, 0]) == [1, 2, 3]
+    assert batcher.model_name_or_path == "fake"
+
+
+def test_encoder_errors_reach_every_caller():
+    class Broken:
+        def encode(self, texts):
+            raise RuntimeError("boom")
+
+    batcher = MicroBatcher(Broken(), max_batch_size=4, max_wait_ms=1)
+    with pytest.raises(RuntimeError, match="boom"):
+        batcher.encode("x")
+    assert batcher.stats()["errors"] == 1
+    batcher.close()
+
+    with pytest.raises(RuntimeError):
+        batcher.submit("y")
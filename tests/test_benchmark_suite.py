@@ -0,0 +1,64 @@
+# tests/test_benchmark_suite.py
+
+import asyncio
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("httpx")
+pytest.importorskip("multipart")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+from bench_stubs import FakeLLMEngine, HashingTextEncoder
+from benchmark_suite import compare, main, parse_server_timing, summarize
+
+
+def test_parse_server_timing_and_summarize():
+    assert parse_server_timing("ocr;dur=12.5, llm;dur=800, total;dur=815.1") == {
+        "ocr": 12.5, "llm": 800.0, "total": 815.1,
+    }
+    assert parse_server_timing(None) == {}
+
+    stats = summarize(list(range(1, 101)))
+    assert stats["n"] == 100
+    assert stats["p50"] == pytest.approx(50.5)
+    assert stats["p99"] == pytest.approx(99.01)
+
+
+def test_stubs_are_deterministic():
+    encoder = HashingTextEncoder(dim=64)
+    a, b, c = encoder.encode(["x^2 - 5x + 6 = 0", "x^2 - 5x + 6 = 0", "diện tích hình tròn"])
+    np.testing.assert_array_equal(a, b)
+    assert float(a @ c) < 0.9
+
+    llm = FakeLLMEngine(ttft_ms=1, tokens_per_s=0, answer_tokens=5)
+    assert asyncio.run(llm.agenerate_answer("p")) == llm.generate_answer("p")
+    assert llm.count_tokens(llm.generate_answer("p")) == 5
+
+
+def test_end_to_end_run_writes_json(tmp_path):
+    output = tmp_path / "bench.json"
+    results = main([
+        "--concurrency", "1", "3", "--requests", "6", "--distinct", "6", "--warmup-requests", "1",
+        "--llm-ttft-ms", "1", "--llm-tokens-per-s", "0", "--llm-answer-tokens", "10", "--ocr-ms", "1",
+        "--corpus-size", "200", "--dim", "32", "--micro-iterations", "5", "--output", str(output),
+    ])
+
+    saved = json.loads(output.read_text(encoding="utf-8"))
+    assert [level["concurrency"] for level in saved["load"]] == [1, 3]
+    for level in saved["load"]:
+        assert level["errors"] == 0
+        assert level["latency_ms"]["n"] == 6
+        assert {"ocr", "encode", "search", "llm"} <= set(level["stages_ms"])
+    assert "p95_us" in saved["micro"]["retriever.retrieve"]
+
+    # A baseline twice as fast flags the run as a regression
+    baseline = json.loads(json.dumps(results))
+    for level in baseline["load"]:
+        level["latency_ms"]["p95"] /= 2
+    assert compare(results, baseline, max_regression=0.2)
+    assert not compare(results, results, max_regression=0.2)
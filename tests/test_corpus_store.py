@@ -0,0 +1,57 @@
+# tests/test_corpus_store.py
+
+import json
+import pickle
+
+import pytest
+
+from app.corpus_store import CorpusStore, CorpusStoreWriter, convert_to_store, load_corpus
+
+
+def test_round_trip_and_random_access(tmp_path):
+    records = [{"id": i, "content": f"Bài {i}: tính {i} + {i}"} for i in range(5)]
+    with CorpusStoreWriter(str(tmp_path)) as writer:
+        assert writer.add_many(records) == list(range(5))
+
+    store = CorpusStore(str(tmp_path))
+    assert len(store) == 5
+    assert store[3] == records[3]
+    assert store[-1] == records[-1]
+    assert store.get_many([4, 0]) == [records[4], records[0]]
+    assert list(store) == records
+    with pytest.raises(IndexError):
+        store[5]
+    store.close()
+
+
+def test_append_discards_unflushed_bytes(tmp_path):
+    with CorpusStoreWriter(str(tmp_path)) as writer:
+        writer.add("first")
+
+    # Simulate a writer killed before flush: bytes written, offsets not updated
+    crashed = CorpusStoreWriter(str(tmp_path), append=True)
+    crashed.add("lost")
+    crashed._file.flush()
+    crashed._file.close()
+
+    with CorpusStoreWriter(str(tmp_path), append=True) as writer:
+        assert writer.add("second") == 1
+
+    store = CorpusStore(str(tmp_path))
+    assert [r["content"] for r in store] == ["first", "second"]
+    store.close()
+
+
+def test_convert_pickle_and_jsonl(tmp_path):
+    pkl_path = tmp_path / "corpus.pkl"
+    with open(pkl_path, "wb") as f:
+        pickle.dump(["a", "b"], f)
+    jsonl_path = tmp_path / "corpus.jsonl"
+    jsonl_path.write_text("\n".join(json.dumps({"content": c}) for c in "xyz"), encoding="utf-8")
+
+    assert convert_to_store(str(pkl_path), str(tmp_path / "from_pkl")) == 2
+    assert convert_to_store(str(jsonl_path), str(tmp_path / "from_jsonl")) == 3
+
+    assert load_corpus(str(tmp_path / "from_pkl"))[1] == {"content": "b"}
+    assert load_corpus(str(pkl_path))[1] == {"content": "b"}
+    assert list(load_corpus(str(tmp_path / "from_jsonl"))) == load_corpus(str(jsonl_path))
@@ -0,0 +1,48 @@
+# tests/test_embedding_cache.py
+
+import numpy as np
+
+from app.embeddings.cache import EmbeddingCache
+
+
+def test_normalized_text_hits_memory_tier():
+    cache = EmbeddingCache("model-a", max_entries=2)
+    vec = np.arange(4, dtype=np.float32)
+
+    assert cache.get_many(["x^2 = 4"]) == [None]
+    cache.put_many(["x^2 = 4"], vec[None, :])
+
+    hit = cache.get_many(["  x^2   =\n4 "])[0]
+    np.testing.assert_array_equal(hit, vec)
+
+    stats = cache.stats()
+    assert stats["memory_hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_model_name_is_part_of_the_key():
+    assert EmbeddingCache("model-a").key("abc") != EmbeddingCache("model-b").key("abc")
+
+
+def test_disk_tier_is_shared_and_persistent(tmp_path):
+    vectors = np.random.default_rng(0).random((3, 8), dtype=np.float32)
+    texts = ["a", "b", "c"]
+
+    writer = EmbeddingCache("model-a", disk_dir=str(tmp_path))
+    reader = EmbeddingCache("model-a", disk_dir=str(tmp_path))  # e.g. another uvicorn worker
+
+    writer.put_many(texts[:2], vectors[:2])
+    np.testing.assert_array_equal(reader.get_many(["b"])[0], vectors[1])
+
+    # Rows appended after the reader mapped the file are picked up too
+    writer.put_many(texts, vectors)
+    np.testing.assert_array_equal(reader.get_many(["c"])[0], vectors[2])
+    assert reader.stats()["disk_hits"] == 2
+    assert reader.stats()["disk_entries"] == 3
+    writer.close()
+    reader.close()
+
+    restarted = EmbeddingCache("model-a", disk_dir=str(tmp_path))
+    found = restarted.get_many(texts)
+    np.testing.assert_array_equal(np.vstack(found), vectors)
+    restarted.close()
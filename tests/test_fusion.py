@@ -0,0 +1,38 @@
+# tests/test_fusion.py
+
+import numpy as np
+import pytest
+
+from app.fusion import fuse, reciprocal_rank_fusion, weighted_score_fusion
+
+
+def hits(ids, scores=None):
+    scores = scores if scores is not None else [1.0 - 0.1 * i for i in range(len(ids))]
+    return np.array(scores, dtype=np.float32), np.array(ids, dtype=np.int64)
+
+
+def test_text_only_when_image_branch_is_skipped():
+    text = hits([3, 1, 2, -1])  # -1 = FAISS padding
+    assert fuse(text, None, top_k=5) == [3, 1, 2]
+    assert fuse(text, hits([9, 8]), top_k=2, image_weight=0) == [3, 1]
+
+
+def test_rrf_rewards_agreement_between_branches():
+    fused = reciprocal_rank_fusion([(hits([1, 2, 3]), 1.0), (hits([2, 4]), 1.0)], rrf_k=60)
+    assert max(fused, key=fused.get) == 2
+    assert fuse(hits([1, 2, 3]), hits([2, 4]), top_k=2) == [2, 1]
+
+
+def test_weighted_fusion_uses_weights_and_missing_score_floor():
+    text = hits([1, 2], [0.9, 0.5])
+    image = hits([2, 3], [0.8, 0.7])
+    fused = weighted_score_fusion([(text, 1.0), (image, 2.0)])
+    # id 1 is absent from the image list: it gets the image branch's lowest score (0.7)
+    assert fused[1] == pytest.approx(0.9 + 2 * 0.7)
+    assert fused[2] == pytest.approx(0.5 + 2 * 0.8)
+    assert fuse(text, image, top_k=3, method="weighted", image_weight=2.0) == [1, 2, 3]
+
+
+def test_unknown_method_is_rejected():
+    with pytest.raises(ValueError):
+        fuse(hits([1]), hits([2]), top_k=1, method="max")
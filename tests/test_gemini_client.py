@@ -0,0 +1,175 @@
+# tests/test_gemini_client.py
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.gemini_client import GeminiClient, GeminiError, backoff_delay
+
+
+class FakeGemini:
+    """
+    Stand-in for the Gemini REST API: generateContent and streamGenerateContent?alt=sse,
+    with scripted failures, a response delay and a record of every call.
+    """
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.failures = []  # status codes returned by the next calls, in order
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with fake._lock:
+                    fake.calls.append({"path": self.path, "key": self.headers.get("x-goog-api-key"), "body": body})
+                    status = fake.failures.pop(0) if fake.failures else 200
+                    fake.active += 1
+                    fake.max_active = max(fake.max_active, fake.active)
+                try:
+                    time.sleep(fake.delay)
+                    prompt = body["contents"][0]["parts"][0]["text"]
+                    if status != 200:
+                        self._send(status, {"error": {"code": status, "message": "unavailable"}}, {"Retry-After": "0"})
+                    elif ":streamGenerateContent" in self.path:
+                        chunks = [f"answer to {prompt}", " (streamed)"]
+                        payload = "".join(
+                            f"data: {json.dumps({'candidates': [{'content': {'parts': [{'text': c}]}}]})}\r\n\r\n"
+                            for c in chunks
+                        ).encode()
+                        self._send_raw(200, payload, "text/event-stream")
+                    else:
+                        self._send(200, {"candidates": [{"content": {"parts": [{"text": f"answer to {prompt}"}]}}]})
+                finally:
+                    with fake._lock:
+                        fake.active -= 1
+
+            def _send(self, status, data, headers=None):
+                self._send_raw(status, json.dumps(data).encode(), "application/json", headers)
+
+            def _send_raw(self, status, payload, content_type, headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1beta"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def fake():
+    server = FakeGemini()
+    yield server
+    server.close()
+
+
+def make_client(fake, **kwargs):
+    kwargs.setdefault("backoff_base", 0.01)
+    return GeminiClient(api_key="test-key", model="gemini-test", base_url=fake.url, temperature=0.5, **kwargs)
+
+
+def test_generate_sends_gemini_request(fake):
+    client = make_client(fake)
+
+    assert asyncio.run(client.generate("1 + 1")) == "answer to 1 + 1"
+
+    call = fake.calls[0]
+    assert call["path"] == "/v1beta/models/gemini-test:generateContent"
+    assert call["key"] == "test-key"
+    assert call["body"]["generationConfig"] == {"temperature": 0.5}
+    client.close()
+
+
+def test_transient_errors_are_retried(fake):
+    client = make_client(fake, max_retries=2)
+    fake.failures = [503, 429]
+
+    assert asyncio.run(client.generate("q")) == "answer to q"
+    assert len(fake.calls) == 3
+    assert client.stats()["retries"] == 2
+
+    fake.failures = [503, 503, 503]
+    with pytest.raises(GeminiError) as error:
+        asyncio.run(client.generate("q"))
+    assert error.value.status == 503
+
+    fake.failures = [400]
+    calls = len(fake.calls)
+    with pytest.raises(GeminiError):
+        asyncio.run(client.generate("q"))
+    assert len(fake.calls) == calls + 1
+
+
+def test_identical_prompts_in_flight_share_one_call(fake):
+    fake.delay = 0.2
+    client = make_client(fake)
+
+    async def burst():
+        return await asyncio.gather(*[client.generate("same") for _ in range(5)], client.generate("other"))
+
+    answers = asyncio.run(burst())
+
+    assert answers == ["answer to same"] * 5 + ["answer to other"]
+    assert len(fake.calls) == 2
+    stats = client.stats()
+    assert stats["coalesced"] == 4
+    assert stats["in_flight_prompts"] == 0
+
+
+def test_concurrency_cap(fake):
+    fake.delay = 0.1
+    client = make_client(fake, max_concurrency=2)
+
+    async def burst():
+        return await asyncio.gather(*[client.generate(f"q{i}") for i in range(6)])
+
+    asyncio.run(burst())
+
+    assert len(fake.calls) == 6
+    assert fake.max_active <= 2
+
+
+def test_streaming_and_blocking_paths(fake):
+    client = make_client(fake)
+
+    async def collect():
+        return [chunk async for chunk in client.stream("x")]
+
+    fake.failures = [503]
+    assert asyncio.run(collect()) == ["answer to x", " (streamed)"]
+    assert fake.calls[-1]["path"] == "/v1beta/models/gemini-test:streamGenerateContent?alt=sse"
+
+    assert client.generate_sync("y") == "answer to y"
+    assert "".join(client.stream_sync("z")) == "answer to z (streamed)"
+    client.close()
+
+
+def test_backoff_is_jittered_and_capped():
+    delays = [backoff_delay(3, base=0.5, cap=2.0) for _ in range(200)]
+
+    assert all(0 <= d <= 2.0 for d in delays)
+    assert len(set(delays)) > 100
+    assert backoff_delay(0, base=0.5, cap=2.0, retry_after="1.5") == 1.5
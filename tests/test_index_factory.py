@@ -0,0 +1,93 @@
+# tests/test_index_factory.py
+
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+from app.index_factory import INDEX_TYPES, build_index, create_index, read_index, search_parameters, set_search_params
+
+DIM = 32
+K = 10
+# Minimum recall@10 against exact search at nprobe=8 / efSearch=64
+MIN_RECALL = {"flat": 1.0, "ivf_flat": 0.9, "ivf_pq": 0.5, "hnsw": 0.9}
+
+
+def normalized(x):
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype("float32")
+
+
+@pytest.fixture(scope="module")
+def data():
+    # Clustered like real embeddings, so IVF lists and PQ codebooks have structure to learn
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(20, DIM))
+    embeddings = normalized(centers[rng.integers(0, 20, 2000)] + 0.3 * rng.normal(size=(2000, DIM)))
+    queries = normalized(embeddings[rng.choice(2000, 50, replace=False)] + 0.1 * rng.normal(size=(50, DIM)))
+    _, exact = build_index(embeddings, "flat").search(queries, K)
+    return embeddings, queries, exact
+
+
+def build(embeddings, index_type):
+    return build_index(embeddings, index_type, nlist=32, pq_m=8, hnsw_m=16, ef_construction=64)
+
+
+def recall(found, exact):
+    return np.mean([len(set(f) & set(e)) / K for f, e in zip(found, exact)])
+
+
+@pytest.mark.parametrize("index_type", INDEX_TYPES)
+def test_recall_against_exact_search(data, index_type):
+    embeddings, queries, exact = data
+    index = build(embeddings, index_type)
+    set_search_params(index, nprobe=8, ef_search=64)
+
+    _, found = index.search(queries, K)
+
+    assert index.ntotal == len(embeddings)
+    assert recall(found, exact) >= MIN_RECALL[index_type]
+
+
+def test_search_knobs(data):
+    embeddings, queries, exact = data
+    ivf, hnsw, flat = (build(embeddings, t) for t in ("ivf_flat", "hnsw", "flat"))
+
+    set_search_params(ivf, nprobe=32, ef_search=48)
+    set_search_params(hnsw, nprobe=32, ef_search=48)
+    set_search_params(flat, nprobe=32, ef_search=48)
+
+    assert faiss.extract_index_ivf(ivf).nprobe == 32
+    assert hnsw.hnsw.efSearch == 48
+    # Probing every list is exhaustive
+    assert recall(ivf.search(queries, K)[1], exact) == 1.0
+
+    params = search_parameters(ivf, nprobe=1)
+    assert isinstance(params, faiss.SearchParametersIVF) and params.nprobe == 1
+    assert recall(ivf.search(queries, K, params=params)[1], exact) < 1.0
+    assert search_parameters(hnsw, ef_search=16).efSearch == 16
+    assert search_parameters(flat, nprobe=4, ef_search=16) is None
+
+
+@pytest.mark.parametrize("index_type", INDEX_TYPES)
+def test_mmap_read_returns_the_same_results(data, tmp_path, index_type):
+    embeddings, queries, _ = data
+    index = build(embeddings, index_type)
+    path = str(tmp_path / f"{index_type}.index")
+    faiss.write_index(index, path)
+
+    mapped = read_index(path, mmap=True)
+    for i in (index, mapped):
+        set_search_params(i, nprobe=8, ef_search=64)
+
+    assert mapped.ntotal == index.ntotal
+    expected_scores, expected_ids = index.search(queries, K)
+    scores, ids = mapped.search(queries, K)
+    np.testing.assert_array_equal(ids, expected_ids)
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-6)
+
+
+def test_create_index_rejects_bad_settings():
+    with pytest.raises(ValueError):
+        create_index(DIM, "ivf_pq", n_vectors=1000, pq_m=5)
+    with pytest.raises(ValueError):
+        create_index(DIM, "lsh")
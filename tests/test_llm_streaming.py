@@ -0,0 +1,178 @@
+# tests/test_llm_streaming.py
+
+import argparse
+import asyncio
+import io
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+pytest.importorskip("dotenv")
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from app.llm import LLMEngine, _aiter_in_thread
+
+
+class StubTokenizer:
+    """One token per word; token i decodes to "w<i> "."""
+
+    def __call__(self, text, return_tensors=None, add_special_tokens=True):
+        return SimpleNamespace(input_ids=torch.zeros((1, len(text.split())), dtype=torch.long))
+
+    def decode(self, ids, skip_special_tokens=False, **kwargs):
+        return "".join(f"w{int(i)} " for i in ids)
+
+
+class StubModel:
+    """generate() streams tokens 1, 2, ... like model.generate, or raises `error` straight away."""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.steps = 0
+
+    def generate(self, input_ids, max_new_tokens, streamer, stopping_criteria, **kwargs):
+        if self.error is not None:
+            raise self.error
+        streamer.put(input_ids)
+        generated = input_ids
+        for step in range(max_new_tokens):
+            token = torch.tensor([[step + 1]])
+            generated = torch.cat([generated, token], dim=-1)
+            self.steps += 1
+            streamer.put(token[0])
+            if stopping_criteria(generated, None).all():
+                break
+            time.sleep(0.002)
+        streamer.end()
+        return generated
+
+
+def stub_engine(model, max_tokens=500):
+    # Bypass __init__, which downloads and loads the real model
+    engine = LLMEngine.__new__(LLMEngine)
+    engine.backend = "phi-2"
+    engine.tokenizer = StubTokenizer()
+    engine.model = model
+    engine.max_tokens = max_tokens
+    engine.temperature = 0.7
+    engine.precision = "fp32"
+    engine.device = torch.device("cpu")
+    engine.use_prefix_cache = False
+    engine.prefix_caches = {}
+    engine.scheduler = None
+    engine.speculative_decoder = None
+    return engine
+
+
+def test_stream_yields_generated_text():
+    engine = stub_engine(StubModel(), max_tokens=3)
+
+    assert "".join(engine.stream_answer("một hai")) == "w1 w2 w3 "
+
+
+def test_generate_error_reaches_the_consumer():
+    engine = stub_engine(StubModel(error=RuntimeError("CUDA out of memory")))
+    result = {}
+
+    def consume():
+        try:
+            list(engine.stream_answer("một hai"))
+        except RuntimeError as e:
+            result["error"] = str(e)
+
+    consumer = threading.Thread(target=consume, daemon=True)
+    consumer.start()
+    consumer.join(timeout=5)
+
+    assert not consumer.is_alive(), "the stream blocked after generate() failed"
+    assert result == {"error": "CUDA out of memory"}
+
+
+def test_closing_the_stream_stops_generation():
+    model = StubModel()
+    stream = stub_engine(model).stream_answer("một hai")
+
+    assert next(stream) == "w1 "
+    stream.close()
+
+    assert model.steps < 10
+
+
+def test_async_consumer_leaving_stops_the_producer():
+    produced = []
+    stopped = threading.Event()
+
+    def numbers(stop):
+        try:
+            for i in range(1000):
+                produced.append(i)
+                yield i
+                time.sleep(0.002)
+        finally:
+            stopped.set()
+
+    async def main():
+        stream = _aiter_in_thread(numbers)
+        first = [await stream.__anext__() for _ in range(3)]
+        await stream.aclose()
+        return first
+
+    assert asyncio.run(main()) == [0, 1, 2]
+    assert stopped.wait(timeout=5)
+    assert len(produced) < 100
+
+
+def test_async_stream_reraises_producer_errors():
+    def failing(stop):
+        yield "a"
+        raise ValueError("tokenizer exploded")
+
+    async def main():
+        return [item async for item in _aiter_in_thread(failing)]
+
+    with pytest.raises(ValueError, match="tokenizer exploded"):
+        asyncio.run(main())
+
+
+def test_solve_stream_reports_generate_errors(tmp_path):
+    pytest.importorskip("faiss")
+    pytest.importorskip("httpx")
+    pytest.importorskip("multipart")
+    from fastapi.testclient import TestClient
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+    from bench_stubs import FakeLLMEngine
+    from benchmark_suite import install_stubs
+
+    args = argparse.Namespace(
+        answer_cache=False, dim=32, encode_ms=0.0, corpus_size=50, ocr_ms=1.0, ocr_workers=1,
+        llm_ttft_ms=1.0, llm_tokens_per_s=0.0, llm_answer_tokens=5, llm_blocking=False,
+    )
+    service = install_stubs(args, str(tmp_path))
+    engine = stub_engine(StubModel(error=RuntimeError("CUDA out of memory")))
+    # The local engine's prompt composer needs the real tokenizer
+    engine.compose_prompt = FakeLLMEngine().compose_prompt
+    service.registry.register("llm", lambda: engine)
+    image = io.BytesIO()
+    Image.new("RGB", (64, 64), "white").save(image, "PNG")
+
+    try:
+        with TestClient(service.app) as client:
+            response = client.post(
+                "/solve/stream",
+                files={"image": ("problem.png", image.getvalue(), "image/png")},
+                data={"question": "Giải phương trình x + 1 = 2"},
+            )
+    finally:
+        service.shutdown_pipeline()
+
+    assert response.status_code == 200
+    assert "event: error" in response.text
+    assert "CUDA out of memory" in response.text
+    assert "event: done" not in response.text
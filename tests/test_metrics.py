@@ -0,0 +1,80 @@
+# tests/test_metrics.py
+
+import asyncio
+import json
+import logging
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.metrics import (
+    STAGE_ERRORS, STAGE_IN_FLIGHT, STAGE_LATENCY, MetricsRegistry, RequestMetricsMiddleware, record_tokens,
+    track_stage,
+)
+
+
+def test_render_prometheus_text_format():
+    registry = MetricsRegistry()
+    requests = registry.counter("test_requests_total", "Requests.", ["path"])
+    latency = registry.histogram("test_latency_seconds", "Latency.", ["stage"], buckets=(0.1, 1.0))
+
+    requests.inc(path="/solve")
+    requests.inc(2, path="/solve")
+    latency.observe(0.05, stage="ocr")
+    latency.observe(0.5, stage="ocr")
+    latency.observe(5.0, stage="ocr")
+
+    text = registry.render()
+    assert "# TYPE test_requests_total counter" in text
+    assert 'test_requests_total{path="/solve"} 3' in text
+    assert 'test_latency_seconds_bucket{stage="ocr",le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{stage="ocr",le="1"} 2' in text
+    assert 'test_latency_seconds_bucket{stage="ocr",le="+Inf"} 3' in text
+    assert 'test_latency_seconds_count{stage="ocr"} 3' in text
+
+    with pytest.raises(ValueError):
+        requests.inc(path="/solve", method="POST")
+    with pytest.raises(ValueError):
+        requests.inc(-1, path="/solve")
+
+
+def test_track_stage_records_latency_and_errors():
+    async def run():
+        async with track_stage("unit_ok", backend="test"):
+            assert STAGE_IN_FLIGHT.value(stage="unit_ok", backend="test") == 1
+        with pytest.raises(RuntimeError):
+            async with track_stage("unit_fail", backend="test"):
+                raise RuntimeError("boom")
+
+    asyncio.run(run())
+    assert STAGE_IN_FLIGHT.value(stage="unit_ok", backend="test") == 0
+    assert STAGE_LATENCY.count(stage="unit_ok", backend="test") == 1
+    assert STAGE_ERRORS.value(stage="unit_fail", backend="test") == 1
+    assert STAGE_ERRORS.value(stage="unit_ok", backend="test") == 0
+
+
+def test_middleware_adds_server_timing_and_logs_request(caplog):
+    app = FastAPI()
+    app.add_middleware(RequestMetricsMiddleware)
+
+    @app.get("/work")
+    async def work():
+        async with track_stage("ocr", backend="test"):
+            await asyncio.sleep(0.01)
+        record_tokens(12, 5, backend="test")
+        return {"ok": True}
+
+    with caplog.at_level(logging.INFO, logger="vimath.requests"):
+        response = TestClient(app).get("/work", headers={"X-Request-ID": "req-1"})
+
+    assert response.status_code == 200
+    assert response.headers["x-request-id"] == "req-1"
+    assert response.headers["server-timing"].startswith("ocr;dur=")
+    assert "total;dur=" in response.headers["server-timing"]
+
+    record = json.loads(caplog.records[-1].getMessage())
+    assert record["request_id"] == "req-1"
+    assert record["status"] == 200
+    assert record["stages_ms"]["ocr"] >= 10
+    assert record["prompt_tokens"] == 12 and record["completion_tokens"] == 5
@@ -0,0 +1,77 @@
+# tests/test_near_duplicate.py
+
+import pytest
+
+from app.corpus_store import CorpusStore, CorpusStoreWriter
+from app.near_duplicate import NearDuplicateIndex, jaccard, lsh_bands, shingle_hashes
+
+
+def problems():
+    records = []
+    for i in range(200):
+        records.append({"id": f"pt-{i}", "question": f"Giải phương trình x^2 - {i % 17 + 2}x + {i} = 0 trên tập số thực.",
+                        "solution": f"Lời giải phương trình {i}"})
+        records.append({"id": f"ht-{i}", "question": f"Tính diện tích hình tròn có bán kính {i} cm.",
+                        "solution": f"S = π * {i}^2"})
+    for record in records:
+        record["content"] = f"{record['question']}\n{record['solution']}"
+    return records
+
+
+@pytest.fixture(scope="module")
+def index():
+    return NearDuplicateIndex.build(problems())
+
+
+def test_shingles_ignore_case_spacing_and_unicode_form():
+    a = shingle_hashes("Tính  diện tích\nhình tròn")
+    b = shingle_hashes("tính diện tích hình tròn")
+    decomposed = shingle_hashes("Tính diện tích hình tròn".replace("í", "i\u0301"))
+
+    assert jaccard(a, b) == jaccard(a, decomposed) == 1.0
+    assert len(shingle_hashes("ab")) == 1 and len(shingle_hashes("  ")) == 0
+
+
+def test_verbatim_and_ocr_noisy_problems_match(index):
+    match = index.lookup("Giải phương trình x^2 - 5x + 3 = 0 trên tập số thực.")
+    assert match.record["id"] == "pt-3" and match.similarity == 1.0
+
+    # Missing diacritic, doubled space, no final period
+    noisy = index.lookup("Giai phương trình x^2 - 5x + 3 = 0 trên tập  số thực")
+    assert noisy.record["id"] == "pt-3"
+    assert 0.8 <= noisy.similarity < 1.0
+
+
+def test_different_numbers_or_unrelated_text_do_not_match(index):
+    before = index.stats()
+    # Same template, one coefficient changed: a different problem with a different solution
+    assert index.lookup("Giải phương trình x^2 - 5x + 4 = 0 trên tập số thực.") is None
+    assert index.lookup("Chứng minh rằng tổng ba góc của một tam giác bằng 180 độ.") is None
+    assert index.lookup("") is None
+
+    stats = index.stats()
+    assert stats["hits"] == before["hits"] and stats["lookups"] == before["lookups"] + 3
+
+
+def test_saved_index_over_corpus_store_skips_dead_rows(tmp_path):
+    records = problems()
+    with CorpusStoreWriter(str(tmp_path / "store")) as writer:
+        writer.add_many(records)
+    store = CorpusStore(str(tmp_path / "store"))
+    live = [row for row in range(len(records)) if row != 7]
+    NearDuplicateIndex.build(store, live).save(str(tmp_path / "math.minhash"))
+
+    loaded = NearDuplicateIndex.load(str(tmp_path / "math.minhash"), store, threshold=0.9)
+
+    assert loaded.lookup(records[8]["question"]).row == 8
+    assert loaded.lookup(records[7]["question"]) is None
+    assert loaded.stats()["size"] == len(live)
+    store.close()
+
+
+def test_lsh_bands_put_the_candidate_curve_below_the_threshold():
+    bands, rows = lsh_bands(128, 0.65)
+
+    assert bands * rows <= 128
+    assert (1 / bands) ** (1 / rows) < 0.65
+    assert 1 - (1 - 0.8 ** rows) ** bands > 0.99
@@ -0,0 +1,126 @@
+# tests/test_ocr.py
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import app.ocr as ocr
+from app.ocr import DROP_SCORE, _sorted_boxes, _to_bgr_array, run_ocr_batch
+
+
+def quad(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+
+
+def page(marker: int, regions) -> np.ndarray:
+    """White grayscale page; pixel (0, 0) tells the stub which page it is, each region its text."""
+    array = np.full((120, 200), 255, dtype=np.uint8)
+    array[0, 0] = marker
+    for (x0, y0, x1, y1), value in regions:
+        array[y0:y1, x0:x1] = value
+    return array
+
+
+class StubOCR:
+    """PaddleOCR stand-in: fixed boxes per page, a crop's fill value is its text."""
+
+    def __init__(self, boxes, scores):
+        self.boxes = boxes
+        self.scores = scores
+        self.calls = []
+
+    def ocr(self, inputs, det=True, rec=True, cls=False):
+        self.calls.append((det, rec))
+        if det:
+            return [self.boxes.get(int(inputs[0, 0, 0]))]
+        lines = []
+        for crop in inputs:
+            value = int(crop[crop.shape[0] // 2, crop.shape[1] // 2, 0])
+            lines.append((f"t{value}", self.scores.get(value, 0.9)))
+        return [lines]
+
+
+@pytest.fixture
+def axis_aligned_crops(monkeypatch):
+    # cv2's perspective warp is not what these tests are about
+    monkeypatch.setattr(ocr, "_crop_box", lambda image, box: image[box[0][1]:box[2][1], box[0][0]:box[2][0]])
+
+
+def test_to_bgr_array_converts_every_input_kind():
+    rgb = Image.new("RGB", (4, 3), (255, 0, 0))
+    assert _to_bgr_array(rgb)[0, 0].tolist() == [0, 0, 255]
+    assert _to_bgr_array(Image.new("L", (4, 3), 7)).shape == (3, 4, 3)
+
+    gray = np.arange(12, dtype=np.uint8).reshape(3, 4)
+    converted = _to_bgr_array(gray)
+    assert converted.shape == (3, 4, 3) and (converted[:, :, 2] == gray).all()
+
+    rgba = np.zeros((3, 4, 4), dtype=np.uint8)
+    rgba[:, :, 3] = 255
+    converted = _to_bgr_array(rgba)
+    assert converted.shape == (3, 4, 3) and converted.flags["C_CONTIGUOUS"] and not converted.any()
+
+    with pytest.raises(ValueError):
+        _to_bgr_array(np.zeros((3, 4, 2), dtype=np.uint8))
+    with pytest.raises(TypeError):
+        _to_bgr_array(b"not an image")
+
+
+def test_sorted_boxes_reads_lines_left_to_right():
+    right, left = quad(100, 12, 150, 30), quad(10, 15, 60, 30)
+    below = quad(5, 60, 50, 80)
+
+    assert _sorted_boxes([below, right, left]) == [left, right, below]
+
+
+def test_batch_keeps_each_pages_lines_in_reading_order(monkeypatch, axis_aligned_crops):
+    boxes = {
+        # Second line first, and the first line's two boxes right-to-left
+        1: [quad(10, 60, 80, 80), quad(110, 12, 180, 30), quad(10, 15, 80, 30)],
+        2: None,  # PaddleOCR's result for a page without text
+        3: [quad(20, 20, 120, 40), quad(20, 70, 120, 90)],
+    }
+    model = StubOCR(boxes, scores={40: DROP_SCORE - 0.1})
+    monkeypatch.setattr(ocr, "ocr_model", model)
+    pages = [
+        page(1, [((10, 60, 80, 80), 30), ((110, 12, 180, 30), 20), ((10, 15, 80, 30), 10)]),
+        page(2, []),
+        page(3, [((20, 20, 120, 40), 40), ((20, 70, 120, 90), 50)]),
+    ]
+
+    results = run_ocr_batch(pages)
+
+    assert results[0] == ("t10 t20 t30", [("t10", 0.9), ("t20", 0.9), ("t30", 0.9)])
+    assert results[1] == ("", [])
+    # The low-confidence line is dropped, the rest of its page kept
+    assert results[2] == ("t50", [("t50", 0.9)])
+    # One detection call per page, one recognition call for all crops
+    assert model.calls == [(True, False)] * 3 + [(False, True)]
+
+
+def test_batch_converts_grayscale_rgba_and_pil_pages(monkeypatch, axis_aligned_crops):
+    region = ((20, 20, 120, 40), 60)
+    boxes = {marker: [quad(20, 20, 120, 40)] for marker in (1, 2, 3)}
+    monkeypatch.setattr(ocr, "ocr_model", StubOCR(boxes, scores={}))
+
+    gray = page(1, [region])
+    rgba = np.dstack([np.repeat(page(2, [region])[:, :, None], 3, axis=2), np.full(gray.shape, 255, np.uint8)])
+    pil = Image.fromarray(page(3, [region])).convert("RGB")
+
+    assert run_ocr_batch([gray, rgba, pil]) == [("t60", [("t60", 0.9)])] * 3
+
+
+def test_batch_without_any_text_skips_recognition(monkeypatch):
+    model = StubOCR({1: [], 2: None}, scores={})
+    monkeypatch.setattr(ocr, "ocr_model", model)
+
+    assert run_ocr_batch([page(1, []), page(2, [])]) == [("", []), ("", [])]
+    assert model.calls == [(True, False)] * 2
+
+
+def test_crop_box_rotates_tall_crops_upright():
+    pytest.importorskip("cv2")
+    image = np.zeros((100, 100, 3), dtype=np.uint8)
+
+    assert ocr._crop_box(image, quad(10, 10, 60, 20)).shape[:2] == (10, 50)
+    assert ocr._crop_box(image, quad(10, 10, 20, 60)).shape[:2] == (10, 50)
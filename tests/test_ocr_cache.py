@@ -0,0 +1,126 @@
+# tests/test_ocr_cache.py
+
+import io
+import sqlite3
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from app.ocr_cache import OCRCache, _PHashIndex, hamming_distance, perceptual_hash
+
+RESULT = ("x^2 - 5x + 6 = 0", [("x^2 - 5x + 6 = 0", 0.98)])
+
+
+def make_page(seed: int) -> Image.Image:
+    rng = np.random.default_rng(seed)
+    img = Image.new("RGB", (400, 300), "white")
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x, y = rng.integers(0, 350), rng.integers(0, 280)
+        draw.rectangle([x, y, x + rng.integers(10, 50), y + 8], fill="black")
+    return img
+
+
+def to_bytes(img: Image.Image, fmt: str = "PNG", **kwargs) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format=fmt, **kwargs)
+    return buf.getvalue()
+
+
+def test_exact_and_near_duplicate_hits():
+    cache = OCRCache(max_entries=8)
+    page = make_page(0)
+    original = to_bytes(page)
+
+    key = cache.make_key(original, page)
+    assert cache.get(key) is None
+    cache.put(key, RESULT)
+    assert cache.get(cache.make_key(original)) == RESULT
+
+    # Recompressed copy of the same page: different bytes, close perceptual hash
+    recompressed = to_bytes(page, "JPEG", quality=70)
+    near_key = cache.make_key(recompressed)
+    assert near_key.digest != key.digest
+    assert hamming_distance(near_key.phash, key.phash) <= cache.phash_threshold
+    assert cache.get(near_key) == RESULT
+
+    stats = cache.stats()
+    assert stats["exact_hits"] == 1
+    assert stats["near_hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_different_page_misses_and_lru_evicts():
+    cache = OCRCache(max_entries=2)
+    pages = [make_page(seed) for seed in range(3)]
+    keys = [cache.make_key(to_bytes(p), p) for p in pages]
+    assert perceptual_hash(pages[0]) != perceptual_hash(pages[1])
+
+    cache.put(keys[0], RESULT)
+    assert cache.get(keys[1]) is None
+
+    cache.put(keys[1], ("b", []))
+    cache.put(keys[2], ("c", []))
+    assert cache.stats()["memory_entries"] == 2
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "ocr.sqlite")
+    page = make_page(1)
+    data = to_bytes(page)
+
+    cache = OCRCache(disk_path=path)
+    cache.put(cache.make_key(data, page), RESULT)
+    cache.close()
+
+    reopened = OCRCache(disk_path=path)
+    assert reopened.get(reopened.make_key(data, page)) == RESULT
+    assert reopened.stats()["disk_hits"] == 1
+    reopened.close()
+
+
+def test_phash_index_matches_pairwise_hamming():
+    rng = np.random.default_rng(0)
+    hashes = [int(h) for h in rng.integers(0, 2**63, size=300, dtype=np.uint64) * 2 + 1]
+    index = _PHashIndex()
+    for i, h in enumerate(hashes):
+        index.add(f"d{i}", h)
+    for i in range(0, 300, 3):
+        index.discard(f"d{i}")
+    live = {f"d{i}": h for i, h in enumerate(hashes) if i % 3}
+
+    for query in hashes[:20] + [hashes[5] ^ 0b101]:
+        digest, distance = index.nearest(query)
+        assert distance == min(hamming_distance(query, h) for h in live.values())
+        assert hamming_distance(query, live[digest]) == distance
+    assert len(index) == len(live) and "d0" not in index and index.nearest(0)[1] <= 64
+    assert _PHashIndex().nearest(0) == (None, 65)
+
+
+def test_disk_tier_is_bounded_by_last_access(tmp_path, monkeypatch):
+    import app.ocr_cache as module
+    clock = iter(range(1000))
+    monkeypatch.setattr(module.time, "time", lambda: float(next(clock)))
+    path = str(tmp_path / "ocr.sqlite")
+    pages = [make_page(seed) for seed in range(10, 15)]
+    keys = [OCRCache.make_key(to_bytes(p), p) for p in pages]
+
+    cache = OCRCache(disk_path=path, max_disk_entries=3)
+    for i in range(3):
+        cache.put(keys[i], (f"page {i}", []))
+    cache.close()
+
+    cache = OCRCache(disk_path=path, max_disk_entries=3)
+    assert cache.get(keys[0]) == ("page 0", [])  # read from disk: now the most recent
+    cache.put(keys[3], ("page 3", []))          # 4 > 3: trimmed to 90% of 3 = 2 rows
+    assert cache.stats()["disk_entries"] == 2
+    assert cache.stats()["disk_evictions"] == 2
+    cache.put(keys[4], ("page 4", []))
+    cache.close()
+
+    rows = {digest for (digest,) in sqlite3.connect(path).execute("SELECT digest FROM ocr_cache")}
+    assert rows == {keys[0].digest, keys[3].digest, keys[4].digest}
+    reopened = OCRCache(disk_path=path, max_disk_entries=3)
+    assert reopened.get(keys[1]) is None
+    reopened.close()
@@ -0,0 +1,63 @@
+# tests/test_onnx_backend.py
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.embeddings.onnx_backend import clip_preprocess, parity_report, pool
+from app.embeddings.text_encoder import TextEncoder
+
+CLIP_CONFIG = {
+    "image_size": 224,
+    "crop_size": 224,
+    "image_mean": [0.48145466, 0.4578275, 0.40821073],
+    "image_std": [0.26862954, 0.26130258, 0.27577711],
+}
+
+
+def test_mean_pooling_ignores_padding():
+    tokens = np.array([[[1.0, 1.0], [3.0, 3.0], [100.0, 100.0]]], dtype=np.float32)
+    mask = np.array([[1, 1, 0]])
+
+    np.testing.assert_allclose(pool(tokens, mask, "mean"), [[2.0, 2.0]])
+    np.testing.assert_allclose(pool(tokens, mask, "cls"), [[1.0, 1.0]])
+    np.testing.assert_allclose(pool(tokens, mask, "max"), [[3.0, 3.0]])
+    with pytest.raises(ValueError):
+        pool(tokens, mask, "weightedmean")
+
+
+def test_clip_preprocess_resizes_and_crops_to_square():
+    wide = Image.new("RGB", (640, 320), (255, 255, 255))
+    tall = Image.new("RGB", (100, 300), (0, 0, 0))
+
+    pixels = clip_preprocess([wide, tall], CLIP_CONFIG)
+
+    assert pixels.shape == (2, 3, 224, 224)
+    assert pixels.dtype == np.float32
+    expected_white = (1.0 - np.array(CLIP_CONFIG["image_mean"])) / np.array(CLIP_CONFIG["image_std"])
+    np.testing.assert_allclose(pixels[0, :, 112, 112], expected_white, rtol=1e-5)
+
+
+def test_clip_preprocess_matches_transformers():
+    transformers = pytest.importorskip("transformers")
+    processor = transformers.CLIPImageProcessor()
+    rng = np.random.default_rng(0)
+    image = Image.fromarray(rng.integers(0, 255, (300, 500, 3), dtype=np.uint8))
+
+    expected = processor(images=[image], return_tensors="np")["pixel_values"]
+    np.testing.assert_allclose(clip_preprocess([image], CLIP_CONFIG), expected, atol=1e-4)
+
+
+def test_parity_report():
+    reference = np.eye(3, dtype=np.float32)
+    report = parity_report(reference, reference * 2)
+    assert report["min_cosine"] == pytest.approx(1.0)
+    assert report["max_abs_diff"] == pytest.approx(1.0)
+
+    with pytest.raises(ValueError):
+        parity_report(reference, reference[:2])
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        TextEncoder("models/onnx/text", backend="tensorrt")
@@ -0,0 +1,81 @@
+# tests/test_pipeline.py
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.pipeline import StagePool
+
+
+def test_stage_respects_concurrency_limit():
+    stage = StagePool("search", ThreadPoolExecutor(max_workers=8), max_concurrency=2)
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def work(i):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.02)
+        with lock:
+            active -= 1
+        return i * 2
+
+    async def main():
+        return await asyncio.gather(*(stage.run(work, i) for i in range(6)))
+
+    assert asyncio.run(main()) == [0, 2, 4, 6, 8, 10]
+    assert peak == 2
+    stage.shutdown()
+
+
+def test_coroutine_functions_stay_on_the_event_loop():
+    stage = StagePool("llm", None, max_concurrency=4)
+    loop_thread = []
+
+    async def remote_call(prompt):
+        loop_thread.append(threading.get_ident())
+        await asyncio.sleep(0.01)
+        return prompt.upper()
+
+    async def main():
+        results = await asyncio.gather(*(stage.run(remote_call, p) for p in ["a", "b"]))
+        return results, threading.get_ident()
+
+    results, main_thread = asyncio.run(main())
+    assert results == ["A", "B"]
+    assert set(loop_thread) == {main_thread}
+    assert stage.stats() == {"max_concurrency": 4, "in_flight": 0}
+
+
+def test_stream_closes_the_inner_iterator_when_the_consumer_stops():
+    stage = StagePool("llm", None, max_concurrency=1)
+    closed = []
+
+    async def tokens():
+        try:
+            for i in range(100):
+                yield i
+        finally:
+            closed.append(True)
+
+    async def main():
+        stream = stage.stream(tokens)
+        first = [item async for item in _take(stream, 3)]
+        await stream.aclose()
+        # Closed right away, not whenever the event loop finalizes abandoned generators
+        return first, list(closed)
+
+    assert asyncio.run(main()) == ([0, 1, 2], [True])
+    assert stage.stats()["in_flight"] == 0
+
+
+async def _take(iterator, n):
+    async for item in iterator:
+        yield item
+        n -= 1
+        if not n:
+            return
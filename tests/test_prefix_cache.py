@@ -0,0 +1,83 @@
+# tests/test_prefix_cache.py
+
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("dotenv")
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+from app.llm import LLMEngine
+from app.prompts.cot_templates import get_prompt_prefix
+
+VOCAB_SIZE = 48
+BOS = 1
+
+
+class WordTokenizer:
+    """One token per whitespace-separated word, so prefix + suffix tokenize like the whole prompt."""
+
+    def __call__(self, text, return_tensors=None, add_special_tokens=True):
+        ids = [BOS] if add_special_tokens else []
+        ids += [2 + sum(map(ord, word)) % (VOCAB_SIZE - 2) for word in text.split()]
+        return SimpleNamespace(input_ids=torch.tensor([ids]))
+
+    def decode(self, ids, skip_special_tokens=False, **kwargs):
+        return " ".join(str(int(i)) for i in ids)
+
+
+@pytest.fixture
+def engine():
+    torch.manual_seed(0)
+    config = transformers.LlamaConfig(
+        vocab_size=VOCAB_SIZE, hidden_size=32, intermediate_size=64, num_hidden_layers=2, num_attention_heads=4,
+        num_key_value_heads=2, max_position_embeddings=1024, bos_token_id=BOS, eos_token_id=None,
+        initializer_range=0.2,  # spread-out logits: no near-ties for cached vs full prefill to flip
+    )
+    model = transformers.LlamaForCausalLM(config).eval()
+    # Sampling from the single most likely token is greedy decoding
+    model.generation_config.top_k = 1
+
+    # Bypass __init__, which downloads and loads the real model
+    engine = LLMEngine.__new__(LLMEngine)
+    engine.backend = "phi-2"
+    engine.tokenizer = WordTokenizer()
+    engine.model = model
+    engine.max_tokens = 12
+    engine.temperature = 0.7
+    engine.precision = "fp32"
+    engine.device = torch.device("cpu")
+    engine.use_prefix_cache = True
+    engine.prefix_caches = {}
+    engine.scheduler = None
+    engine.speculative_decoder = None
+    return engine
+
+
+def test_cached_prefix_generates_the_same_answer(engine):
+    engine.build_prefix_caches(["algebra"])
+    cache = engine.prefix_caches["algebra"]["past_key_values"]
+    prefix_tokens = cache.get_seq_length()
+    keys = [layer.keys.clone() for layer in cache.layers]
+    prompts = [get_prompt_prefix("algebra") + f"Giải phương trình x + {i} = 5\nAnswer:" for i in (1, 2)]
+
+    cached = [engine.generate_answer(prompt) for prompt in prompts]
+    streamed = "".join(engine.stream_answer(prompts[0])).strip()
+    engine.use_prefix_cache = False
+    uncached = [engine.generate_answer(prompt) for prompt in prompts]
+
+    assert cached == uncached
+    assert streamed == uncached[0]
+    # Every request extended its own copy; the shared cache still holds just the prefix
+    assert cache.get_seq_length() == prefix_tokens
+    assert all(torch.equal(before, layer.keys) for before, layer in zip(keys, cache.layers))
+
+
+def test_prompt_without_known_prefix_is_prefilled_in_full(engine):
+    engine.build_prefix_caches(["algebra"])
+
+    inputs = engine._phi_inputs("Giải phương trình x + 1 = 5")
+
+    assert "past_key_values" not in inputs
+    assert inputs["input_ids"].shape[1] == 6
@@ -0,0 +1,87 @@
+# tests/test_prefork.py
+
+import os
+import signal
+import sys
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.prefork import PreforkSupervisor, memory_report, parse_smaps, process_memory
+
+linux_only = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="reads /proc")
+
+SMAPS_ROLLUP = """\
+55d0c0a00000-7ffd5e5f3000 ---p 00000000 00:00 0                          [rollup]
+Rss:              812340 kB
+Pss:              310112 kB
+Shared_Clean:     700000 kB
+Shared_Dirty:      17000 kB
+Private_Clean:      5340 kB
+Private_Dirty:     90000 kB
+Swap:                  0 kB
+"""
+
+
+def test_parse_smaps_sums_fields_in_bytes():
+    fields = parse_smaps(SMAPS_ROLLUP + "Rss: 4 kB\nVmFlags: rd ex mr mw me\n")
+
+    assert fields["Rss"] == (812340 + 4) * 1024
+    assert fields["Private_Dirty"] == 90000 * 1024
+    assert "VmFlags" not in fields
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.05)
+
+
+@linux_only
+def test_forked_workers_share_preloaded_memory_and_are_restarted(tmp_path):
+    # ~64 MB touched before forking: copy-on-write, so it shows up as shared in every worker
+    preloaded = np.ones(8 * 2**20, dtype=np.float64)
+    started = tmp_path / "started"
+    started.mkdir()
+
+    def worker(index):
+        (started / str(os.getpid())).write_text(str(index))
+        time.sleep(60)
+
+    supervisor = PreforkSupervisor(worker, num_workers=2, restart_delay=0.1, memory_report_interval=0)
+    thread = threading.Thread(target=supervisor.run, kwargs={"install_signal_handlers": False})
+    thread.start()
+    try:
+        wait_for(lambda: len(os.listdir(started)) == 2)
+        report = supervisor.memory_report()
+        workers = [m for label, m in report["processes"].items() if label.startswith("worker")]
+        assert len(workers) == 2
+        assert all(m["shared"] > preloaded.nbytes * 0.9 for m in workers)
+        assert report["worker_unique_mean"] < preloaded.nbytes / 2
+        assert report["total_pss"] < report["total_rss"]
+
+        victim = int(sorted(os.listdir(started))[0])
+        os.kill(victim, signal.SIGKILL)
+        wait_for(lambda: len(os.listdir(started)) == 3 and victim not in supervisor.workers)
+        assert supervisor.restarts == 1
+        assert sorted(supervisor.workers.values()) == [0, 1]
+    finally:
+        supervisor.stop()
+        thread.join(timeout=30)
+
+    assert not thread.is_alive()
+    assert supervisor.workers == {}
+    assert all(not os.path.exists(f"/proc/{pid}") for pid in map(int, os.listdir(started)))
+
+
+@linux_only
+def test_process_memory_of_this_process():
+    memory = process_memory()
+
+    assert memory["rss"] > 0
+    assert memory["rss"] >= memory["unique"]
+    assert memory_report({"self": os.getpid()})["processes"]["self"]["pid"] == os.getpid()
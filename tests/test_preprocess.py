@@ -0,0 +1,131 @@
+# tests/test_preprocess.py
+
+import io
+import struct
+import zlib
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from app.preprocess import (
+    EXIF_ORIENTATION,
+    ImagePreprocessor,
+    ImageTooLargeError,
+    InvalidImageError,
+    text_bounding_box,
+)
+
+
+def encode(image: Image.Image, fmt: str = "JPEG", orientation: int = None) -> bytes:
+    buf = io.BytesIO()
+    kwargs = {}
+    if orientation is not None:
+        exif = Image.Exif()
+        exif[EXIF_ORIENTATION] = orientation
+        kwargs["exif"] = exif
+    image.save(buf, format=fmt, **kwargs)
+    return buf.getvalue()
+
+
+def test_downscales_to_max_side_with_draft_decode():
+    preprocessor = ImagePreprocessor(max_side=400)
+
+    prepared = preprocessor.process(encode(Image.new("RGB", (2000, 1000), (200, 200, 200))))
+
+    assert prepared.original_size == (2000, 1000)
+    assert prepared.size == (400, 200)
+    assert prepared.image.mode == "RGB"
+    stats = preprocessor.stats()
+    assert stats["draft_decodes"] == 1
+    assert stats["pixel_reduction"] == pytest.approx(1 - 400 * 200 / (2000 * 1000))
+
+
+def test_small_images_are_left_alone():
+    prepared = ImagePreprocessor(max_side=400).process(encode(Image.new("L", (120, 80)), fmt="PNG"))
+
+    assert prepared.size == (120, 80)
+    assert prepared.image.mode == "RGB"
+
+
+def test_exif_orientation_is_applied():
+    # Red marker in the top-left corner of the stored (sideways) image
+    image = Image.new("RGB", (300, 200), (255, 255, 255))
+    image.paste((255, 0, 0), (0, 0, 30, 30))
+
+    prepared = ImagePreprocessor(max_side=1000).process(encode(image, fmt="PNG", orientation=6))
+
+    # Orientation 6: rotate 90 degrees clockwise to display, the marker ends up top-right
+    assert prepared.size == (200, 300)
+    assert prepared.image.getpixel((195, 5)) == (255, 0, 0)
+
+
+def test_rejects_oversized_and_corrupt_uploads():
+    data = encode(Image.new("RGB", (300, 300)), fmt="PNG")
+    preprocessor = ImagePreprocessor(max_bytes=len(data) - 1)
+    with pytest.raises(ImageTooLargeError):
+        preprocessor.process(data)
+
+    preprocessor = ImagePreprocessor(max_pixels=300 * 299)
+    with pytest.raises(ImageTooLargeError):
+        preprocessor.process(data)
+
+    with pytest.raises(InvalidImageError):
+        preprocessor.process(b"definitely not an image")
+    with pytest.raises(InvalidImageError):
+        preprocessor.process(encode(Image.new("RGB", (100, 100)))[:200])
+
+    stats = preprocessor.stats()
+    assert stats["rejected_too_large"] == 1
+    assert stats["rejected_invalid"] == 2
+    assert stats["processed"] == 0
+
+
+def forged_png(width: int, height: int) -> bytes:
+    """A PNG whose header claims width x height, with no real pixel data behind it."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(b"\0")) + chunk(b"IEND", b"")
+
+
+def test_decompression_bomb_header_is_too_large():
+    # Beyond PIL's own limit, which Image.open enforces before max_pixels is checked
+    preprocessor = ImagePreprocessor(max_pixels=0)
+    with pytest.raises(ImageTooLargeError):
+        preprocessor.process(forged_png(20000, 20000))
+    assert preprocessor.stats()["rejected_too_large"] == 1
+
+
+def test_ocr_array_is_contiguous_bgr_and_cached():
+    prepared = ImagePreprocessor().process(encode(Image.new("RGB", (64, 32), (10, 20, 30)), fmt="PNG"))
+
+    array = prepared.ocr_array
+    assert array.shape == (32, 64, 3)
+    assert array.dtype == np.uint8
+    assert array.flags["C_CONTIGUOUS"]
+    assert tuple(array[0, 0]) == (30, 20, 10)
+    assert prepared.ocr_array is array
+
+
+def test_crop_to_text_region():
+    image = Image.new("RGB", (800, 600), (235, 235, 235))
+    ImageDraw.Draw(image).rectangle([300, 250, 500, 330], fill=(20, 20, 20))
+
+    box = text_bounding_box(image)
+    assert box is not None
+    left, top, right, bottom = box
+    assert left <= 300 <= 500 <= right and top <= 250 <= 330 <= bottom
+    assert (right - left) * (bottom - top) < 0.2 * 800 * 600
+
+    preprocessor = ImagePreprocessor(crop_to_text=True)
+    prepared = preprocessor.process(encode(image, fmt="PNG"))
+    assert prepared.crop_box == box
+    assert prepared.size == (right - left, bottom - top)
+    assert preprocessor.stats()["cropped"] == 1
+
+    # A blank page has no text region and is kept whole
+    blank = preprocessor.process(encode(Image.new("RGB", (200, 200), (240, 240, 240)), fmt="PNG"))
+    assert blank.crop_box is None
+    assert blank.size == (200, 200)
@@ -0,0 +1,86 @@
+# tests/test_prompt_composer.py
+
+from app.prompts.composer import TRUNCATION_MARK, PromptComposer
+from app.prompts.cot_templates import generate_prompt_cot
+
+
+class CountingTokenizer:
+    """Whitespace tokens, counting how many strings were tokenized."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, text: str) -> int:
+        self.calls.append(text)
+        return len(text.split())
+
+
+def solution(n_steps: int, tag: str = "") -> str:
+    steps = "\n".join(f"Bước {i}: biến đổi {tag} vế trái thành dạng tích số {i}." for i in range(n_steps))
+    return f"Giải phương trình {tag} x^2 - {n_steps}x = 0\nLời giải:\n{steps}"
+
+
+def test_without_budget_matches_generate_prompt_cot():
+    examples = [solution(2, "a"), solution(3, "b")]
+    composer = PromptComposer(CountingTokenizer(), max_example_tokens=None)
+
+    composed = composer.compose("x + 1 = 2", examples, "algebra")
+
+    assert composed.prompt == generate_prompt_cot("x + 1 = 2", examples, "algebra")
+    meta = composed.metadata
+    assert meta["examples_kept"] == 2
+    assert meta["tokens"]["total"] == meta["tokens"]["prefix"] + meta["tokens"]["examples"] + meta["tokens"]["question"]
+    # Section sums are exact for a whitespace tokenizer
+    assert meta["tokens"]["total"] == len(composed.prompt.split())
+
+
+def test_near_duplicates_are_dropped():
+    original = solution(4, "a")
+    near_copy = original.replace("Bước 3", "Bước ba")
+
+    composed = PromptComposer(CountingTokenizer()).compose("q", [original, near_copy, solution(2, "zz")])
+
+    assert composed.metadata["dropped_duplicates"] == [1]
+    assert composed.metadata["examples_kept"] == 2
+    assert "Bước ba" not in composed.prompt
+
+
+def test_budget_keeps_highest_scores_and_truncates_long_solutions():
+    tokenizer = CountingTokenizer()
+    examples = [solution(3, "thap"), solution(40, "best"), solution(3, "mid")]
+    fixed = PromptComposer(tokenizer).compose("x = 1", [], "algebra").metadata["tokens"]["total"]
+    composer = PromptComposer(tokenizer, token_budget=fixed + 160, max_example_tokens=100, min_example_tokens=20)
+
+    composed = composer.compose("x = 1", examples, "algebra", scores=[0.2, 0.9, 0.5])
+    meta = composed.metadata
+
+    assert meta["tokens"]["total"] <= fixed + 160
+    assert meta["truncated"] == [1]
+    assert meta["dropped_over_budget"] == [0]
+    # Highest score first, truncated at a step boundary
+    first = composed.prompt.split("Example 1:\n", 1)[1].split("\n\n", 1)[0]
+    assert "best" in first and first.endswith(TRUNCATION_MARK)
+    assert first[:-len(TRUNCATION_MARK)].endswith(".")
+    assert "Example 2:\n" + examples[2] in composed.prompt
+    assert "thap" not in composed.prompt
+
+
+def test_prefix_and_question_are_kept_over_budget():
+    composed = PromptComposer(CountingTokenizer(), token_budget=5).compose("x = 1", [solution(2)], "algebra")
+
+    assert composed.metadata["over_budget"]
+    assert composed.metadata["examples_kept"] == 0
+    assert composed.prompt.endswith("x = 1\nLet's think step by step:")
+
+
+def test_template_segments_are_tokenized_once():
+    tokenizer = CountingTokenizer()
+    composer = PromptComposer(tokenizer, token_budget=10_000)
+    examples = [solution(2, "a"), solution(2, "bb")]
+
+    composer.compose("x = 1", examples, "algebra")
+    first = len(tokenizer.calls)
+    composer.compose("x = 1", examples, "algebra")
+
+    assert first > 0
+    assert len(tokenizer.calls) == first
@@ -0,0 +1,80 @@
+# tests/test_quantization.py
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+import app.quantization as quantization
+from app.quantization import WeightOnlyLinear, load_quantized, quantize_model, save_quantized
+
+
+def linear(out_features, in_features, seed=0):
+    torch.manual_seed(seed)
+    layer = torch.nn.Linear(in_features, out_features)
+    torch.nn.init.normal_(layer.weight)
+    return layer
+
+
+def test_int4_packs_two_values_per_byte():
+    layer = torch.nn.Linear(16, 1, bias=False)
+    with torch.no_grad():
+        layer.weight.copy_(torch.arange(-7, 9).clamp(max=7).float().unsqueeze(0) * 0.5)
+
+    module = WeightOnlyLinear.from_linear(layer, bits=4, group_size=16)
+
+    # Low nibble = even column, high nibble = odd column, both offset by 8
+    assert module.qweight.shape == (1, 8)
+    assert module.qweight[0, 0].item() == (-7 + 8) | ((-6 + 8) << 4)
+    assert module.qweight[0, 7].item() == (7 + 8) | ((7 + 8) << 4)
+    assert torch.allclose(module.dequantize(), layer.weight, atol=1e-6)
+
+
+@pytest.mark.parametrize("bits, group_size", [(8, 128), (4, 32), (4, 128)])
+def test_dequantize_error_is_within_half_a_step(bits, group_size):
+    # 100 input features: not a multiple of the group size, so the last group is padded
+    layer = linear(24, 100)
+    module = WeightOnlyLinear.from_linear(layer, bits=bits, group_size=group_size)
+
+    steps = module.scales.repeat_interleave(module.group_size, dim=1)[:, :100]
+    error = (module.dequantize() - layer.weight).abs()
+
+    assert module.dequantize().shape == layer.weight.shape
+    assert (error <= steps / 2 + 1e-6).all()
+    assert module.dequantize(torch.bfloat16).dtype == torch.bfloat16
+
+
+@pytest.mark.parametrize("bits", [8, 4])
+def test_blocked_forward_matches_full_dequantize(monkeypatch, bits):
+    module = WeightOnlyLinear.from_linear(linear(50, 64), bits=bits, group_size=32)
+    x = torch.randn(3, 5, 64)
+    expected = torch.nn.functional.linear(x, module.dequantize(), module.bias)
+
+    assert torch.allclose(module(x), expected, atol=1e-5)
+    # 7 rows per block: several blocks and a short last one
+    monkeypatch.setattr(quantization, "DEQUANT_BLOCK_ELEMENTS", 7 * 64)
+    assert torch.allclose(module(x), expected, atol=1e-5)
+
+
+@pytest.mark.parametrize("precision", ["int8-weight", "int4-weight"])
+def test_save_and_load_round_trip(tmp_path, precision):
+    transformers = pytest.importorskip("transformers")
+
+    class Tokenizer:
+        def save_pretrained(self, path):
+            pass
+
+    torch.manual_seed(0)
+    config = transformers.LlamaConfig(
+        vocab_size=48, hidden_size=32, intermediate_size=64, num_hidden_layers=2, num_attention_heads=4,
+        num_key_value_heads=2, max_position_embeddings=64,
+    )
+    model = quantize_model(transformers.LlamaForCausalLM(config).eval(), precision, group_size=16)
+    save_quantized(model, Tokenizer(), str(tmp_path), precision, group_size=16)
+
+    loaded, loaded_precision = load_quantized(str(tmp_path))
+
+    assert loaded_precision == precision
+    assert any(isinstance(m, WeightOnlyLinear) for m in loaded.modules())
+    input_ids = torch.tensor([[1, 5, 9, 17, 3]])
+    with torch.no_grad():
+        assert torch.equal(model(input_ids).logits, loaded(input_ids).logits)
@@ -0,0 +1,134 @@
+# tests/test_registry.py
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.registry import ComponentRegistry
+
+
+def test_components_are_built_once_on_first_use():
+    calls = []
+
+    def factory():
+        calls.append(1)
+        time.sleep(0.05)
+        return object()
+
+    registry = ComponentRegistry()
+    registry.register("model", factory)
+    assert not registry.is_loaded("model")
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("model"))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+    assert registry.is_loaded("model")
+
+
+def test_warm_up_makes_registry_ready():
+    warmed, closed = [], []
+    registry = ComponentRegistry()
+    registry.register("encoder", lambda: "enc", warmup=warmed.append, close=closed.append)
+
+    async def async_warmup(instance):
+        warmed.append(instance)
+
+    registry.register("ocr", lambda: "ocr", warmup=async_warmup)
+    registry.register("optional", lambda: "opt", required=False)
+
+    assert not registry.ready()
+    asyncio.run(registry.warm_up(["encoder", "ocr"]))
+
+    assert warmed == ["enc", "ocr"]
+    assert registry.status()["encoder"]["state"] == "warm"
+    assert registry.status()["optional"]["state"] == "pending"
+    assert registry.ready()
+
+    registry.close()
+    assert closed == ["enc"]
+
+
+def test_failed_component_is_reported_and_blocks_readiness():
+    def broken():
+        raise RuntimeError("model file missing")
+
+    registry = ComponentRegistry()
+    registry.register("ok", lambda: 1)
+    registry.register("broken", broken)
+    asyncio.run(registry.warm_up())
+
+    status = registry.status()
+    assert status["ok"]["state"] == "warm"
+    assert status["broken"]["state"] == "failed"
+    assert "model file missing" in status["broken"]["error"]
+    assert not registry.ready()
+    with pytest.raises(RuntimeError):
+        registry.get("broken")
+
+
+def test_failed_warm_up_keeps_the_loaded_component():
+    calls, closed = [], []
+
+    def factory():
+        calls.append(1)
+        return "model"
+
+    def warmup(instance):
+        raise RuntimeError("dummy inference failed")
+
+    registry = ComponentRegistry()
+    registry.register("model", factory, warmup=warmup, close=closed.append)
+    asyncio.run(registry.warm_up())
+
+    status = registry.status()["model"]
+    assert status["state"] == "loaded" and status["error"] is None
+    assert "dummy inference failed" in status["warmup_error"]
+    assert registry.get("model") == "model" and registry.get("model") == "model"
+    assert len(calls) == 1
+    assert registry.ready()
+
+    registry.close()
+    assert closed == ["model"]
+
+
+def test_failed_load_is_retried_only_after_the_interval(monkeypatch):
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise OSError("index not mounted yet")
+        return "index"
+
+    registry = ComponentRegistry()
+    registry.register("index", flaky, retry_interval=60)
+    registry.register("never", lambda: 1 / 0, retry_interval=None)
+    asyncio.run(registry.warm_up())
+    assert not registry.ready()
+
+    with pytest.raises(RuntimeError, match="index not mounted yet"):
+        registry.get("index")
+    assert len(calls) == 1
+
+    import app.registry as module
+    now = module.time.monotonic()
+    monkeypatch.setattr(module.time, "monotonic", lambda: now + 61)
+    assert registry.get("index") == "index"
+    assert len(calls) == 2
+    with pytest.raises(RuntimeError, match="division by zero"):
+        registry.get("never")
+
+
+def test_import_times_are_recorded():
+    registry = ComponentRegistry()
+    module = registry.import_module("fusion")
+    assert module.FUSION_METHODS
+    assert "fusion" in registry.import_times
@@ -0,0 +1,71 @@
+# tests/test_retriever.py
+
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+from app.corpus_store import CorpusStoreWriter
+from app.retriever import Retriever
+
+
+class FakeEncoder:
+    """Maps each text to a fixed one-hot vector and counts encode calls."""
+
+    def __init__(self, vocab):
+        self.vocab = vocab
+        self.calls = 0
+
+    def encode(self, texts):
+        self.calls += 1
+        if isinstance(texts, str):
+            texts = [texts]
+        vecs = np.zeros((len(texts), len(self.vocab)), dtype=np.float32)
+        for row, text in enumerate(texts):
+            vecs[row, self.vocab.index(text)] = 1.0
+        return vecs
+
+
+@pytest.fixture
+def retriever(tmp_path):
+    vocab = ["a", "b", "c", "d"]
+    index = faiss.IndexFlatIP(len(vocab))
+    index.add(np.eye(len(vocab), dtype=np.float32))
+    faiss.write_index(index, str(tmp_path / "math.index"))
+    with CorpusStoreWriter(str(tmp_path / "corpus")) as writer:
+        writer.add_many([f"example {t}" for t in vocab])
+    return Retriever(str(tmp_path / "math.index"), str(tmp_path / "corpus"), FakeEncoder(vocab), top_k=1)
+
+
+def test_retrieve_batch_matches_single_queries(retriever):
+    texts = ["c", "a", "d"]
+    batch = retriever.retrieve_batch(texts)
+
+    assert batch == [retriever.retrieve(t) for t in texts]
+    assert batch == [["example c"], ["example a"], ["example d"]]
+
+
+def test_retrieve_batch_encodes_once(retriever):
+    retriever.text_encoder.calls = 0
+    retriever.retrieve_batch(["a", "b", "c"], top_k=2)
+    assert retriever.text_encoder.calls == 1
+    assert retriever.retrieve_batch([]) == []
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat"])
+def test_memory_mapped_index_gives_same_results(tmp_path, index_type):
+    from app.index_factory import build_index
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((2000, 16)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    path = str(tmp_path / f"{index_type}.index")
+    faiss.write_index(build_index(vectors, index_type=index_type, nlist=16), path)
+    with CorpusStoreWriter(str(tmp_path / "corpus")) as writer:
+        writer.add_many([f"example {i}" for i in range(len(vectors))])
+
+    loaded = Retriever(path, str(tmp_path / "corpus"), FakeEncoder(["a"]), nprobe=4)
+    mapped = Retriever(path, str(tmp_path / "corpus"), FakeEncoder(["a"]), nprobe=4, mmap_index=True)
+
+    queries = vectors[:20]
+    assert np.array_equal(loaded.index.search(queries, 5)[1], mapped.index.search(queries, 5)[1])
@@ -0,0 +1,105 @@
+# tests/test_setup_vectorstore.py
+
+import json
+import os
+import sys
+import zlib
+
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+pytest.importorskip("tqdm")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+from setup_vectorstore import VectorStoreBuilder
+from app.corpus_store import CorpusStore
+
+
+class FakeEncoder:
+    """Deterministic unit vectors per text; counts how many texts were encoded."""
+
+    def __init__(self, fail_after: int = None):
+        self.encoded = 0
+        self.fail_after = fail_after
+
+    def encode(self, texts):
+        if self.fail_after is not None and self.encoded >= self.fail_after:
+            raise KeyboardInterrupt
+        self.encoded += len(texts)
+        vecs = np.stack([np.random.default_rng(zlib.crc32(t.encode())).standard_normal(8) for t in texts])
+        return (vecs / np.linalg.norm(vecs, axis=1, keepdims=True)).astype(np.float32)
+
+
+def write_dataset(path, items):
+    with open(path, "w", encoding="utf-8") as f:
+        for item in items:
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+
+def build(tmp_path, encoder, **kwargs):
+    builder = VectorStoreBuilder(
+        str(tmp_path / "math.index"), str(tmp_path / "store"), chunk_size=10, text_encoder=encoder
+    )
+    return builder.build(str(tmp_path / "data.jsonl"), **kwargs)
+
+
+def test_interrupted_build_resumes_from_checkpoint(tmp_path):
+    write_dataset(tmp_path / "data.jsonl", [{"id": i, "question": f"câu {i}"} for i in range(50)])
+
+    with pytest.raises(KeyboardInterrupt):
+        build(tmp_path, FakeEncoder(fail_after=30))
+
+    encoder = FakeEncoder()
+    build(tmp_path, encoder)
+    assert encoder.encoded == 20
+
+    index = faiss.read_index(str(tmp_path / "math.index"))
+    store = CorpusStore(str(tmp_path / "store"))
+    assert index.ntotal == len(store) == 50
+    _, ids = index.search(FakeEncoder().encode(["câu 42"]), 1)
+    assert store[int(ids[0][0])]["id"] == 42
+
+
+def test_incremental_embeds_only_changed_problems(tmp_path):
+    items = [{"id": i, "question": f"câu {i}", "solution": ""} for i in range(30)]
+    write_dataset(tmp_path / "data.jsonl", items)
+    build(tmp_path, FakeEncoder())
+
+    items = items[1:]                                       # id 0 deleted
+    items[0] = dict(items[0], solution="x = 1")             # id 1 changed
+    items.append({"id": 99, "question": "câu mới", "solution": ""})
+    write_dataset(tmp_path / "data.jsonl", items)
+
+    encoder = FakeEncoder()
+    counters = build(tmp_path, encoder, incremental=True)
+    assert encoder.encoded == 2
+    assert (counters["unchanged"], counters["removed"], counters["vectors"]) == (28, 1, 30)
+
+    index = faiss.read_index(str(tmp_path / "math.index"))
+    store = CorpusStore(str(tmp_path / "store"))
+    _, ids = index.search(FakeEncoder().encode(["câu 1"]), 1)
+    assert store[int(ids[0][0])]["solution"] == "x = 1"
+
+
+def test_near_duplicate_index_follows_incremental_updates(tmp_path):
+    from app.near_duplicate import NearDuplicateIndex
+
+    items = [{"id": i, "question": f"Tính chu vi hình vuông có cạnh {i} cm.", "solution": f"C = 4 * {i}"}
+             for i in range(20)]
+    write_dataset(tmp_path / "data.jsonl", items)
+    builder = VectorStoreBuilder(
+        str(tmp_path / "math.index"), str(tmp_path / "store"), chunk_size=10, text_encoder=FakeEncoder(),
+        dedup_index_path=str(tmp_path / "math.minhash"),
+    )
+    builder.build(str(tmp_path / "data.jsonl"))
+
+    items[3] = dict(items[3], solution="C = 12 cm")
+    write_dataset(tmp_path / "data.jsonl", items[1:])
+    builder.build(str(tmp_path / "data.jsonl"), incremental=True)
+
+    store = CorpusStore(str(tmp_path / "store"))
+    index = NearDuplicateIndex.load(str(tmp_path / "math.minhash"), store)
+    assert index.lookup("Tính chu vi hình vuông có cạnh 3 cm").record["solution"] == "C = 12 cm"
+    assert index.lookup("Tính chu vi hình vuông có cạnh 0 cm.") is None
+    assert index.stats()["size"] == 19
@@ -0,0 +1,114 @@
+# tests/test_speculative.py
+
+import pytest
+
+from app.speculative import PromptLookupProposer, SpeculativeDecoder, prompt_lookup_candidates
+
+
+def test_prompt_lookup_continues_the_copied_span():
+    # "... 5 6 7 8 9 ... 5 6" -> the model is likely copying "7 8 9" again
+    tokens = [1, 2, 5, 6, 7, 8, 9, 3, 4, 5, 6]
+
+    assert prompt_lookup_candidates(tokens, num_tokens=3) == [7, 8, 9]
+    assert prompt_lookup_candidates(tokens, num_tokens=10) == [7, 8, 9, 3, 4, 5, 6]
+
+
+def test_prompt_lookup_prefers_longest_and_most_recent_match():
+    # Suffix "2 3" occurs twice; the bigram match wins over the unigram "3 -> 9"
+    tokens = [3, 9, 2, 3, 4, 0, 2, 3, 5, 1, 2, 3]
+
+    assert prompt_lookup_candidates(tokens, num_tokens=2, max_ngram=2) == [5, 1]
+    assert prompt_lookup_candidates(tokens, num_tokens=2, max_ngram=1) == [5, 1]
+    assert prompt_lookup_candidates([3, 9, 3], num_tokens=2) == [9, 3]
+
+
+def test_prompt_lookup_without_match():
+    assert prompt_lookup_candidates([1, 2, 3, 4], num_tokens=5) == []
+    assert prompt_lookup_candidates([1], num_tokens=5) == []
+    assert prompt_lookup_candidates([1, 1], num_tokens=0) == []
+    assert PromptLookupProposer(max_ngram=3, min_ngram=2).propose([4, 1, 2, 4], 3) == []
+
+
+def test_decoder_validates_method():
+    with pytest.raises(ValueError):
+        SpeculativeDecoder(model=object(), eos_token_id=0, method="medusa")
+    with pytest.raises(ValueError):
+        SpeculativeDecoder(model=object(), eos_token_id=0, method="draft-model")
+
+    stats = SpeculativeDecoder(model=object(), eos_token_id=0).stats()
+    assert stats["acceptance_rate"] == 0.0 and stats["tokens_per_s"] == 0.0
+
+
+@pytest.fixture(scope="module")
+def tiny_lm():
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+
+    def build(seed):
+        torch.manual_seed(seed)
+        config = transformers.LlamaConfig(
+            vocab_size=48, hidden_size=32, intermediate_size=64, num_hidden_layers=2, num_attention_heads=4,
+            num_key_value_heads=2, max_position_embeddings=256, bos_token_id=None, eos_token_id=None,
+            initializer_range=0.2,  # spread-out logits: no near-ties for chunked vs one-token passes to flip
+        )
+        return transformers.LlamaForCausalLM(config).eval()
+
+    model, draft_model = build(0), build(1)
+    # Repeated spans give prompt lookup something to draft from
+    input_ids = torch.tensor([[5, 9, 17, 3, 22, 8, 5, 9, 17, 3, 30, 41, 12, 5, 9]])
+    with torch.no_grad():
+        reference = model.generate(
+            input_ids, attention_mask=torch.ones_like(input_ids), max_new_tokens=40, do_sample=False,
+        )[0, input_ids.shape[1]:].tolist()
+    return torch, model, draft_model, input_ids, reference
+
+
+@pytest.mark.parametrize("method, draft", [
+    ("prompt-lookup", None), ("draft-model", "same"), ("draft-model", "other"),
+])
+@pytest.mark.parametrize("prefix_cache", [False, True])
+def test_greedy_output_matches_generate(tiny_lm, method, draft, prefix_cache):
+    torch, model, draft_model, input_ids, reference = tiny_lm
+    decoder = SpeculativeDecoder(
+        model, eos_token_id=None, method=method, num_draft_tokens=4,
+        draft_model={"same": model, "other": draft_model}.get(draft), inference_context=torch.no_grad,
+    )
+    cache = None
+    if prefix_cache:
+        with torch.no_grad():
+            cache = model(input_ids=input_ids[:, :8], use_cache=True).past_key_values
+
+    chunks = list(decoder.iter_generate(input_ids, max_tokens=len(reference), past_key_values=cache))
+
+    assert [token for chunk in chunks for token in chunk] == reference
+    stats = decoder.stats()
+    assert stats["tokens"] == len(reference)
+    if draft == "same":
+        # The draft is the main model: proposals are kept, several tokens per forward pass
+        assert stats["acceptance_rate"] > 0.9 and len(chunks) < len(reference)
+
+
+def test_generation_stops_at_eos_and_max_tokens(tiny_lm):
+    torch, model, draft_model, input_ids, reference = tiny_lm
+    eos = reference[10]
+    decoder = SpeculativeDecoder(model, eos_token_id=eos, method="draft-model", draft_model=model,
+                                 num_draft_tokens=4, inference_context=torch.no_grad)
+
+    assert decoder.generate(input_ids, max_tokens=len(reference)) == reference[:reference.index(eos) + 1]
+    assert SpeculativeDecoder(model, eos_token_id=None, inference_context=torch.no_grad).generate(
+        input_ids, max_tokens=7) == reference[:7]
+
+
+def test_sampling_applies_top_k(tiny_lm):
+    torch, model, draft_model, input_ids, reference = tiny_lm
+    # top-k 1 leaves only the most likely token: sampling at any temperature is greedy
+    decoder = SpeculativeDecoder(model, eos_token_id=None, method="draft-model", draft_model=draft_model,
+                                 num_draft_tokens=4, inference_context=torch.no_grad, top_k=1)
+    torch.manual_seed(0)
+    assert decoder.generate(input_ids, max_tokens=len(reference), temperature=1.5) == reference
+
+    logits = torch.tensor([2.0, 1.0, 0.5, -1.0])
+    probs = SpeculativeDecoder(model, eos_token_id=None, top_k=2)._probs(logits, 1.0)
+    assert torch.allclose(probs, torch.tensor([0.7311, 0.2689, 0.0, 0.0]), atol=1e-4)
+    probs = SpeculativeDecoder(model, eos_token_id=None, top_p=0.6)._probs(logits, 1.0)
+    assert probs[0] == 1.0